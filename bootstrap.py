@@ -1,29 +1,229 @@
-import os, pathlib, subprocess
+"""
+Download the weights onto the volume, once per volume.
+
+Each target directory is installed atomically: its files are fetched
+concurrently (across targets too) into weights/.partial/<dest>, resumed with
+range requests after an interruption, checked against the size and hash the
+Hub lists for them (sha256 for LFS files, the git blob id otherwise), and the
+directory is renamed into place with a marker recording what was installed.
+A directory without the marker, from an older bootstrap or a crash, is
+re-verified instead of trusted.
+
+Then the files the first job reads are pre-read into the page cache.
+
+Point HF_ENDPOINT at tools/fake_hub.py to run it against local files.
+"""
+import os, sys, json, time, shutil, hashlib, pathlib, subprocess, threading
+import http.client, urllib.error, urllib.parse, urllib.request
+from concurrent.futures import ThreadPoolExecutor
 
 VOL = pathlib.Path(os.getenv("RUNPOD_VOLUME", "/runpod-volume"))
 WEIGHTS = VOL / "weights"
-WEIGHTS.mkdir(parents=True, exist_ok=True)
-
-env = os.environ.copy()
-env["HF_HUB_ENABLE_HF_TRANSFER"] = "1"
-env.setdefault("HF_HOME", str(VOL / "hf"))
-env.setdefault("HF_HUB_CACHE", str(VOL / "hf_cache"))
-
-def sh(*args):
-    print(">>", " ".join(args), flush=True)
-    subprocess.check_call(args, env=env)
-
-def dl(model, dest, *extra):
-    dst = WEIGHTS / dest
-    if dst.exists():
-        print(f"✓ {model} cached at {dst}", flush=True)
-        return
-    sh("huggingface-cli","download",model,"--local-dir",str(dst), *extra)
-
-dl("Wan-AI/Wan2.1-I2V-14B-480P", "Wan2.1-I2V-14B-480P")
-dl("TencentGameMate/chinese-wav2vec2-base", "chinese-wav2vec2-base")
-dl("TencentGameMate/chinese-wav2vec2-base", "chinese-wav2vec2-base",
-   "model.safetensors","--revision","refs/pr/1")
-dl("MeiGen-AI/InfiniteTalk", "InfiniteTalk")
-
-print("Bootstrap complete.", flush=True)
+PARTIAL = WEIGHTS / ".partial"
+ENDPOINT = os.getenv("HF_ENDPOINT", "https://huggingface.co").rstrip("/")
+TOKEN = os.getenv("HF_TOKEN")
+WORKERS = int(os.getenv("BOOTSTRAP_WORKERS", "8"))
+PREWARM = os.getenv("BOOTSTRAP_PREWARM", "true").lower() in ("1", "true", "yes")
+MARKER = ".installed.json"
+CHUNK = 8 << 20
+RETRIES = 5
+
+# dest: [(repo, revision, files or None for all)]; later sources win on equal names
+TARGETS = {
+    "Wan2.1-I2V-14B-480P": [("Wan-AI/Wan2.1-I2V-14B-480P", "main", None)],
+    "chinese-wav2vec2-base": [
+        ("TencentGameMate/chinese-wav2vec2-base", "main", None),
+        ("TencentGameMate/chinese-wav2vec2-base", "refs/pr/1", ["model.safetensors"]),
+    ],
+    "InfiniteTalk": [("MeiGen-AI/InfiniteTalk", "main", None)],
+}
+
+_print_lock = threading.Lock()
+
+def log(msg):
+    with _print_lock:
+        print(msg, flush=True)
+
+def _open(url, headers=None):
+    req = urllib.request.Request(url, headers=headers or {})
+    if TOKEN:
+        # not forwarded to the CDN the Hub redirects to
+        req.add_unredirected_header("Authorization", f"Bearer {TOKEN}")
+    return urllib.request.urlopen(req, timeout=60)
+
+def repo_files(repo, revision):
+    """(commit, {name: expected}) of `repo` at `revision`, expected = {size, sha256 | sha1}."""
+    url = f"{ENDPOINT}/api/models/{repo}/revision/{urllib.parse.quote(revision, safe='')}?blobs=true"
+    with _open(url) as r:
+        info = json.load(r)
+    files = {}
+    for s in info["siblings"]:
+        lfs = s.get("lfs")
+        files[s["rfilename"]] = ({"size": lfs["size"], "sha256": lfs["sha256"]} if lfs
+                                 else {"size": s["size"], "sha1": s["blobId"]})
+    return info["sha"], files
+
+def verify(path, expected):
+    if os.path.getsize(path) != expected["size"]:
+        return False
+    if "sha256" in expected:
+        h, want = hashlib.sha256(), expected["sha256"]
+    else:
+        h, want = hashlib.sha1(b"blob %d\0" % expected["size"]), expected["sha1"]
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest() == want
+
+def fetch(repo, commit, name, expected, target):
+    """Download `name` to `target` through `target`.incomplete, resuming it, and verify it."""
+    if target.exists() and target.stat().st_size == expected["size"]:
+        return 0  # verified before it was renamed
+    part = target.with_name(target.name + ".incomplete")
+    part.parent.mkdir(parents=True, exist_ok=True)
+    url = f"{ENDPOINT}/{repo}/resolve/{commit}/{urllib.parse.quote(name)}"
+    fetched = 0
+    for attempt in range(1, RETRIES + 1):
+        done = part.stat().st_size if part.exists() else 0
+        if done > expected["size"]:
+            part.unlink()
+            done = 0
+        try:
+            if done < expected["size"]:
+                with _open(url, {"Range": f"bytes={done}-"} if done else None) as r:
+                    if done and r.status != 206:
+                        done = 0  # no range support, start over
+                    with open(part, "ab" if done else "wb") as f:
+                        shutil.copyfileobj(r, f, CHUNK)
+                        fetched += f.tell() - done
+        except (OSError, http.client.HTTPException) as e:
+            log(f"! {name}: {e}, retrying ({attempt}/{RETRIES})")
+            time.sleep(min(2 ** attempt, 30))
+            continue
+        done = part.stat().st_size
+        if done < expected["size"]:
+            # a read of a fixed size returns short instead of raising when the server hangs up
+            log(f"! {name}: connection closed at {done}/{expected['size']} bytes, resuming ({attempt}/{RETRIES})")
+            continue
+        if verify(part, expected):
+            os.replace(part, target)
+            return fetched
+        log(f"! {name} does not match the Hub's size / hash, downloading it again ({attempt}/{RETRIES})")
+        part.unlink()
+    raise RuntimeError(f"could not download {repo}/{name} ({commit})")
+
+def _installed(final):
+    """True if `final` was installed by this bootstrap and still has all its files."""
+    try:
+        files = json.loads((final / MARKER).read_text())["files"]
+    except (OSError, ValueError, KeyError):
+        return False
+    return all((final / n).is_file() and (final / n).stat().st_size == e["size"] for n, e in files.items())
+
+def _adopt(final, tmp, files):
+    """Move the files of an unverified `final` into `tmp`; the listed ones as partial downloads."""
+    log(f"! {final} is not a verified install, re-verifying its files")
+    for path in sorted(p for p in final.rglob("*") if p.is_file()):
+        name = path.relative_to(final).as_posix()
+        if name == MARKER:
+            continue
+        dst = tmp / (name + ".incomplete" if name in files else name)
+        if not dst.exists() and not (tmp / name).exists():
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(path, dst)
+    shutil.rmtree(final)
+
+def plan(dest, sources, pool):
+    """Start the downloads of `dest`; returns a callable that waits for them and installs it."""
+    final, tmp = WEIGHTS / dest, PARTIAL / dest
+    if _installed(final):
+        log(f"✓ {dest} installed")
+        return lambda: None
+    files, pinned = {}, []
+    for repo, revision, only in sources:
+        commit, listed = repo_files(repo, revision)
+        pinned.append({"repo": repo, "revision": revision, "commit": commit})
+        for name in only or listed:
+            files[name] = (repo, commit, listed[name])
+    if final.exists():
+        _adopt(final, tmp, files)
+    tmp.mkdir(parents=True, exist_ok=True)
+    futures = {name: pool.submit(fetch, repo, commit, name, expected, tmp / name)
+               for name, (repo, commit, expected) in files.items()}
+
+    def install():
+        fetched = sum(f.result() for f in futures.values())
+        (tmp / MARKER).write_text(json.dumps(
+            {"sources": pinned, "files": {n: e for n, (_, _, e) in files.items()}}, indent=2))
+        os.replace(tmp, final)
+        log(f"✓ {dest} installed ({len(files)} files, {fetched / 2**30:.2f} GiB downloaded)")
+    return install
+
+def download(targets=TARGETS):
+    start = time.perf_counter()
+    WEIGHTS.mkdir(parents=True, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="download") as pool:
+        installs = [plan(dest, sources, pool) for dest, sources in targets.items()]
+        for install in installs:
+            install()
+    log(f"✓ weights ready in {time.perf_counter() - start:.0f}s")
+
+def first_job_files():
+    """Weights the worker reads before and during its first job, in that order."""
+    ckpt, fused = WEIGHTS / "Wan2.1-I2V-14B-480P", WEIGHTS / "fused"
+    if (fused / "manifest.json").exists():
+        dit = [fused / "dit.safetensors"]
+    else:
+        dit = sorted(ckpt.glob("diffusion_pytorch_model-*.safetensors"))
+        dit.append(WEIGHTS / "InfiniteTalk" / "single" / "infinitetalk.safetensors")
+    encoders = [ckpt / "Wan2.1_VAE.safetensors", WEIGHTS / "chinese-wav2vec2-base" / "model.safetensors",
+                ckpt / "models_t5_umt5-xxl-enc-bf16.safetensors",
+                ckpt / "models_clip_open-clip-xlm-roberta-large-vit-huge-14.safetensors"]
+    return [p for p in dit + encoders if p.is_file()]
+
+def _available_memory():
+    with open("/proc/meminfo") as f:
+        meminfo = {line.split(":")[0]: int(line.split()[1]) * 1024 for line in f}
+    available = meminfo["MemAvailable"]
+    try:  # the container's own limit, if any
+        limit = pathlib.Path("/sys/fs/cgroup/memory.max").read_text().strip()
+        used = int(pathlib.Path("/sys/fs/cgroup/memory.current").read_text())
+        if limit != "max":
+            available = min(available, int(limit) - used)
+    except OSError:
+        pass
+    return available
+
+def prewarm(paths, budget):
+    """Read `paths` into the page cache in parallel, skipping what does not fit in `budget` bytes."""
+    start, selected, total = time.perf_counter(), [], 0
+    for path in paths:
+        size = path.stat().st_size
+        if total + size <= budget:
+            selected.append(path)
+            total += size
+
+    def read(path):
+        buf = bytearray(CHUNK)
+        with open(path, "rb", buffering=0) as f:
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+            while f.readinto(buf):
+                pass
+
+    with ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="prewarm") as pool:
+        list(pool.map(read, selected))
+    log(f"✓ pre-read {len(selected)}/{len(paths)} files ({total / 2**30:.1f} GiB) "
+        f"in {time.perf_counter() - start:.0f}s")
+
+def main():
+    download()
+    # T5 / CLIP / VAE ship as pickles; convert once so workers can mmap them
+    subprocess.check_call([sys.executable, str(pathlib.Path(__file__).resolve().parent / "tools" / "convert_to_safetensors.py"),
+                           str(WEIGHTS / "Wan2.1-I2V-14B-480P")])
+    if PREWARM:
+        # leave room for what the worker allocates itself
+        prewarm(first_job_files(), _available_memory() // 2)
+    print("Bootstrap complete.", flush=True)
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,7 @@ import sys
 import json
 import warnings
 from datetime import datetime
+from functools import partial
 
 warnings.filterwarnings('ignore')
 
@@ -20,14 +21,15 @@ import wan
 from wan.configs import SIZE_CONFIGS, SUPPORTED_SIZES, WAN_CONFIGS
 from wan.utils.utils import str2bool, is_video, split_wav_librosa
 from wan.utils.multitalk_utils import save_video_ffmpeg
-from kokoro import KPipeline
-from transformers import Wav2Vec2FeatureExtractor
-from src.audio_analysis.wav2vec2 import Wav2Vec2Model
-from wan.utils.segvideo import shot_detect
+from wan.utils.clip_checkpoint import ClipCheckpointer, job_fingerprint
+from wan.utils.segment_writer import HLSSegmentWriter
+from wan.utils.stage_timer import stage_timer
+from wan.utils.audio_cache import AudioEmbeddingCache
+from src.audio_analysis.streaming import encode_chunked, encode_speech
+from src.serving.result_cache import hash_audio, hash_file
+from src.workspace import Workspace
 
 
-import librosa
-import pyloudnorm as pyln
 import numpy as np
 from einops import rearrange
 import soundfile as sf
@@ -59,7 +61,7 @@ def _validate_args(args):
         task], f"Unsupport size {args.size} for task {args.task}, supported sizes are: {', '.join(SUPPORTED_SIZES[args.task])}"
 
 
-def _parse_args():
+def _parse_args(argv=None):
     parser = argparse.ArgumentParser(
         description="Generate a image or video from a text prompt or image using Wan"
     )
@@ -108,6 +110,16 @@ def _parse_args():
         type=str,
         default=None,
         help="The path to the wav2vec checkpoint directory.")
+    parser.add_argument(
+        "--fused_dir",
+        type=str,
+        default=None,
+        help="Directory of a DiT baked by tools/bake_checkpoint.py; used when it matches the other weight arguments.")
+    parser.add_argument(
+        "--shared_weights",
+        type=str,
+        default=None,
+        help="Map the host copies of the T5 and DiT weights from this tmpfs directory, shared by all workers on the node.")
     parser.add_argument(
         "--dit_path",
         type=str,
@@ -166,8 +178,8 @@ def _parse_args():
     parser.add_argument(
         "--audio_save_dir",
         type=str,
-        default='save_audio',
-        help="The path to save the audio embedding.")
+        default=None,
+        help="Keep the intermediate audio files in this directory. By default they live in a temporary workspace on tmpfs.")
     parser.add_argument(
         "--base_seed",
         type=int,
@@ -265,22 +277,75 @@ def _parse_args():
         "--quant",
         type=str,
         default=None,
-        help="Quantization type, must be 'int8' or 'fp8'."
+        help="Quantization type, must be 'int8' or 'fp8'. Without --quant_dir the T5 and DiT are quantized at load time and cached under --fused_dir."
+    )
+    parser.add_argument(
+        "--checkpoint_dir",
+        type=str,
+        default=None,
+        help="Save a checkpoint after every clip into this directory and resume from it if one exists."
+    )
+    parser.add_argument(
+        "--prompt_cache_dir",
+        type=str,
+        default=None,
+        help="Keep the T5 embeddings of every prompt in this directory, so repeated prompts skip the text encoder."
+    )
+    parser.add_argument(
+        "--reference_cache_dir",
+        type=str,
+        default=None,
+        help="Keep the CLIP and VAE encodings of every condition image in this directory, so repeat avatars skip them."
+    )
+    parser.add_argument(
+        "--reference_cache_max_bytes",
+        type=int,
+        default=None,
+        help="Evict the least recently used entries of --reference_cache_dir beyond this many bytes; unbounded by default."
+    )
+    parser.add_argument(
+        "--audio_cache_dir",
+        type=str,
+        default=None,
+        help="Keep the wav2vec2 embedding of every audio track in this directory, mmapped when it is read again."
+    )
+    parser.add_argument(
+        "--audio_cache_max_bytes",
+        type=int,
+        default=None,
+        help="Evict the least recently used entries of --audio_cache_dir beyond this many bytes; unbounded by default."
+    )
+    parser.add_argument(
+        "--compile_dir",
+        type=str,
+        default=None,
+        help="Compile the DiT block by block with torch.compile, keeping the compiled artifacts in this directory."
+    )
+    parser.add_argument(
+        "--hls_dir",
+        type=str,
+        default=None,
+        help="Also write every finished clip as an HLS segment into this directory while generating."
     )
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     _validate_args(args)
 
     return args
 
 def custom_init(device, wav2vec):    
+    from transformers import Wav2Vec2FeatureExtractor
+    from src.audio_analysis.wav2vec2 import Wav2Vec2Model
+
     audio_encoder = Wav2Vec2Model.from_pretrained(wav2vec, local_files_only=True).to(device)
     audio_encoder.feature_extractor._freeze_parameters()
     wav2vec_feature_extractor = Wav2Vec2FeatureExtractor.from_pretrained(wav2vec, local_files_only=True)
     return wav2vec_feature_extractor, audio_encoder
 
 def loudness_norm(audio_array, sr=16000, lufs=-23):
+    import pyloudnorm as pyln
+
     meter = pyln.Meter(sr)
     loudness = meter.integrated_loudness(audio_array)
     if abs(loudness) > 100:
@@ -320,30 +385,77 @@ def _init_logging(rank):
     else:
         logging.basicConfig(level=logging.ERROR)
 
-def get_embedding(speech_array, wav2vec_feature_extractor, audio_encoder, sr=16000, device='cpu'):
+def _encode_audio_window(audio_encoder, device, input_values, seq_len):
+    audio_feature = torch.from_numpy(input_values).float().to(device=device).unsqueeze(0)
+    with torch.no_grad():
+        embeddings = audio_encoder(audio_feature, seq_len=seq_len, output_hidden_states=True)
+    audio_emb = torch.stack(embeddings.hidden_states[1:], dim=1).squeeze(0)
+    return rearrange(audio_emb, "b s d -> s b d").cpu().detach()
+
+def get_embedding(speech_array, wav2vec_feature_extractor, audio_encoder, sr=16000, device='cpu', executor=None):
+    """
+    [T, layers, 768] wav2vec2 features at 25 fps. Tracks longer than
+    `WINDOW_SECONDS` are encoded in overlapping windows (see `encode_chunked`),
+    in parallel on `executor` if given.
+    """
     audio_duration = len(speech_array) / sr
     video_length = audio_duration * 25 # Assume the video fps is 25
 
-    # wav2vec_feature_extractor
+    # wav2vec_feature_extractor, normalised over the whole track
     audio_feature = np.squeeze(
         wav2vec_feature_extractor(speech_array, sampling_rate=sr).input_values
     )
-    audio_feature = torch.from_numpy(audio_feature).float().to(device=device)
-    audio_feature = audio_feature.unsqueeze(0)
 
     # audio encoder
-    with torch.no_grad():
-        embeddings = audio_encoder(audio_feature, seq_len=int(video_length), output_hidden_states=True)
-
-    if len(embeddings) == 0:
-        print("Fail to extract audio embedding")
-        return None
+    return encode_chunked(audio_feature, int(video_length), partial(_encode_audio_window, audio_encoder, device),
+                          executor=executor)
 
-    audio_emb = torch.stack(embeddings.hidden_states[1:], dim=1).squeeze(0)
-    audio_emb = rearrange(audio_emb, "b s d -> s b d")
-
-    audio_emb = audio_emb.cpu().detach()
-    return audio_emb
+def _encode_audio_batch(audio_encoder, device, input_values_list, seq_len):
+    audio_feature = torch.from_numpy(np.stack(input_values_list)).float().to(device=device)
+    with torch.no_grad():
+        embeddings = audio_encoder(audio_feature, seq_len=seq_len, output_hidden_states=True)
+    audio_emb = torch.stack(embeddings.hidden_states[1:], dim=1)
+    return list(rearrange(audio_emb, "n b s d -> n s b d").cpu().detach())
+
+_silence_embeddings = {}
+
+def _silence_embedding(audio_encoder, device, value, seconds=2):
+    """Features of `seconds` of a constant input `value`, i.e. normalised silence, from their middle frame."""
+    key = (id(audio_encoder), round(float(value), 6))
+    if key not in _silence_embeddings:
+        seq_len = seconds * 25
+        silence = np.full(seconds * 16000, value, dtype=np.float32)
+        _silence_embeddings[key] = _encode_audio_batch(audio_encoder, device, [silence], seq_len)[0][seq_len // 2]
+    return _silence_embeddings[key]
+
+def get_embedding_multi(speech_arrays, wav2vec_feature_extractor, audio_encoder, sr=16000, device='cpu',
+                        min_silence_seconds=2.0, margin_seconds=1.0):
+    """
+    `get_embedding` of several speakers' tracks at once, e.g. the zero-padded
+    tracks of `audio_prepare_multi`. Runs of exact zeros lasting at least
+    `min_silence_seconds` are not encoded but filled with the features of
+    silence, keeping `margin_seconds` of encoded frames around the speech;
+    the windows of every speaker's speech go through wav2vec2 in batches
+    (see `encode_speech`).
+    """
+    tracks = [(speech_array, np.squeeze(wav2vec_feature_extractor(speech_array, sampling_rate=sr).input_values),
+               int(len(speech_array) / sr * 25)) for speech_array in speech_arrays]
+    return encode_speech(tracks, partial(_encode_audio_batch, audio_encoder, device),
+                         partial(_silence_embedding, audio_encoder, device),
+                         min_silence_frames=int(min_silence_seconds * 25), margin=int(margin_seconds * 25))
+
+def embed_audio_multi(speech_arrays, wav2vec_feature_extractor, audio_encoder, cache=None):
+    """`get_embedding_multi`, or with an `AudioEmbeddingCache` the paths of its cached results."""
+    embed = lambda speeches: get_embedding_multi(speeches, wav2vec_feature_extractor, audio_encoder)
+    if cache is None:
+        return embed(speech_arrays)
+    # each speaker's spans are widened to the other's, so an embedding is only valid for this pairing
+    return cache.embed_many(speech_arrays, embed, variant='multi-matched', joint=True)
+
+def embed_audio(speech_array, wav2vec_feature_extractor, audio_encoder, cache=None):
+    """`get_embedding`, or with an `AudioEmbeddingCache` the path of its cached result."""
+    embed = lambda speech: get_embedding(speech, wav2vec_feature_extractor, audio_encoder)
+    return embed(speech_array) if cache is None else cache.embed(speech_array, embed)
 
 def extract_audio_from_video(filename, sample_rate):
     raw_audio_path = filename.split('/')[-1].split('.')[0]+'.wav'
@@ -362,6 +474,7 @@ def extract_audio_from_video(filename, sample_rate):
         str(raw_audio_path),
     ]
     subprocess.run(ffmpeg_command, check=True)
+    import librosa
     human_speech_array, sr = librosa.load(raw_audio_path, sr=sample_rate)
     human_speech_array = loudness_norm(human_speech_array, sr)
     os.remove(raw_audio_path)
@@ -369,11 +482,15 @@ def extract_audio_from_video(filename, sample_rate):
     return human_speech_array
 
 def audio_prepare_single(audio_path, sample_rate=16000):
+    # already decoded mono samples at `sample_rate`, e.g. from the handler's streaming ingest
+    if isinstance(audio_path, np.ndarray):
+        return loudness_norm(audio_path, sample_rate)
     ext = os.path.splitext(audio_path)[1].lower()
     if ext in ['.mp4', '.mov', '.avi', '.mkv']:
         human_speech_array = extract_audio_from_video(audio_path, sample_rate)
         return human_speech_array
     else:
+        import librosa
         human_speech_array, sr = librosa.load(audio_path, sr=sample_rate)
         human_speech_array = loudness_norm(human_speech_array, sr)
         return human_speech_array
@@ -381,6 +498,8 @@ def audio_prepare_single(audio_path, sample_rate=16000):
 def process_tts_single(text, save_dir, voice1):    
     s1_sentences = []
 
+    import librosa
+    from kokoro import KPipeline
     pipeline = KPipeline(lang_code='a', repo_id='weights/Kokoro-82M')
 
     voice_tensor = torch.load(voice1, weights_only=True)
@@ -408,6 +527,8 @@ def process_tts_multi(text, save_dir, voice1, voice2):
     s1_sentences = []
     s2_sentences = []
 
+    import librosa
+    from kokoro import KPipeline
     pipeline = KPipeline(lang_code='a', repo_id='weights/Kokoro-82M')
     for idx, (speaker, content) in enumerate(matches):
         if speaker == '1':
@@ -519,7 +640,23 @@ def generate(args):
         args.base_seed = base_seed[0]
 
     assert args.task == "infinitetalk-14B", 'You should choose infinitetalk in args.task.'
-    
+
+    wan_i2v, wav2vec_feature_extractor, audio_encoder = load_pipeline(args, rank=rank, device=device)
+
+    with open(args.input_json, 'r', encoding='utf-8') as f:
+        input_data = json.load(f)
+
+    generate_video(args, input_data, wan_i2v, wav2vec_feature_extractor, audio_encoder, rank=rank)
+
+
+def load_pipeline(args, rank=0, device=0):
+    """
+    Build the InfiniteTalk pipeline and the wav2vec2 audio encoder.
+
+    The returned objects hold no per-job state, so a long-running worker can
+    build them once and pass them to `generate_video` for every request.
+    """
+    cfg = WAN_CONFIGS[args.task]
 
     logging.info("Creating infinitetalk pipeline.")
     wan_i2v = wan.InfiniteTalkPipeline(
@@ -536,37 +673,193 @@ def generate(args):
         lora_scales=args.lora_scale,
         quant=args.quant,
         dit_path=args.dit_path,
-        infinitetalk_dir=args.infinitetalk_dir
+        infinitetalk_dir=args.infinitetalk_dir,
+        fused_dir=args.fused_dir,
+        shared_weights=args.shared_weights,
+        prompt_cache_dir=args.prompt_cache_dir,
+        reference_cache_dir=args.reference_cache_dir,
+        reference_cache_max_bytes=args.reference_cache_max_bytes,
     )
     if args.num_persistent_param_in_dit is not None:
         wan_i2v.vram_management = True
         wan_i2v.enable_vram_management(
             num_persistent_param_in_dit=args.num_persistent_param_in_dit
         )
-    
-    generated_list = []
-    with open(args.input_json, 'r', encoding='utf-8') as f:
-        input_data = json.load(f)
-        
+    if args.compile_dir is not None:
+        wan_i2v.compile_dit(args.compile_dir)
+
     wav2vec_feature_extractor, audio_encoder= custom_init('cpu', args.wav2vec_dir)
-    args.audio_save_dir = os.path.join(args.audio_save_dir, input_data['cond_video'].split('/')[-1].split('.')[0])
-    os.makedirs(args.audio_save_dir,exist_ok=True)
+    return wan_i2v, wav2vec_feature_extractor, audio_encoder
+
+
+def _content_hash(value):
+    # a reused --checkpoint_dir must not resume another job whose inputs only share a path or a shape
+    if isinstance(value, torch.Tensor):
+        value = value.detach().float().cpu().numpy()
+    if isinstance(value, np.ndarray):
+        return hash_audio(np.ascontiguousarray(value))
+    if isinstance(value, str) and os.path.isfile(value):
+        return hash_file(value)
+    return value
+
+
+def _clip_fingerprint(args, input_clip):
+    cond_audio = {k: _content_hash(v) for k, v in input_clip['cond_audio'].items()}
+    return job_fingerprint(
+        prompt=input_clip['prompt'], cond_video=_content_hash(input_clip['cond_video']), cond_audio=cond_audio,
+        size=args.size, frame_num=args.frame_num, max_frame_num=args.max_frame_num, mode=args.mode,
+        motion_frame=args.motion_frame, sample_steps=args.sample_steps, sample_shift=args.sample_shift,
+        text_guide_scale=args.sample_text_guide_scale, audio_guide_scale=args.sample_audio_guide_scale,
+        seed=args.base_seed, use_teacache=args.use_teacache, teacache_thresh=args.teacache_thresh,
+        use_apg=args.use_apg, color_correction_strength=args.color_correction_strength)
+
+
+def generate_clip(args, wan_i2v, input_clip, resume_state=None, clip_callback=None, checkpoint_dir=None,
+                  segment_writer=None, workspace=None):
+    """
+    Run the DiT sampling loop for one prepared clip input.
+
+    `input_clip['cond_audio']` may hold embedding paths or in-memory tensors.
+    See `InfiniteTalkPipeline.generate_infinitetalk` for `resume_state` and
+    `clip_callback`; with a callback the result may be a `GenerationState`.
+    With `checkpoint_dir`, progress is saved after every clip and a matching
+    checkpoint found there is resumed; it is removed once the clip finishes.
+    With a `segment_writer` (`HLSSegmentWriter`, rank 0 only), every clip is
+    handed to it as soon as it is decoded.
+    """
+    checkpointer = None
+    if checkpoint_dir is not None:
+        checkpointer = ClipCheckpointer(checkpoint_dir, _clip_fingerprint(args, input_clip))
+        if resume_state is None:
+            resume_state = checkpointer.load()
+
+        inner_callback = clip_callback
+
+        def clip_callback(clip_index, get_state):
+            state = get_state()
+            if not dist.is_initialized() or dist.get_rank() == 0:
+                checkpointer.save(state)
+            if inner_callback is None:
+                return False
+            return inner_callback(clip_index, lambda: state)
+
+    if segment_writer is not None:
+        segment_callback = clip_callback
+
+        def clip_callback(clip_index, get_state):
+            state = get_state()
+            # after a resume the first callback also covers the restored clips
+            offset = segment_writer.item_start
+            for frames in state.gen_video_list:
+                if offset + frames.shape[2] > segment_writer.frames_written:
+                    segment_writer.add_frames(frames[0, :, segment_writer.frames_written - offset:])
+                offset += frames.shape[2]
+            if segment_callback is None:
+                return False
+            return segment_callback(clip_index, lambda: state)
+
+    video = wan_i2v.generate_infinitetalk(
+        input_clip,
+        size_buckget=args.size,
+        motion_frame=args.motion_frame,
+        frame_num=args.frame_num,
+        shift=args.sample_shift,
+        sampling_steps=args.sample_steps,
+        text_guide_scale=args.sample_text_guide_scale,
+        audio_guide_scale=args.sample_audio_guide_scale,
+        seed=args.base_seed,
+        offload_model=args.offload_model,
+        max_frames_num=args.frame_num if args.mode == 'clip' else args.max_frame_num,
+        color_correction_strength = args.color_correction_strength,
+        extra_args=args,
+        resume_state=resume_state,
+        clip_callback=clip_callback,
+        workspace=workspace,
+        )
+    if isinstance(video, torch.Tensor):
+        if checkpointer is not None:
+            checkpointer.clear()
+        if segment_writer is not None:
+            # the last clip is only trimmed to the audio length at the very end
+            segment_writer.add_frames(video[:, segment_writer.frames_written - segment_writer.item_start:])
+    return video
+
+
+def generate_clip_batch(args, wan_i2v, input_clips, done_callback=None, workspace=None):
+    """
+    Run several prepared single-speaker clip inputs of the same bucket through
+    one batched sampling loop. See `InfiniteTalkPipeline.generate_infinitetalk_batch`.
+    """
+    return wan_i2v.generate_infinitetalk_batch(
+        input_clips,
+        size_buckget=args.size,
+        motion_frame=args.motion_frame,
+        frame_num=args.frame_num,
+        shift=args.sample_shift,
+        sampling_steps=args.sample_steps,
+        text_guide_scale=args.sample_text_guide_scale,
+        audio_guide_scale=args.sample_audio_guide_scale,
+        seeds=[args.base_seed] * len(input_clips),
+        offload_model=args.offload_model,
+        max_frames_num=args.frame_num if args.mode == 'clip' else args.max_frame_num,
+        color_correction_strength = args.color_correction_strength,
+        extra_args=args,
+        done_callback=done_callback,
+        workspace=workspace,
+        )
+
+
+def generate_video(args, input_data, wan_i2v, wav2vec_feature_extractor, audio_encoder, rank=0, on_segment=None,
+                   workspace=None):
+    """
+    Run one generation job on an already loaded pipeline.
+
+    Args:
+        args: Parsed generation arguments (see `_parse_args`).
+        input_data (`dict`): Job description in the `--input_json` format.
+        on_segment (`callable`, *optional*):
+            With `args.hls_dir`, called as `on_segment(index, path, start, duration)`
+            for every HLS segment once it is written.
+        workspace (`Workspace`, *optional*):
+            Where intermediate files go. Without one, a workspace is created for
+            the call (in `args.audio_save_dir` if set, which is then kept).
+
+    Returns:
+        The path of the saved mp4 on rank 0, otherwise None.
+    """
+    run = partial(_generate_video, args, input_data, wan_i2v, wav2vec_feature_extractor, audio_encoder, rank,
+                  on_segment)
+    if workspace is not None:
+        return run(workspace)
+    if args.audio_save_dir is not None:
+        return run(Workspace(input_data['cond_video'].split('/')[-1].split('.')[0], root=args.audio_save_dir, keep=True))
+    # removed even when the job fails, not only when the Workspace is collected
+    with Workspace() as workspace:
+        return run(workspace)
+
+
+def _generate_video(args, input_data, wan_i2v, wav2vec_feature_extractor, audio_encoder, rank, on_segment, workspace):
+    generated_list = []
+    audio_save_dir = workspace.path
+    audio_cache = AudioEmbeddingCache(args.audio_cache_dir, args.wav2vec_dir, args.audio_cache_max_bytes) \
+        if args.audio_cache_dir else None
     
     conds_list = []
 
     if args.scene_seg and is_video(input_data['cond_video']):
-        time_list, cond_list = shot_detect(input_data['cond_video'], args.audio_save_dir)
+        from wan.utils.segvideo import shot_detect
+        time_list, cond_list = shot_detect(input_data['cond_video'], workspace.dir('scenes'))
         if len(time_list)==0:
             conds_list.append([input_data['cond_video']])
             conds_list.append([input_data['cond_audio']['person1']])
             if len(input_data['cond_audio'])==2:
                 conds_list.append([input_data['cond_audio']['person2']])
         else:
-            audio1_list = split_wav_librosa(input_data['cond_audio']['person1'], time_list, args.audio_save_dir)
+            audio1_list = split_wav_librosa(input_data['cond_audio']['person1'], time_list, audio_save_dir)
             conds_list.append(cond_list)
             conds_list.append(audio1_list)
             if len(input_data['cond_audio'])==2:
-                audio2_list = split_wav_librosa(input_data['cond_audio']['person2'], time_list, args.audio_save_dir)
+                audio2_list = split_wav_librosa(input_data['cond_audio']['person2'], time_list, audio_save_dir)
                 conds_list.append(audio2_list)
     else:
         conds_list.append([input_data['cond_video']])
@@ -576,15 +869,19 @@ def generate(args):
 
     if len(input_data['cond_audio'])==2:
         new_human_speech1, new_human_speech2, sum_human_speechs = audio_prepare_multi(input_data['cond_audio']['person1'], input_data['cond_audio']['person2'], input_data['audio_type'])
-        sum_audio = os.path.join(args.audio_save_dir, 'sum_all.wav')
+        sum_audio = os.path.join(audio_save_dir, 'sum_all.wav')
         sf.write(sum_audio, sum_human_speechs, 16000)
         input_data['video_audio'] = sum_audio
     else:
         human_speech = audio_prepare_single(input_data['cond_audio']['person1'])
-        sum_audio = os.path.join(args.audio_save_dir, 'sum_all.wav')
+        sum_audio = os.path.join(audio_save_dir, 'sum_all.wav')
         sf.write(sum_audio, human_speech, 16000)
         input_data['video_audio'] = sum_audio
     logging.info("Generating video ...")
+
+    segment_writer = None
+    if args.hls_dir is not None and rank == 0:
+        segment_writer = HLSSegmentWriter(args.hls_dir, input_data['video_audio'], on_segment=on_segment)
         
     for idx, items in enumerate(zip(*conds_list)):
         print(items)
@@ -599,63 +896,59 @@ def generate(args):
         cond_audio = {}
         if args.audio_mode=='localfile':
             if len(input_data['cond_audio'])==2:
-                new_human_speech1, new_human_speech2, sum_human_speechs = audio_prepare_multi(items[1], items[2], input_data['audio_type'])
-                audio_embedding_1 = get_embedding(new_human_speech1, wav2vec_feature_extractor, audio_encoder)
-                audio_embedding_2 = get_embedding(new_human_speech2, wav2vec_feature_extractor, audio_encoder)
-                emb1_path = os.path.join(args.audio_save_dir, '1.pt')
-                emb2_path = os.path.join(args.audio_save_dir, '2.pt')
-                sum_audio = os.path.join(args.audio_save_dir, 'sum.wav')
+                with stage_timer('audio_prepare'):
+                    new_human_speech1, new_human_speech2, sum_human_speechs = audio_prepare_multi(items[1], items[2], input_data['audio_type'])
+                with stage_timer('embedding'):
+                    # both speakers batched, the other speaker's zero padding in 'add' mode is not encoded
+                    audio_embedding_1, audio_embedding_2 = embed_audio_multi(
+                        [new_human_speech1, new_human_speech2], wav2vec_feature_extractor, audio_encoder, audio_cache)
+                sum_audio = os.path.join(audio_save_dir, 'sum.wav')
                 sf.write(sum_audio, sum_human_speechs, 16000)
-                torch.save(audio_embedding_1, emb1_path)
-                torch.save(audio_embedding_2, emb2_path)
-                cond_audio['person1'] = emb1_path
-                cond_audio['person2'] = emb2_path
+                # handed over in memory or as mmapped cache entries, no round trip through .pt files
+                cond_audio['person1'] = audio_embedding_1
+                cond_audio['person2'] = audio_embedding_2
                 input_clip['video_audio'] = sum_audio
-                v_length = audio_embedding_1.shape[0]
             elif len(input_data['cond_audio'])==1:
-                human_speech = audio_prepare_single(items[1])
-                audio_embedding = get_embedding(human_speech, wav2vec_feature_extractor, audio_encoder)
-                emb_path = os.path.join(args.audio_save_dir, '1.pt')
-                sum_audio = os.path.join(args.audio_save_dir, 'sum.wav')
+                with stage_timer('audio_prepare'):
+                    human_speech = audio_prepare_single(items[1])
+                with stage_timer('embedding'):
+                    audio_embedding = embed_audio(human_speech, wav2vec_feature_extractor, audio_encoder, audio_cache)
+                sum_audio = os.path.join(audio_save_dir, 'sum.wav')
                 sf.write(sum_audio, human_speech, 16000)
-                torch.save(audio_embedding, emb_path)
-                cond_audio['person1'] = emb_path
+                cond_audio['person1'] = audio_embedding
                 input_clip['video_audio'] = sum_audio
-                v_length = audio_embedding.shape[0]
         
         input_clip['cond_audio'] = cond_audio
                     
-        video = wan_i2v.generate_infinitetalk(
-            input_clip,
-            size_buckget=args.size,
-            motion_frame=args.motion_frame,
-            frame_num=args.frame_num,
-            shift=args.sample_shift,
-            sampling_steps=args.sample_steps,
-            text_guide_scale=args.sample_text_guide_scale,
-            audio_guide_scale=args.sample_audio_guide_scale,
-            seed=args.base_seed,
-            offload_model=args.offload_model,
-            max_frames_num=args.frame_num if args.mode == 'clip' else args.max_frame_num,
-            color_correction_strength = args.color_correction_strength,
-            extra_args=args,
-            )
+        checkpoint_dir = None
+        if args.checkpoint_dir is not None:
+            checkpoint_dir = os.path.join(args.checkpoint_dir, f'item_{idx:03d}')
+        if segment_writer is not None:
+            segment_writer.mark_item_start()
+        video = generate_clip(args, wan_i2v, input_clip, checkpoint_dir=checkpoint_dir,
+                              segment_writer=segment_writer, workspace=workspace)
         
         generated_list.append(video)
 
+    save_file = args.save_file
     if rank == 0:
         
-        if args.save_file is None:
+        if save_file is None:
             formatted_time = datetime.now().strftime("%Y%m%d_%H%M%S")
             formatted_prompt = input_clip['prompt'].replace(" ", "_").replace("/",
                                                                         "_")[:50]
-            args.save_file = f"{args.task}_{args.size.replace('*','x') if sys.platform=='win32' else args.size}_{args.ulysses_size}_{args.ring_size}_{formatted_prompt}_{formatted_time}"
+            save_file = f"{args.task}_{args.size.replace('*','x') if sys.platform=='win32' else args.size}_{args.ulysses_size}_{args.ring_size}_{formatted_prompt}_{formatted_time}"
         
         sum_video = torch.cat(generated_list, dim=1)
-        save_video_ffmpeg(sum_video, args.save_file, [input_data['video_audio']], high_quality_save=False)
+        with stage_timer('mux'):
+            save_video_ffmpeg(sum_video, save_file, [input_data['video_audio']], high_quality_save=False,
+                              tmp_dir=workspace.path)
+        if segment_writer is not None:
+            logging.info(f"Finished HLS playlist {segment_writer.finish()}")
    
-    logging.info(f"Saving generated video to {args.save_file}.mp4")  
+    logging.info(f"Saving generated video to {save_file}.mp4")  
     logging.info("Finished.")
+    return f"{save_file}.mp4" if rank == 0 else None
 
 
 if __name__ == "__main__":
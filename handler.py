@@ -1,7 +1,15 @@
-import os, uuid, json, pathlib, subprocess, requests, runpod
+import os, sys, time, uuid, json, queue, asyncio, pathlib, subprocess, runpod
+from concurrent.futures import ThreadPoolExecutor
 
-# Warm models into the mounted volume
-subprocess.run(["python","/app/bootstrap.py"], check=True)
+import soundfile as sf
+from PIL import Image
+
+from src.serving.ingest import ingest
+from src.serving.result_cache import ResultCache, LocalDiskBackend, hash_file, hash_audio, make_cache_key
+from src.serving.stages import Stage, StagedPipeline
+from src.serving.scheduler import CostAwareScheduler, clip_cost, num_clips
+from src.serving import metrics
+from src.workspace import Workspace, job_path
 
 VOLUME_ROOT  = pathlib.Path(os.getenv("RUNPOD_VOLUME","/runpod-volume"))
 WEIGHTS_ROOT = VOLUME_ROOT / "weights"
@@ -9,15 +17,61 @@ WEIGHTS_ROOT = VOLUME_ROOT / "weights"
 CKPT_DIR    = WEIGHTS_ROOT / "Wan2.1-I2V-14B-480P"
 WAV2VEC_DIR = WEIGHTS_ROOT / "chinese-wav2vec2-base"
 INF_TALK    = WEIGHTS_ROOT / "InfiniteTalk" / "single" / "infinitetalk.safetensors"
+# output of tools/bake_checkpoint.py; ignored unless its manifest matches the weights above
+FUSED_DIR   = WEIGHTS_ROOT / "fused"
+# LoRAs a request can select by file name
+LORA_ROOT   = WEIGHTS_ROOT / "loras"
 GEN_SCRIPT  = "/app/InfiniteTalk/generate_infinitetalk.py"
 
-def _download(url, path):
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with requests.get(url, stream=True, timeout=300) as r:
-        r.raise_for_status()
-        with open(path, "wb") as f:
-            for chunk in r.iter_content(1 << 16):
-                if chunk: f.write(chunk)
+# "warm": load the pipeline once at start-up and reuse it for every job.
+# "staged": warm pipeline plus overlapping stages, so job N+1 is preprocessed
+#           and job N-1 encoded/uploaded while the DiT runs job N.
+# "subprocess": spawn generate_infinitetalk.py per job (reloads all weights).
+WORKER_MODE = os.getenv("INFINITETALK_WORKER_MODE", "warm").lower()
+DEFAULT_PROMPT = "A person is talking"
+
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", "2"))
+PREPROCESS_QUEUE   = int(os.getenv("PREPROCESS_QUEUE", "4"))
+DIT_QUEUE          = int(os.getenv("DIT_QUEUE", "2"))
+DELIVER_QUEUE      = int(os.getenv("DELIVER_QUEUE", "2"))
+# staged mode: up to this many queued jobs of the same bucket share each DiT forward
+DIT_MAX_BATCH      = int(os.getenv("DIT_MAX_BATCH", "1"))
+# a resumed job runs at least this many clips before it can be preempted again
+MIN_CLIPS_BEFORE_PREEMPT = int(os.getenv("MIN_CLIPS_BEFORE_PREEMPT", "1"))
+# checkpoint every clip on the volume so a retried job resumes on another worker
+CHECKPOINT_JOBS = os.getenv("CHECKPOINT_JOBS", "false").lower() in ("1", "true", "yes")
+CHECKPOINT_ROOT = VOLUME_ROOT / "checkpoints"
+# warm mode only: stream every finished clip as an HLS segment before the full video is done
+PROGRESSIVE_OUTPUT = os.getenv("PROGRESSIVE_OUTPUT", "false").lower() in ("1", "true", "yes")
+
+# one worker per GPU: map host weights from this tmpfs directory so the node holds them once, e.g.
+# /dev/shm/infinitetalk-weights (size /dev/shm accordingly); unset keeps private copies per worker
+SHARED_WEIGHTS_DIR = os.getenv("SHARED_WEIGHTS_DIR")
+QUANT = os.getenv("INFINITETALK_QUANT")  # int8 / fp8, quantized at load time and cached in FUSED_DIR
+# torch.compile the DiT block by block; artifacts persist on the volume so restarts mostly skip compiling.
+# Warm modes also run one dummy forward per bucket of INFINITETALK_COMPILE_WARMUP (comma separated sizes).
+COMPILE = os.getenv("INFINITETALK_COMPILE", "false").lower() in ("1", "true", "yes")
+COMPILE_DIR = VOLUME_ROOT / "compile_cache"
+COMPILE_WARMUP = [s for s in os.getenv("INFINITETALK_COMPILE_WARMUP", "infinitetalk-480").split(",") if s]
+# T5 embeddings of past prompts; the default negative prompt is encoded at startup in warm modes
+PROMPT_CACHE_DIR = VOLUME_ROOT / "prompt_cache"
+# CLIP / VAE encodings of condition images, per pixel content and bucket
+REFERENCE_CACHE_DIR = VOLUME_ROOT / "reference_cache"
+REFERENCE_CACHE_MAX_BYTES = int(os.getenv("REFERENCE_CACHE_MAX_BYTES", str(10 << 30)))
+# wav2vec2 embeddings per audio track, mmapped by the sampling loop; re-dubbed audio skips the encoder
+AUDIO_CACHE_DIR = VOLUME_ROOT / "audio_cache"
+AUDIO_CACHE_MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_BYTES", str(10 << 30)))
+
+# Prometheus text format on http://<worker>:METRICS_PORT/metrics; 0 disables the exporter
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9400"))
+
+RESULT_CACHE = ResultCache(LocalDiskBackend(
+    os.getenv("RESULT_CACHE_DIR", str(VOLUME_ROOT / "result_cache")),
+    max_bytes=int(os.getenv("RESULT_CACHE_MAX_BYTES", str(20 << 30))),
+))
+
+WARM = None
+STAGED = None
 
 def _run(cmd, cwd=None):
     print(">>", " ".join(map(str, cmd)), flush=True)
@@ -26,66 +80,470 @@ def _run(cmd, cwd=None):
         raise RuntimeError(p.stdout[-4000:])
     return p.stdout
 
-def handler(event):
+def _sampling_params(size):
+    """Every generation setting that changes the output; also part of the result cache key."""
+    return {
+        "size": size,
+        "sample_steps": 40,
+        "mode": "streaming",
+        "motion_frame": 9,
+        "base_seed": 42,
+        "sample_text_guide_scale": 5.0,
+        "sample_audio_guide_scale": 4.0,
+    }
+
+def _gen_argv(size, job, checkpoint_dir=None, hls=False):
+    """Command line for generate_infinitetalk.py, shared by all worker modes."""
+    argv = ["--checkpoint_dir", str(checkpoint_dir)] if checkpoint_dir else []
+    if hls:
+        argv += ["--hls_dir", str(job / "hls")]
+    if SHARED_WEIGHTS_DIR:
+        argv += ["--shared_weights", SHARED_WEIGHTS_DIR]
+    if QUANT:
+        argv += ["--quant", QUANT]
+    if COMPILE:
+        argv += ["--compile_dir", str(COMPILE_DIR)]
+    argv += [
+        "--ckpt_dir", str(CKPT_DIR),
+        "--wav2vec_dir", str(WAV2VEC_DIR),
+        "--infinitetalk_dir", str(INF_TALK),
+        "--fused_dir", str(FUSED_DIR),
+        "--prompt_cache_dir", str(PROMPT_CACHE_DIR),
+        "--reference_cache_dir", str(REFERENCE_CACHE_DIR),
+        "--reference_cache_max_bytes", str(REFERENCE_CACHE_MAX_BYTES),
+        "--audio_cache_dir", str(AUDIO_CACHE_DIR),
+        "--audio_cache_max_bytes", str(AUDIO_CACHE_MAX_BYTES),
+        "--input_json", str(job / "request.json"),
+        "--offload_model", os.getenv("INFINITETALK_OFFLOAD_MODEL", "true"),
+        "--save_file", str(job / "infinitetalk_res"),
+    ]
+    for name, value in _sampling_params(size).items():
+        argv += [f"--{name}", str(value)]
+    return argv
+
+def _load_warm_pipeline():
+    sys.path.insert(0, os.path.dirname(GEN_SCRIPT))
+    import generate_infinitetalk as gen
+
+    gen._init_logging(0)
+    # the size only affects per-job arguments, the weights are the same for both buckets
+    args = gen._parse_args(_gen_argv("infinitetalk-480", pathlib.Path("/tmp")))
+    start = time.perf_counter()
+    wan_i2v, feature_extractor, audio_encoder = gen.load_pipeline(args)
+    seconds = time.perf_counter() - start
+    metrics.observe_model_load(seconds)
+    print(f"✓ InfiniteTalk pipeline loaded in {seconds:.1f}s", flush=True)
+    wan_i2v.precompute_prompts(offload_model=args.offload_model)
+    if COMPILE and COMPILE_WARMUP:
+        start = time.perf_counter()
+        timings = wan_i2v.warm_up_dit(COMPILE_WARMUP, frame_num=args.frame_num, offload_model=args.offload_model)
+        print(f"✓ DiT compiled for {len(timings)} buckets in {time.perf_counter() - start:.1f}s", flush=True)
+    return gen, wan_i2v, feature_extractor, audio_encoder
+
+def _switch_loras(wan_i2v, loras):
+    seconds = wan_i2v.set_loras(loras)
+    if seconds:
+        metrics.observe_stage("lora_swap", seconds)
+
+def _generate(input_data, size, job, checkpoint_dir=None, on_segment=None, workspace=None, loras=()):
+    if WARM is None:
+        # the generator subprocess needs the decoded audio on disk
+        aud_wav = job / "input.wav"
+        sf.write(str(aud_wav), input_data["cond_audio"]["person1"], 16000)
+        req = dict(input_data, cond_audio={"person1": str(aud_wav)})
+        (job / "request.json").write_text(json.dumps(req))
+        argv = _gen_argv(size, job, checkpoint_dir)
+        if loras:
+            argv += ["--lora_dir", *(path for path, _ in loras), "--lora_scale", *(str(scale) for _, scale in loras)]
+        _run(["python", GEN_SCRIPT] + argv, cwd=str(job))
+        return None
+    gen, wan_i2v, feature_extractor, audio_encoder = WARM
+    _switch_loras(wan_i2v, loras)
+    args = gen._parse_args(_gen_argv(size, job, checkpoint_dir, hls=on_segment is not None))
+    return gen.generate_video(args, input_data, wan_i2v, feature_extractor, audio_encoder, on_segment=on_segment,
+                              workspace=workspace)
+
+def _timed(stage, fn, *args, **kwargs):
+    start = time.perf_counter()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        metrics.observe_stage(stage, time.perf_counter() - start)
+
+def _upload(mp4):
+    up = subprocess.check_output(["curl","-sF",f"file=@{mp4}","https://file.io"]).decode()
+    return json.loads(up)["link"]
+
+def _parse_loras(value):
     """
-    input: { "image_url": "...", "audio_url": "...", "quality": "720p"|"480p" }
+    The `lora` request field -> [(path, scale)]. Accepts a name, or a list of
+    names and {"name": ..., "scale": ...} of .safetensors files in LORA_ROOT.
     """
+    if not value:
+        return []
+    if isinstance(value, (str, dict)):
+        value = [value]
+    loras = []
+    for item in value:
+        if isinstance(item, str):
+            item = {"name": item}
+        name = str(item.get("name") or "")
+        if not name or os.path.basename(name) != name or name.startswith("."):
+            raise ValueError(f"invalid lora name: {name!r}")
+        path = LORA_ROOT / (name if name.endswith(".safetensors") else f"{name}.safetensors")
+        if not path.is_file():
+            raise ValueError(f"unknown lora: {name}")
+        loras.append((str(path), float(item.get("scale", 1.0))))
+    return loras
+
+def _parse_input(event):
+    """Validate the request and create its job workspace (tmpfs when available)."""
     inp = event.get("input") or {}
-    image_url = inp.get("image_url")
-    audio_url = inp.get("audio_url")
-    quality   = (inp.get("quality") or "720p").lower()
-    if not image_url or not audio_url:
-        return {"status":"error","error":"image_url and audio_url are required"}
+    if not inp.get("image_url") or not inp.get("audio_url"):
+        raise ValueError("image_url and audio_url are required")
+    quality = (inp.get("quality") or "720p").lower()
+    loras = _parse_loras(inp.get("lora"))
+    if loras and QUANT:
+        # the quantized DiT cannot switch LoRAs, and baking one per LoRA set would thrash the quant bake
+        raise ValueError("lora is not supported when the worker runs a quantized model (INFINITETALK_QUANT)")
+    # a retried job keeps its id, and its paths must match for a checkpoint to be reused
+    job_id = event.get("id") or uuid.uuid4().hex
+    workspace = Workspace(job_id)
+    return {
+        "image_url": inp["image_url"],
+        "audio_url": inp["audio_url"],
+        "prompt": inp.get("prompt") or DEFAULT_PROMPT,
+        "size": "infinitetalk-720" if quality=="720p" else "infinitetalk-480",
+        "priority": int(inp.get("priority") or 0),
+        "lora": loras,
+        "workspace": workspace,
+        "job": pathlib.Path(workspace.path),
+        "checkpoint_dir": pathlib.Path(job_path(CHECKPOINT_ROOT, job_id)) if CHECKPOINT_JOBS else None,
+    }
 
-    job = pathlib.Path("/tmp") / uuid.uuid4().hex
-    job.mkdir(parents=True, exist_ok=True)
+def _ingest(state):
+    """Download both inputs and look the job up in the result cache."""
+    try:
+        img, audio = _timed("download", ingest, state["image_url"], state["audio_url"], state["job"] / "input.png", sample_rate=16000)
+    except Exception as e:
+        raise RuntimeError(f"download failed: {e}") from e
+    if audio.size == 0:
+        raise RuntimeError("download failed: audio decode produced no samples")
+    state["image"], state["audio"] = img, audio
 
-    img = job / "input.png"
-    aud_src = job / "audio_src"
-    aud_wav = job / "input.wav"
-    req_js  = job / "request.json"
+    # quantized and compiled DiTs give different videos than the bf16 eager one
+    params = dict(_sampling_params(state["size"]), prompt=state["prompt"], quant=QUANT, compile=COMPILE)
+    if state["lora"]:
+        # mtime so that replacing a LoRA file under the same name invalidates its results
+        params["lora"] = [(os.path.basename(path), scale, os.stat(path).st_mtime_ns) for path, scale in state["lora"]]
+    state["cache_key"] = make_cache_key(hash_file(img), hash_audio(audio), params)
+    # a private copy, the entry itself may be evicted by another job's put before the upload
+    state["mp4"] = RESULT_CACHE.get(state["cache_key"], dest=state["job"] / "cached.mp4")
+    state["cached"] = state["mp4"] is not None
+    print(f"result cache {'hit' if state['cached'] else 'miss'} {state['cache_key'][:12]} {RESULT_CACHE.stats()}", flush=True)
 
+def _store_and_upload(state):
+    mp4 = state["mp4"]
+    if not state["cached"]:
+        try:
+            RESULT_CACHE.put(state["cache_key"], mp4)
+        except OSError as e:
+            print(f"result cache store failed: {e}", flush=True)
     try:
-        _download(image_url, img)
-        _download(audio_url, aud_src)
+        link = _timed("upload", _upload, mp4)
     except Exception as e:
-        return {"status":"error","error":f"download failed: {e}"}
+        raise RuntimeError(f"upload failed: {e}") from e
+    return {"status":"done","video_url":link}
 
+def _render(state, on_segment=None):
+    """Generate the video of an ingested job into `state["mp4"]`."""
+    job = state["job"]
+    input_data = {
+        "prompt": state["prompt"],
+        "cond_video": str(state["image"]),
+        "cond_audio": {"person1": state["audio"]},
+    }
     try:
-        _run(["ffmpeg","-y","-i",str(aud_src),"-ar","16000","-ac","1","-c:a","pcm_s16le",str(aud_wav)])
+        mp4 = _generate(input_data, state["size"], job, state["checkpoint_dir"], on_segment, state["workspace"],
+                        state["lora"])
     except Exception as e:
-        return {"status":"error","error":f"ffmpeg convert failed: {e}"}
+        raise RuntimeError(f"InfiniteTalk failed: {e}") from e
+    finally:
+        if WARM is not None:
+            metrics.observe_gpu_memory()
 
-    req_js.write_text(json.dumps({"image": str(img), "audio": str(aud_wav), "seed": 1}))
-    size = "infinitetalk-720" if quality=="720p" else "infinitetalk-480"
+    mp4 = mp4 and pathlib.Path(mp4)
+    if not mp4 or not mp4.exists():
+        mp4 = next(iter(job.glob("infinitetalk_res*.mp4")), None) or next(iter(job.glob("*.mp4")), None)
+    if not mp4:
+        raise RuntimeError("No MP4 produced")
+    state["mp4"] = mp4
 
-    cmd = [
-        "python", GEN_SCRIPT,
-        "--ckpt_dir", str(CKPT_DIR),
-        "--wav2vec_dir", str(WAV2VEC_DIR),
-        "--infinitetalk_dir", str(INF_TALK),
-        "--input_json", str(req_js),
-        "--size", size,
-        "--sample_steps", "40",
-        "--mode", "streaming",
-        "--motion_frame", "9",
-        "--save_file", "infinitetalk_res"
-    ]
+def _count_request(result, start):
+    status = result.get("status", "error")
+    metrics.REQUESTS.inc(status=status)
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, status=status)
+    return result
+
+def handler(event):
+    """
+    input: { "image_url": "...", "audio_url": "...", "quality": "720p"|"480p", "prompt": "...", "priority": 0,
+             "lora": "name" | [{"name": "...", "scale": 1.0}, ...] }
+    """
+    start = time.perf_counter()
+    return _count_request(_handle(event), start)
+
+def _handle(event):
     try:
-        _run(cmd, cwd=str(job))
-    except Exception as e:
-        return {"status":"error","error":f"InfiniteTalk failed: {e}"}
+        state = _parse_input(event)
+    except ValueError as e:
+        return {"status":"error","error":str(e)}
+    try:
+        _ingest(state)
+        if not state["cached"]:
+            _render(state)
+        return _store_and_upload(state)
+    except RuntimeError as e:
+        return {"status":"error","error":str(e)}
+    finally:
+        state["workspace"].close()
 
-    mp4 = next(iter(job.glob("infinitetalk_res*.mp4")), None) or next(iter(job.glob("*.mp4")), None)
-    if not mp4:
-        return {"status":"error","error":"No MP4 produced"}
+def progressive_handler(event):
+    """
+    Same input as `handler`. Yields
+      { "status": "segment", "index": n, "start": s, "duration": s, "segment_url": "..." }
+    for every HLS segment as soon as its clip is generated, then the `handler` result.
+    Segments are MPEG-TS with audio and continuous timestamps, so they play back in order.
+    """
+    start = time.perf_counter()
+    for result in _handle_progressive(event):
+        if result["status"] != "segment":
+            _count_request(result, start)
+        yield result
+
+def _handle_progressive(event):
+    try:
+        state = _parse_input(event)
+    except ValueError as e:
+        yield {"status":"error","error":str(e)}
+        return
+    try:
+        yield from _stream_job(state)
+    finally:
+        state["workspace"].close()
+
+def _stream_job(state):
+    try:
+        _ingest(state)
+    except RuntimeError as e:
+        yield {"status":"error","error":str(e)}
+        return
+
+    if not state["cached"]:
+        segments = queue.Queue()
+
+        def on_segment(index, path, start, duration):
+            segments.put({"status":"segment","index":index,"start":start,"duration":duration,"path":path})
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            future = pool.submit(_render, state, on_segment)
+            while True:
+                try:
+                    segment = segments.get(timeout=1)
+                except queue.Empty:
+                    if future.done() and segments.empty():
+                        break
+                    continue
+                try:
+                    segment["segment_url"] = _upload(segment.pop("path"))
+                except Exception as e:
+                    print(f"segment upload failed: {e}", flush=True)
+                    continue
+                yield segment
+        try:
+            future.result()
+        except RuntimeError as e:
+            yield {"status":"error","error":str(e)}
+            return
+
+    try:
+        yield _store_and_upload(state)
+    except RuntimeError as e:
+        yield {"status":"error","error":str(e)}
+
+def _build_staged_pipeline():
+    """
+    preprocess (threads + wav2vec2 process pool) -> dit (one GPU thread) -> deliver (mux + upload).
+
+    Each stage has a bounded queue, so a busy GPU backs up into preprocessing
+    instead of buffering an unbounded number of decoded jobs. The dit queue is
+    a CostAwareScheduler: cheap and high-priority jobs go first, and a long job
+    yields the GPU at a clip boundary when one of them is waiting. With
+    DIT_MAX_BATCH > 1, waiting jobs of the same resolution bucket are pulled
+    into the running job's batch; batched jobs run to completion.
+    """
+    from src.serving.audio_pool import create_audio_pool, embed_speech
+    from wan.utils.audio_cache import audio_embedding_frames
+
+    gen, wan_i2v, _, _ = WARM
+    audio_pool = create_audio_pool(os.path.dirname(GEN_SCRIPT), WAV2VEC_DIR, num_workers=PREPROCESS_WORKERS,
+                                   audio_cache_dir=AUDIO_CACHE_DIR, audio_cache_max_bytes=AUDIO_CACHE_MAX_BYTES)
+    scheduler = CostAwareScheduler(maxsize=DIT_QUEUE)
+
+    def preprocess(job):
+        state = job.state
+        _ingest(state)
+        if state["cached"]:
+            job.skip_to("deliver")
+            return
+        # includes loudness normalisation and waiting for a free pool worker
+        human_speech, embedding = _timed("embedding", lambda: audio_pool.submit(embed_speech, state.pop("audio")).result())
+        video_audio = state["job"] / "sum.wav"
+        sf.write(str(video_audio), human_speech, 16000)
+        state["video_audio"] = str(video_audio)
+        args = state["args"] = gen._parse_args(_gen_argv(state["size"], state["job"]))
+        max_frames_num = args.frame_num if args.mode == "clip" else args.max_frame_num
+        # a path into the audio cache
+        state["num_clips"] = num_clips(audio_embedding_frames(embedding), args.frame_num, args.motion_frame, max_frames_num)
+        state["cost_per_clip"] = clip_cost(args.size, args.sample_steps, args.sample_text_guide_scale)
+        state["remaining_cost"] = state["num_clips"] * state["cost_per_clip"]
+        state["input_clip"] = {
+            "prompt": state["prompt"],
+            "cond_video": str(state["image"]),
+            "cond_audio": {"person1": embedding},
+        }
+        with Image.open(state["image"]) as img:
+            state["bucket"] = (args.size, gen.wan.multitalk.bucket_size(img.height, img.width, args.size))
+
+    def batchable(state):
+        # suspended and checkpointed jobs need the unbatched loop
+        return "resume" not in state and state["checkpoint_dir"] is None
+
+    def render_batch(batch):
+        print(f"batching {[job.state['job'].name for job in batch]} in {batch[0].state['bucket']}", flush=True)
+        dit = pipeline.stages["dit"]
+
+        def on_done(index, video):
+            state = batch[index].state
+            del state["input_clip"]
+            state["video"] = video
+            # the stage thread forwards batch[0] itself once render returns
+            if index > 0:
+                dit.forward(batch[index])
+
+        try:
+            gen.generate_clip_batch(batch[0].state["args"], wan_i2v, [job.state["input_clip"] for job in batch],
+                                    done_callback=on_done, workspace=batch[0].state["workspace"])
+        except Exception as e:
+            error = RuntimeError(f"InfiniteTalk failed: {e}")
+            for job in batch[1:]:
+                if "video" not in job.state:
+                    job.future.set_exception(error)
+            raise error from e
+        finally:
+            metrics.observe_gpu_memory()
+
+    def render(job):
+        state = job.state
+        try:
+            _switch_loras(wan_i2v, state["lora"])
+        except Exception as e:
+            raise RuntimeError(f"LoRA switch failed: {e}") from e
+        if DIT_MAX_BATCH > 1 and batchable(state):
+            others = scheduler.take_matching(
+                lambda other: batchable(other.state) and other.state["bucket"] == state["bucket"]
+                and other.state["lora"] == state["lora"],
+                DIT_MAX_BATCH - 1)
+            if others:
+                return render_batch([job] + others)
+        resume = state.pop("resume", None)
+        start_clip = resume.clip_index if resume is not None else 0
+
+        def on_clip(clip_index, get_state):
+            state["remaining_cost"] = state["cost_per_clip"] * max(state["num_clips"] - clip_index, 0)
+            if clip_index - start_clip < MIN_CLIPS_BEFORE_PREEMPT:
+                return False
+            return scheduler.should_preempt(job)
 
+        try:
+            result = gen.generate_clip(state["args"], wan_i2v, state["input_clip"], resume_state=resume,
+                                       clip_callback=on_clip, checkpoint_dir=state["checkpoint_dir"],
+                                       workspace=state["workspace"])
+        except Exception as e:
+            raise RuntimeError(f"InfiniteTalk failed: {e}") from e
+        finally:
+            metrics.observe_gpu_memory()
+        if isinstance(result, gen.wan.GenerationState):
+            print(f"suspended {state['job'].name} at clip {result.clip_index}/{state['num_clips']}", flush=True)
+            state["resume"] = result
+            job.hold()
+            scheduler.requeue(job)
+            return
+        del state["input_clip"]
+        state["video"] = result
+
+    def deliver(job):
+        state = job.state
+        if not state["cached"]:
+            save_file = state["args"].save_file
+            _timed("mux", gen.save_video_ffmpeg, state.pop("video"), save_file, [state["video_audio"]],
+                   tmp_dir=state["workspace"].path)
+            state["mp4"] = pathlib.Path(f"{save_file}.mp4")
+        return _store_and_upload(state)
+
+    pipeline = StagedPipeline([
+        Stage("preprocess", preprocess, num_workers=PREPROCESS_WORKERS, maxsize=PREPROCESS_QUEUE),
+        Stage("dit", render, num_workers=1, job_queue=scheduler),
+        Stage("deliver", deliver, num_workers=1, maxsize=DELIVER_QUEUE),
+    ])
+    metrics.watch_pipeline(pipeline, scheduler)
+    return pipeline
+
+async def staged_handler(event):
+    start = time.perf_counter()
+    return _count_request(await _handle_staged(event), start)
+
+async def _handle_staged(event):
     try:
-        up = subprocess.check_output(["curl","-sF",f"file=@{mp4}","https://file.io"]).decode()
-        link = json.loads(up)["link"]
+        state = _parse_input(event)
+    except ValueError as e:
+        return {"status":"error","error":str(e)}
+    loop = asyncio.get_running_loop()
+    # submit blocks while the preprocess queue is full
+    future = await loop.run_in_executor(None, STAGED.submit, state)
+    try:
+        return await asyncio.wrap_future(future)
     except Exception as e:
-        return {"status":"error","error":f"upload failed: {e}"}
+        return {"status":"error","error":str(e)}
+    finally:
+        state["workspace"].close()
+        print(f"stage stats {STAGED.stats()}", flush=True)
 
-    return {"status":"done","video_url":link}
+def main():
+    global WARM, STAGED
+    # Warm models into the mounted volume
+    subprocess.run(["python","/app/bootstrap.py"], check=True)
+
+    metrics.watch_cache("result", RESULT_CACHE)
+    if METRICS_PORT:
+        metrics.start_metrics_server(METRICS_PORT)
+        print(f"✓ metrics on :{METRICS_PORT}/metrics", flush=True)
+
+    if WORKER_MODE in ("warm", "staged"):
+        WARM = _load_warm_pipeline()
+        # timings from inside the pipeline (text/CLIP/VAE encode, DiT per clip, VAE decode, mux)
+        WARM[0].wan.utils.stage_timer.add_stage_listener(metrics.observe_stage)
+    if WORKER_MODE == "staged":
+        STAGED = _build_staged_pipeline()
+        # enough in-flight jobs to keep every stage queue fed
+        concurrency = PREPROCESS_QUEUE + PREPROCESS_WORKERS + DIT_QUEUE + 1
+        runpod.serverless.start({"handler": staged_handler, "concurrency_modifier": lambda current: concurrency})
+    elif PROGRESSIVE_OUTPUT and WORKER_MODE == "warm":
+        # /stream gets the segments as they finish, /run the aggregated list
+        runpod.serverless.start({"handler": progressive_handler, "return_aggregate_stream": True})
+    else:
+        runpod.serverless.start({"handler": handler})
 
-runpod.serverless.start({"handler": handler})
+# guarded so spawned preprocessing workers can import this module without side effects
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+import torch
+
+SAMPLE_RATE = 16000
+FRAME_SAMPLES = SAMPLE_RATE // 25  # audio samples per 25 fps video frame
+WINDOW_SECONDS = 30.0
+CONTEXT_SECONDS = 5.0
+BLEND_FRAMES = 10
+
+
+def window_plan(num_frames, window, context, blend):
+    """
+    [(encode_start, encode_end, keep_start, keep_end)] in 25 fps frames.
+
+    Each window encodes `window` frames plus up to `context` frames on either
+    side and keeps its own frames widened by `blend` frames in total, so the
+    kept ranges of neighbouring windows overlap by `blend` frames.
+    """
+    half = blend // 2
+    plan = []
+    for start in range(0, num_frames, window):
+        end = min(start + window, num_frames)
+        keep_start, keep_end = max(0, start - half), min(num_frames, end + blend - half)
+        plan.append((max(0, keep_start - context), min(num_frames, keep_end + context), keep_start, keep_end))
+    return plan
+
+
+def _blend_weights(length, ramp_in, ramp_out, blend):
+    weights = torch.ones(length)
+    if blend:
+        ramp = (torch.arange(min(blend, length)) + 0.5) / blend
+        if ramp_in:
+            weights[:len(ramp)] = torch.minimum(weights[:len(ramp)], ramp)
+        if ramp_out:
+            weights[-len(ramp):] = torch.minimum(weights[-len(ramp):], ramp.flip(0))
+    return weights
+
+
+def split_windows(input_values, seq_len, window_seconds=WINDOW_SECONDS, context_seconds=CONTEXT_SECONDS,
+                  blend=BLEND_FRAMES):
+    """
+    (plan, [(samples, num_frames)] per window, blend) of a track, see
+    `encode_chunked`; a track of up to one window is a single window.
+    """
+    window = max(1, int(window_seconds * 25))
+    context = int(context_seconds * 25)
+    if seq_len <= window:
+        return [(0, seq_len, 0, seq_len)], [(input_values, seq_len)], 0
+    blend = min(blend, 2 * context, window)
+    plan = window_plan(seq_len, window, context, blend)
+    chunks = []
+    for encode_start, encode_end, _, _ in plan:
+        end = encode_end * FRAME_SAMPLES if encode_end < seq_len else len(input_values)
+        chunks.append((input_values[encode_start * FRAME_SAMPLES:end], encode_end - encode_start))
+    return plan, chunks, blend
+
+
+def stitch(plan, results, seq_len, blend):
+    """The `[seq_len, ...]` features of a track from those of its windows, in `plan` order."""
+    if len(plan) == 1:
+        return next(iter(results))
+    output = weight_sum = None
+    for i, ((encode_start, _, keep_start, keep_end), features) in enumerate(zip(plan, results)):
+        features = features[keep_start - encode_start:keep_end - encode_start]
+        weights = _blend_weights(keep_end - keep_start, i > 0, i < len(plan) - 1, blend)
+        if output is None:
+            output = features.new_zeros((seq_len,) + features.shape[1:], dtype=torch.float32)
+            weight_sum = torch.zeros(seq_len)
+        output[keep_start:keep_end] += features.float() * weights.view(-1, *[1] * (features.dim() - 1))
+        weight_sum[keep_start:keep_end] += weights
+    return (output / weight_sum.view(-1, *[1] * (output.dim() - 1))).to(features.dtype)
+
+
+def encode_chunked(input_values, seq_len, encode_fn, window_seconds=WINDOW_SECONDS,
+                   context_seconds=CONTEXT_SECONDS, blend=BLEND_FRAMES, executor=None):
+    """
+    `encode_fn(input_values, seq_len)` over a long track in fixed-length windows.
+
+    `input_values` are the 16 kHz samples, already normalised over the whole
+    track by the feature extractor, and `encode_fn` returns `[seq_len, ...]`
+    features at 25 fps, e.g. the stacked wav2vec2 hidden states. Windows
+    start on frame boundaries (640 samples), so their 25 fps frames line up
+    with the ones of a single pass; each sees `context_seconds` of audio on
+    either side, and the `blend` frames where neighbouring windows meet are
+    cross-faded. Attention cost and activation memory are then bounded by
+    the window length instead of growing with the square of the track
+    length.
+
+    Windows are independent: pass a thread or process pool as `executor` to
+    encode them in parallel (`encode_fn` must be picklable for a process pool).
+    """
+    plan, chunks, blend = split_windows(input_values, seq_len, window_seconds, context_seconds, blend)
+    samples, lengths = zip(*chunks)
+    results = executor.map(encode_fn, samples, lengths) if executor is not None else map(encode_fn, samples, lengths)
+    return stitch(plan, results, seq_len, blend)
+
+
+def encode_batched(tracks, encode_batch_fn, max_batch=8, **window_kwargs):
+    """
+    Features of several `(input_values, seq_len)` tracks, e.g. one per
+    speaker, as `encode_chunked` gives them. Windows of the same length,
+    whichever track they come from, go through
+    `encode_batch_fn([input_values, ...], seq_len)` together, up to
+    `max_batch` at a time; same-length inputs need no padding, so batching
+    does not change the features.
+    """
+    splits = [split_windows(input_values, seq_len, **window_kwargs) for input_values, seq_len in tracks]
+    groups = {}
+    for t, (_, chunks, _) in enumerate(splits):
+        for w, (samples, num_frames) in enumerate(chunks):
+            groups.setdefault((len(samples), num_frames), []).append((t, w, samples))
+    results = [[None] * len(chunks) for _, chunks, _ in splits]
+    for (_, num_frames), members in groups.items():
+        for i in range(0, len(members), max_batch):
+            batch = members[i:i + max_batch]
+            for (t, w, _), features in zip(batch, encode_batch_fn([m[2] for m in batch], num_frames)):
+                results[t][w] = features
+    return [stitch(plan, results[t], seq_len, blend) for t, ((plan, _, blend), (_, seq_len))
+            in enumerate(zip(splits, tracks))]
+
+
+def silent_spans(samples, min_frames):
+    """[(start, end)] in 25 fps frames of runs of exact zeros lasting at least `min_frames` frames."""
+    num_frames = len(samples) // FRAME_SAMPLES
+    frames = torch.as_tensor(samples[:num_frames * FRAME_SAMPLES]).reshape(num_frames, FRAME_SAMPLES)
+    silent = (frames == 0).all(dim=1).tolist()
+    spans, start = [], None
+    for f, is_silent in enumerate(silent + [False]):
+        if is_silent and start is None:
+            start = f
+        elif not is_silent and start is not None:
+            if f - start >= min_frames:
+                spans.append((start, f))
+            start = None
+    return spans
+
+
+def speech_spans(samples, seq_len, min_frames, margin):
+    """
+    [(start, end)] in 25 fps frames of a track to encode: all but its runs of
+    exact zeros lasting at least `min_frames`, less `margin` frames next to
+    speech, so that speech keeps some of its encoded context.
+    """
+    silences = []
+    for start, end in silent_spans(samples, min_frames):
+        start, end = (start + margin if start > 0 else 0), (end - margin if end < seq_len else seq_len)
+        if end > start:
+            silences.append((start, end))
+    bounds = [0] + [f for span in silences for f in span] + [seq_len]
+    return [(start, end) for start, end in zip(bounds[::2], bounds[1::2]) if end > start]
+
+
+def match_spans(span_lists, seq_lens):
+    """
+    `span_lists`, one per track, with each span widened into the silence next
+    to it up to the length of a longer span of another track where there is
+    room, so that both are split into the same windows and encoded together.
+    """
+    lengths = [{end - start for start, end in spans} for spans in span_lists]
+    matched = []
+    for t, (spans, seq_len) in enumerate(zip(span_lists, seq_lens)):
+        others = sorted(set().union(*(lengths[u] for u in range(len(span_lists)) if u != t)))
+        widened = []
+        for i, (start, end) in enumerate(spans):
+            low = widened[-1][1] if widened else 0
+            high = spans[i + 1][0] if i + 1 < len(spans) else seq_len
+            target = next((n for n in others if end - start < n <= high - low), None)
+            if target is not None:
+                grow = target - (end - start)
+                after = min(grow, high - end)
+                start, end = start - (grow - after), end + after
+            widened.append((start, end))
+        matched.append(widened)
+    return matched
+
+
+def encode_speech(tracks, encode_batch_fn, silence_fn, min_silence_frames=50, margin=25, **window_kwargs):
+    """
+    Features of several `(samples, input_values, seq_len)` tracks, e.g. the
+    zero-padded tracks of two speakers, with `samples` the raw 16 kHz audio
+    and `input_values` the normalised one. Runs of exact zeros lasting at
+    least `min_silence_frames` are not encoded but filled with
+    `silence_fn(value)`, the features of the constant normalised input
+    `value`; the speech of all tracks (see `speech_spans` and `match_spans`)
+    goes through `encode_batched` together.
+    """
+    span_lists = match_spans([speech_spans(samples, seq_len, min_silence_frames, margin)
+                              for samples, _, seq_len in tracks], [seq_len for _, _, seq_len in tracks])
+    # spans are cut on frame boundaries, dropping a trailing partial frame, so that equal spans batch together
+    features = iter(encode_batched([(input_values[start * FRAME_SAMPLES:end * FRAME_SAMPLES], end - start)
+                                    for (_, input_values, _), spans in zip(tracks, span_lists)
+                                    for start, end in spans], encode_batch_fn, **window_kwargs))
+    outputs = []
+    for (_, input_values, seq_len), spans in zip(tracks, span_lists):
+        parts = [(start, end, next(features)) for start, end in spans]
+        covered = torch.zeros(seq_len, dtype=torch.bool)
+        for start, end, _ in parts:
+            covered[start:end] = True
+        gaps = (~covered).nonzero()
+        if len(gaps):
+            silence = silence_fn(input_values[gaps[0].item() * FRAME_SAMPLES])
+            output = silence.expand(seq_len, *silence.shape).clone()
+        else:
+            output = parts[0][2].new_empty((seq_len,) + parts[0][2].shape[1:])
+        for start, end, part in parts:
+            output[start:end] = part
+        outputs.append(output)
+    return outputs
+
+
+if __name__ == '__main__':
+    # Chunked vs single-pass encoding of a reduced-size, randomly initialised wav2vec2
+    # (or the checkpoint in [wav2vec2 dir]) on the CPU: largest difference relative to
+    # the features' scale, and seconds; with context covering the whole track, and with
+    # an encoder that only looks at each frame's own samples, the two must agree up to
+    # float rounding whatever the model; then batched vs separate encoding of two tracks,
+    # which should agree up to float rounding; then the silence-filled features of two
+    # speakers' zero-padded tracks vs encoding each padded track in one pass:
+    #   python -m src.audio_analysis.streaming [seconds of audio] [window seconds] [wav2vec2 dir]
+    import sys
+    import time
+    from contextlib import nullcontext
+    from concurrent.futures import ThreadPoolExecutor
+
+    import numpy as np
+    from transformers import Wav2Vec2Config
+
+    from .wav2vec2 import Wav2Vec2Model
+
+    # relative bounds: windows see only CONTEXT_SECONDS of the rest of the track, which a trained
+    # wav2vec2 barely attends to; a random one attends everywhere, so only gross errors are caught
+    # then. Exact bounds: windows that see the whole track, or an encoder that sees only its own
+    # frame, leave nothing but float rounding, so misaligned frames or a broken cross-fade fail them.
+    chunked_bound = 0.05 if len(sys.argv) > 3 else 0.5
+    exact_bound = 1e-4
+    batched_bound = 1e-4
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 120.0
+    window_seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 20.0
+    torch.manual_seed(0)
+    config = Wav2Vec2Config(hidden_size=128, num_hidden_layers=4, num_attention_heads=4, intermediate_size=256,
+                            conv_dim=(64,) * 7, num_conv_pos_embeddings=128, num_conv_pos_embedding_groups=16)
+    model = Wav2Vec2Model(config).eval() if len(sys.argv) <= 3 else Wav2Vec2Model.from_pretrained(sys.argv[3]).eval()
+    t = torch.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    audio = torch.sin(2 * torch.pi * 220 * t * (1 + 0.1 * torch.sin(t))) + 0.1 * torch.randn_like(t)
+    audio = ((audio - audio.mean()) / audio.std()).numpy()
+    seq_len = int(seconds * 25)
+
+    def encode(input_values, seq_len):
+        with torch.no_grad():
+            out = model(torch.from_numpy(input_values)[None], seq_len=seq_len, output_hidden_states=True)
+        return torch.stack(out.hidden_states[1:], dim=1).squeeze(0).transpose(0, 1)
+
+    start = time.perf_counter()
+    reference = encode(audio, seq_len)
+    single = time.perf_counter() - start
+    for workers in (None, 4):
+        with ThreadPoolExecutor(workers) if workers else nullcontext() as pool:
+            start = time.perf_counter()
+            chunked = encode_chunked(audio, seq_len, encode, window_seconds=window_seconds, executor=pool)
+            elapsed = time.perf_counter() - start
+        error = ((chunked - reference).abs().max() / reference.abs().max()).item()
+        print(f"{seconds:.0f}s of audio, {window_seconds:.0f}s windows, {workers or 1} worker(s): "
+              f"single pass {single:.2f}s, chunked {elapsed:.2f}s, max relative difference {error:.2e}")
+        assert error < chunked_bound, f"chunked features differ from one pass by {error:.2e} >= {chunked_bound}"
+
+    chunked = encode_chunked(audio, seq_len, encode, window_seconds=window_seconds, context_seconds=seconds)
+    error = ((chunked - reference).abs().max() / reference.abs().max()).item()
+    print(f"context covering the whole track: max relative difference {error:.2e}")
+    assert error < exact_bound, f"chunked features with full context differ by {error:.2e} >= {exact_bound}"
+
+    # per frame: mean, spread and first sample of its 640 samples
+    def encode_local(input_values, seq_len):
+        frames = torch.from_numpy(input_values[:seq_len * FRAME_SAMPLES]).view(seq_len, FRAME_SAMPLES)
+        return torch.stack([frames.mean(1), frames.std(1), frames[:, 0]], dim=1)
+
+    def encode_local_batch(inputs, seq_len):
+        return [encode_local(input_values, seq_len) for input_values in inputs]
+
+    local_reference = encode_local(audio, seq_len)
+    chunked = encode_chunked(audio, seq_len, encode_local, window_seconds=window_seconds)
+    error = ((chunked - local_reference).abs().max() / local_reference.abs().max()).item()
+    print(f"frame-local encoder: max relative difference {error:.2e}")
+    assert error < exact_bound, f"chunked frame-local features differ by {error:.2e} >= {exact_bound}"
+
+    # two tracks batched window by window must match encoding them one by one
+    def encode_batch(inputs, seq_len):
+        with torch.no_grad():
+            out = model(torch.from_numpy(np.stack(inputs)), seq_len=seq_len, output_hidden_states=True)
+        return list(torch.stack(out.hidden_states[1:], dim=1).transpose(1, 2))
+
+    half = audio[:len(audio) // 2]
+    start = time.perf_counter()
+    batched = encode_batched([(audio, seq_len), (half, len(half) // FRAME_SAMPLES)], encode_batch,
+                             window_seconds=window_seconds)
+    elapsed = time.perf_counter() - start
+    separate = [encode_chunked(a, n, encode, window_seconds=window_seconds)
+                for a, n in [(audio, seq_len), (half, len(half) // FRAME_SAMPLES)]]
+    error = max(((b - r).abs().max() / r.abs().max()).item() for b, r in zip(batched, separate))
+    print(f"batched tracks of {seconds:.0f}s and {seconds / 2:.0f}s: {elapsed:.2f}s, "
+          f"max relative difference {error:.2e}")
+    assert error < batched_bound, f"batched features differ from separate ones by {error:.2e} >= {batched_bound}"
+
+    # speakers one after the other, as audio_prepare_multi pads them; a trained wav2vec2 encodes
+    # silence nearly the same wherever it is, a random one mixes the whole track into every frame
+    def normalise(samples):
+        return ((samples - samples.mean()) / np.sqrt(samples.var() + 1e-7)).astype(np.float32)
+
+    def silence(value):
+        return encode(np.full(2 * SAMPLE_RATE, value, dtype=np.float32), 50)[25]
+
+    cut = len(audio) * 2 // 5 // FRAME_SAMPLES * FRAME_SAMPLES
+    padded = [np.concatenate([audio[:cut], np.zeros(len(audio) - cut, dtype=audio.dtype)]),
+              np.concatenate([np.zeros(cut, dtype=audio.dtype), audio[cut:]])]
+    tracks = [(samples, normalise(samples), seq_len) for samples in padded]
+    start = time.perf_counter()
+    filled = encode_speech(tracks, encode_batch, silence, window_seconds=window_seconds)
+    elapsed = time.perf_counter() - start
+    references = [encode(input_values, seq_len) for _, input_values, seq_len in tracks]
+    error = max(((f - r).abs().max() / r.abs().max()).item() for f, r in zip(filled, references))
+    print(f"two speakers of {cut / SAMPLE_RATE:.0f}s and {(len(audio) - cut) / SAMPLE_RATE:.0f}s, silence filled: "
+          f"{elapsed:.2f}s, max relative difference to one pass per track {error:.2e}")
+    if len(sys.argv) > 3:
+        assert error < 0.1, f"silence-filled features differ from one pass by {error:.2e}"
+
+    # with the frame-local encoder, the silence fill is exactly what one pass gives for the zeros
+    filled = encode_speech(tracks, encode_local_batch, lambda value: encode_local(
+        np.full(2 * SAMPLE_RATE, value, dtype=np.float32), 50)[25], window_seconds=window_seconds)
+    references = [encode_local(input_values, seq_len) for _, input_values, seq_len in tracks]
+    error = max(((f - r).abs().max() / r.abs().max()).item() for f, r in zip(filled, references))
+    print(f"silence filled, frame-local encoder: max relative difference {error:.2e}")
+    assert error < exact_bound, f"silence-filled frame-local features differ by {error:.2e} >= {exact_bound}"
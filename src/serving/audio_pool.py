@@ -0,0 +1,56 @@
+import os
+import sys
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# per-process state, filled by `_init_worker`
+_gen = None
+_feature_extractor = None
+_audio_encoder = None
+_audio_cache = None
+
+
+def _init_worker(gen_dir, wav2vec_dir, num_threads, audio_cache_dir, audio_cache_max_bytes):
+    global _gen, _feature_extractor, _audio_encoder, _audio_cache
+    import torch
+
+    torch.set_num_threads(num_threads)
+    sys.path.insert(0, gen_dir)
+    import generate_infinitetalk
+
+    _gen = generate_infinitetalk
+    _feature_extractor, _audio_encoder = _gen.custom_init('cpu', wav2vec_dir)
+    if audio_cache_dir is not None:
+        _audio_cache = _gen.AudioEmbeddingCache(audio_cache_dir, wav2vec_dir, audio_cache_max_bytes)
+
+
+def embed_speech(speech_array):
+    """
+    Loudness-normalise 16 kHz mono samples and run wav2vec2 on them.
+
+    Returns:
+        (normalised samples, [T, 13, 768] embedding), or with an audio cache
+        the path of the cached embedding, which is cheaper to send back than
+        the tensor
+    """
+    human_speech = _gen.audio_prepare_single(speech_array)
+    return human_speech, _gen.embed_audio(human_speech, _feature_extractor, _audio_encoder, _audio_cache)
+
+
+def create_audio_pool(gen_dir, wav2vec_dir, num_workers=2, num_threads=None, audio_cache_dir=None,
+                      audio_cache_max_bytes=None):
+    """
+    A process pool whose workers each hold a CPU copy of the wav2vec2 encoder.
+
+    Workers are spawned rather than forked so they never inherit the parent's
+    CUDA context or stage threads.
+    """
+    if num_threads is None:
+        num_threads = max(1, (os.cpu_count() or 1) // (2 * num_workers))
+    return ProcessPoolExecutor(
+        max_workers=num_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(gen_dir, str(wav2vec_dir), num_threads,
+                  str(audio_cache_dir) if audio_cache_dir is not None else None, audio_cache_max_bytes),
+    )
@@ -0,0 +1,98 @@
+import os
+import io
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+CHUNK_SIZE = 1 << 16
+
+
+def download_file(url, path, timeout=300):
+    os.makedirs(os.path.dirname(str(path)), exist_ok=True)
+    with requests.get(url, stream=True, timeout=timeout) as r:
+        r.raise_for_status()
+        with open(path, "wb") as f:
+            for chunk in r.iter_content(CHUNK_SIZE):
+                if chunk: f.write(chunk)
+    return path
+
+
+def _ffmpeg_decode_cmd(src, sample_rate):
+    return ["ffmpeg", "-v", "error", "-i", src,
+            "-f", "f32le", "-ac", "1", "-ar", str(sample_rate), "pipe:1"]
+
+
+def _decode_file(data, sample_rate):
+    # containers such as mp4/m4a with a trailing moov atom need a seekable input
+    with tempfile.NamedTemporaryFile(suffix=".audio") as f:
+        f.write(data)
+        f.flush()
+        p = subprocess.run(_ffmpeg_decode_cmd(f.name, sample_rate),
+                           stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if p.returncode != 0:
+        raise RuntimeError(p.stderr.decode(errors="replace")[-4000:])
+    return np.frombuffer(p.stdout, dtype=np.float32).copy()
+
+
+def stream_decode_audio(url, sample_rate=16000, timeout=300):
+    """
+    Download `url` and decode it to mono float32 PCM at `sample_rate` while the
+    bytes are still arriving. The audio never touches the disk unless ffmpeg
+    cannot decode it from a pipe, in which case the buffered bytes are retried
+    through a seekable temp file.
+    """
+    proc = subprocess.Popen(_ffmpeg_decode_cmd("pipe:0", sample_rate),
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL)
+    received = io.BytesIO()
+    errors = []
+
+    def feed():
+        try:
+            with requests.get(url, stream=True, timeout=timeout) as r:
+                r.raise_for_status()
+                for chunk in r.iter_content(CHUNK_SIZE):
+                    if not chunk:
+                        continue
+                    received.write(chunk)
+                    try:
+                        proc.stdin.write(chunk)
+                    except BrokenPipeError:
+                        # ffmpeg gave up on the pipe, keep buffering for the fallback
+                        pass
+        except Exception as e:
+            errors.append(e)
+        finally:
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    pcm = proc.stdout.read()
+    proc.wait()
+    feeder.join()
+
+    if errors:
+        raise errors[0]
+    if proc.returncode != 0 or not pcm:
+        return _decode_file(received.getvalue(), sample_rate)
+    return np.frombuffer(pcm, dtype=np.float32).copy()
+
+
+def ingest(image_url, audio_url, image_path, sample_rate=16000):
+    """
+    Fetch the conditioning image and the audio concurrently.
+
+    Returns:
+        (image_path, audio) where audio is a float32 array at `sample_rate`.
+    """
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        image_future = pool.submit(download_file, image_url, image_path)
+        audio_future = pool.submit(stream_decode_audio, audio_url, sample_rate)
+        return image_future.result(), audio_future.result()
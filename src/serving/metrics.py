@@ -0,0 +1,267 @@
+import math
+import logging
+import resource
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# seconds; covers everything from a cache lookup to a multi-minute DiT run
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, math.inf)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """[(suffix, labels, value)] for the exposition format."""
+        with self._lock:
+            return [("", key, value) for key, value in self._values.items()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set_total(self, value, **labels):
+        """Mirror a cumulative count kept elsewhere, e.g. read by a collector at scrape time."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_max(self, value, **labels):
+        """Keep the largest value seen, e.g. a high-water mark."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = max(self._values.get(key, value), value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        if self.buckets[-1] != math.inf:
+            self.buckets += (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        out = []
+        with self._lock:
+            for key, (counts, total) in self._values.items():
+                for bound, count in zip(self.buckets, counts):
+                    out.append(("_bucket", key + (("le", _format_value(bound)),), count))
+                out.append(("_sum", key, total))
+                out.append(("_count", key, counts[-1]))
+        return out
+
+
+class Registry:
+    """
+    A minimal Prometheus registry. Besides metrics updated in place,
+    collectors registered with `add_collector` are called at scrape time to
+    fill gauges from live objects (queues, caches).
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._add(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._add(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, fn):
+        self._collectors.append(fn)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (0.0.4)."""
+        for fn in self._collectors:
+            try:
+                fn()
+            except Exception:
+                logging.exception("metrics collector failed")
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "infinitetalk_stage_seconds", "Wall time per request stage.", ["stage"])
+REQUEST_SECONDS = REGISTRY.histogram(
+    "infinitetalk_request_seconds", "End-to-end request latency.", ["status"])
+REQUESTS = REGISTRY.counter(
+    "infinitetalk_requests_total", "Finished requests.", ["status"])
+GPU_MEMORY_PEAK = REGISTRY.gauge(
+    "infinitetalk_gpu_memory_peak_bytes", "Peak GPU memory of the last generation.", ["kind"])
+GPU_MEMORY_HIGH_WATER = REGISTRY.gauge(
+    "infinitetalk_gpu_memory_high_water_bytes", "Peak GPU memory of any generation since start.", ["kind"])
+QUEUE_DEPTH = REGISTRY.gauge(
+    "infinitetalk_queue_depth", "Jobs waiting in front of a stage.", ["stage"])
+BUSY_WORKERS = REGISTRY.gauge(
+    "infinitetalk_busy_workers", "Stage workers currently running a job.", ["stage"])
+STAGE_OCCUPANCY = REGISTRY.gauge(
+    "infinitetalk_stage_occupancy_ratio", "Fraction of worker time spent busy since start.", ["stage"])
+PREEMPTIONS = REGISTRY.counter(
+    "infinitetalk_preemptions_total", "DiT jobs suspended at a clip boundary.")
+CACHE_LOOKUPS = REGISTRY.counter(
+    "infinitetalk_cache_lookups_total", "Cache lookups.", ["cache", "result"])
+CACHE_HIT_RATIO = REGISTRY.gauge(
+    "infinitetalk_cache_hit_ratio", "Cache hits / lookups since start.", ["cache"])
+MODEL_LOAD_SECONDS = REGISTRY.gauge(
+    "infinitetalk_model_load_seconds", "Time to load the warm pipeline at startup.")
+HOST_MEMORY_PEAK = REGISTRY.gauge(
+    "infinitetalk_host_memory_peak_bytes", "Peak resident set size of the worker process.")
+
+
+def observe_stage(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+
+
+def observe_gpu_memory():
+    """Record and reset the CUDA peak-memory counters; call after each generation."""
+    import torch
+
+    if not torch.cuda.is_available():
+        return
+    for kind, value in (("allocated", torch.cuda.max_memory_allocated()),
+                        ("reserved", torch.cuda.max_memory_reserved())):
+        GPU_MEMORY_PEAK.set(value, kind=kind)
+        GPU_MEMORY_HIGH_WATER.set_max(value, kind=kind)
+    torch.cuda.reset_peak_memory_stats()
+
+
+def observe_model_load(seconds):
+    """Record the pipeline load time and the host RAM it peaked at."""
+    MODEL_LOAD_SECONDS.set(seconds)
+    HOST_MEMORY_PEAK.set(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+
+
+def watch_cache(name, cache):
+    """Export `cache.stats()` (hits / misses / hit_rate) at scrape time."""
+    def collect():
+        stats = cache.stats()
+        CACHE_LOOKUPS.set_total(stats["hits"], cache=name, result="hit")
+        CACHE_LOOKUPS.set_total(stats["misses"], cache=name, result="miss")
+        CACHE_HIT_RATIO.set(stats["hit_rate"], cache=name)
+    REGISTRY.add_collector(collect)
+
+
+def watch_pipeline(pipeline, scheduler=None):
+    """Export queue depth and occupancy of every stage of a `StagedPipeline`."""
+    def collect():
+        for stage, stats in pipeline.stats().items():
+            QUEUE_DEPTH.set(stats["queue_depth"], stage=stage)
+            BUSY_WORKERS.set(stats["busy_workers"], stage=stage)
+            STAGE_OCCUPANCY.set(stats["occupancy"], stage=stage)
+        if scheduler is not None:
+            PREEMPTIONS.set_total(scheduler.preemptions)
+    REGISTRY.add_collector(collect)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, addr="0.0.0.0", registry=REGISTRY):
+    """Serve `registry` on http://addr:port/metrics from a daemon thread."""
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((addr, port), handler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    # local scrape check: python -m src.serving.metrics
+    import urllib.request
+
+    observe_stage("download", 0.3)
+    observe_stage("dit", 42.0)
+    REQUESTS.inc(status="done")
+    server = start_metrics_server(0, addr="127.0.0.1")
+    url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+    with urllib.request.urlopen(url) as resp:
+        text = resp.read().decode()
+    server.shutdown()
+    assert 'infinitetalk_stage_seconds_bucket{stage="dit",le="50.0"} 1' in text, text
+    assert 'infinitetalk_stage_seconds_count{stage="download"} 1' in text, text
+    assert 'infinitetalk_requests_total{status="done"} 1.0' in text, text
+    print(text, end="")
+    print(f"scraped {url} OK")
@@ -0,0 +1,155 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def hash_file(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def hash_audio(samples, sample_rate=16000):
+    """
+    Hash decoded audio samples rather than the uploaded file, so two encodings
+    that decode to identical PCM share a key.
+    """
+    h = hashlib.sha256(f"{sample_rate}:{samples.dtype}:".encode())
+    h.update(memoryview(samples).cast("B"))
+    return h.hexdigest()
+
+
+def make_cache_key(image_hash, audio_hash, params):
+    payload = json.dumps(
+        {"image": image_hash, "audio": audio_hash, "params": params},
+        sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class CacheBackend:
+    """Storage interface used by `ResultCache`. Keys are hex digests."""
+
+    def get(self, key, dest=None):
+        """
+        Return a local path to the stored file, or None. With `dest`, the
+        file is placed at `dest` first and that path is returned, so it
+        stays readable however soon the entry is evicted.
+        """
+        raise NotImplementedError
+
+    def put(self, key, src_path):
+        """Store a copy of `src_path` under `key` and return its stored path."""
+        raise NotImplementedError
+
+
+class LocalDiskBackend(CacheBackend):
+    """
+    Stores results as `<root>/<key[:2]>/<key>.mp4` and evicts the least
+    recently used entries once the total size exceeds `max_bytes`.
+    """
+
+    def __init__(self, root, max_bytes, suffix=".mp4"):
+        self.root = str(root)
+        self.max_bytes = int(max_bytes)
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> size, oldest first
+        self.total_bytes = 0
+        os.makedirs(self.root, exist_ok=True)
+        self._scan()
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key + self.suffix)
+
+    def _scan(self):
+        found = []
+        for dirpath, _, files in os.walk(self.root):
+            for name in files:
+                if not name.endswith(self.suffix):
+                    continue
+                st = os.stat(os.path.join(dirpath, name))
+                found.append((st.st_mtime, name[:-len(self.suffix)], st.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self.total_bytes += size
+
+    def get(self, key, dest=None):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            path = self._path(key)
+            if not os.path.exists(path):
+                self.total_bytes -= self._entries.pop(key)
+                return None
+            self._entries.move_to_end(key)
+            # mtime carries the LRU order across restarts
+            os.utime(path, None)
+            if dest is None:
+                return path
+            # under the lock, so a concurrent put cannot evict the entry half-way
+            dest = str(dest)
+            try:
+                os.link(path, dest)
+            except OSError:  # another filesystem, e.g. a tmpfs workspace
+                shutil.copyfile(path, dest)
+            return dest
+
+    def put(self, key, src_path):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(src_path, tmp_path)
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)
+            self._entries[key] = size
+            self.total_bytes += size
+            self._evict()
+        return path
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+
+class ResultCache:
+    """Content-addressed cache of finished videos with hit/miss counters."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, dest=None):
+        path = self.backend.get(key, dest)
+        with self._lock:
+            if path is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return path
+
+    def put(self, key, src_path):
+        return self.backend.put(key, src_path)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
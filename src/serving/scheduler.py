@@ -0,0 +1,120 @@
+import math
+import time
+import itertools
+import threading
+
+# Latent tokens per clip scale with the bucket area; one DiT forward on a
+# 480 bucket clip is the unit of cost.
+BUCKET_AREA = {
+    'infinitetalk-480': 640 * 640,
+    'infinitetalk-720': 960 * 960,
+}
+
+
+def num_clips(num_frames, frame_num=81, motion_frame=9, max_frames_num=None):
+    """Number of sampling-loop iterations `generate_infinitetalk` runs for `num_frames` audio frames."""
+    if max_frames_num is not None:
+        num_frames = min(num_frames, max_frames_num)
+    if num_frames <= frame_num:
+        return 1
+    return 1 + math.ceil((num_frames - frame_num) / (frame_num - motion_frame))
+
+
+def cfg_branches(text_guide_scale):
+    """DiT forwards per step: cond + drop_audio, or cond + drop_text + uncond."""
+    return 2 if math.isclose(text_guide_scale, 1.0) else 3
+
+
+def clip_cost(size, sample_steps, text_guide_scale):
+    return sample_steps * cfg_branches(text_guide_scale) * BUCKET_AREA[size] / BUCKET_AREA['infinitetalk-480']
+
+
+class CostAwareScheduler:
+    """
+    Queue of DiT jobs ordered by priority (high first), then by estimated
+    remaining cost (cheap first). Waiting time discounts the cost so long jobs
+    are not starved. Jobs are `StagedJob`s whose state carries `priority` and
+    `remaining_cost`.
+
+    Implements the parts of `queue.Queue` that `Stage` uses, so it can stand in
+    for a stage's FIFO queue.
+    """
+
+    def __init__(self, maxsize=0, aging_seconds=300.0, preempt_ratio=0.5):
+        self.maxsize = maxsize
+        self.aging_seconds = aging_seconds
+        self.preempt_ratio = preempt_ratio
+        self._entries = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self.preemptions = 0
+
+    def _key(self, entry, now):
+        job, enqueued_at, seq = entry
+        waited = now - enqueued_at
+        cost = job.state['remaining_cost'] / (1.0 + waited / self.aging_seconds)
+        return (-job.state.get('priority', 0), cost, seq)
+
+    def _best(self):
+        now = time.monotonic()
+        return min(self._entries, key=lambda entry: self._key(entry, now))
+
+    def put(self, job):
+        with self._cond:
+            while self.maxsize > 0 and len(self._entries) >= self.maxsize:
+                self._cond.wait()
+            self._entries.append((job, time.monotonic(), next(self._seq)))
+            self._cond.notify_all()
+
+    def requeue(self, job):
+        """Put back a suspended job. Never blocks, since it frees the GPU it held."""
+        with self._cond:
+            self.preemptions += 1
+            self._entries.append((job, time.monotonic(), next(self._seq)))
+            self._cond.notify_all()
+
+    def get(self):
+        with self._cond:
+            while not self._entries:
+                self._cond.wait()
+            entry = self._best()
+            self._entries.remove(entry)
+            self._cond.notify_all()
+            return entry[0]
+
+    def take_matching(self, predicate, limit):
+        """
+        Remove and return up to `limit` queued jobs for which `predicate(job)`
+        holds, best first, without waiting. Used to fill a DiT batch.
+        """
+        with self._cond:
+            now = time.monotonic()
+            entries = sorted(self._entries, key=lambda entry: self._key(entry, now))
+            taken = [entry for entry in entries if predicate(entry[0])][:limit]
+            for entry in taken:
+                self._entries.remove(entry)
+            if taken:
+                self._cond.notify_all()
+            return [entry[0] for entry in taken]
+
+    def task_done(self):
+        pass
+
+    def qsize(self):
+        with self._cond:
+            return len(self._entries)
+
+    def should_preempt(self, running):
+        """
+        Whether `running` should yield at its current clip boundary: a queued
+        job has a higher priority, or is much cheaper than what is left of it.
+        """
+        with self._cond:
+            if not self._entries:
+                return False
+            best = self._best()[0]
+        priority = running.state.get('priority', 0)
+        best_priority = best.state.get('priority', 0)
+        if best_priority != priority:
+            return best_priority > priority
+        return best.state['remaining_cost'] < self.preempt_ratio * running.state['remaining_cost']
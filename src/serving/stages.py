@@ -0,0 +1,143 @@
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+
+
+class StagedJob:
+    """A unit of work travelling through a `StagedPipeline`."""
+
+    def __init__(self, state):
+        self.state = state
+        self.future = Future()
+        self.jump_to = None
+        self.held = False
+
+    def skip_to(self, stage_name):
+        """Route the job straight to `stage_name` once the current stage returns."""
+        self.jump_to = stage_name
+
+    def hold(self):
+        """Keep the job out of the downstream stage; whoever called this re-queues it."""
+        self.held = True
+
+
+class Stage:
+    """
+    A pipeline stage: a bounded input queue drained by `num_workers` threads.
+
+    `fn(job)` may mutate `job.state`; its return value becomes the job result
+    when this is the last stage. A full queue blocks the upstream stage, so
+    each stage only runs ahead of its successor by `maxsize` jobs.
+    """
+
+    def __init__(self, name, fn, num_workers=1, maxsize=1, job_queue=None):
+        self.name = name
+        self.fn = fn
+        self.num_workers = num_workers
+        # any object with put/get/task_done/qsize/maxsize, e.g. a scheduler
+        self.queue = job_queue if job_queue is not None else queue.Queue(maxsize=maxsize)
+        self.next = None
+        self.pipeline = None
+        self._lock = threading.Lock()
+        self._threads = []
+        self.busy_workers = 0
+        self.busy_seconds = 0.0
+        self.processed = 0
+        self.failed = 0
+        self.held = 0
+        self.started_at = None
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        for i in range(self.num_workers):
+            t = threading.Thread(target=self._loop, name=f"stage-{self.name}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def put(self, job):
+        self.queue.put(job)
+
+    def _loop(self):
+        while True:
+            job = self.queue.get()
+            start = time.perf_counter()
+            with self._lock:
+                self.busy_workers += 1
+            try:
+                result = self.fn(job)
+            except Exception as e:
+                logging.exception(f"stage {self.name} failed")
+                with self._lock:
+                    self.failed += 1
+                job.future.set_exception(e)
+                continue
+            finally:
+                with self._lock:
+                    self.busy_workers -= 1
+                    self.busy_seconds += time.perf_counter() - start
+                self.queue.task_done()
+
+            self.forward(job, result)
+
+    def forward(self, job, result=None):
+        """
+        Hand a job this stage has finished to the next one. `fn` may call this
+        for other jobs it completed alongside its own, e.g. a batch.
+        """
+        if job.held:
+            job.held = False
+            with self._lock:
+                self.held += 1
+            return
+        with self._lock:
+            self.processed += 1
+        target = self.next
+        if job.jump_to is not None:
+            target = self.pipeline.stages[job.jump_to]
+            job.jump_to = None
+        if target is None:
+            job.future.set_result(result)
+        else:
+            target.put(job)
+
+    def stats(self):
+        with self._lock:
+            uptime = time.perf_counter() - self.started_at if self.started_at else 0.0
+            return {
+                "queue_depth": self.queue.qsize(),
+                "queue_capacity": self.queue.maxsize,
+                "busy_workers": self.busy_workers,
+                "num_workers": self.num_workers,
+                "processed": self.processed,
+                "failed": self.failed,
+                "held": self.held,
+                "busy_seconds": self.busy_seconds,
+                # fraction of worker time spent inside `fn` since start
+                "occupancy": self.busy_seconds / (uptime * self.num_workers) if uptime else 0.0,
+            }
+
+
+class StagedPipeline:
+    """Chains `Stage`s so consecutive jobs overlap, e.g. CPU prep / GPU / upload."""
+
+    def __init__(self, stages):
+        self.stages = {}
+        for stage in stages:
+            stage.pipeline = self
+            self.stages[stage.name] = stage
+        for upstream, downstream in zip(stages, stages[1:]):
+            upstream.next = downstream
+        self.head = stages[0]
+        for stage in stages:
+            stage.start()
+
+    def submit(self, state):
+        """Enqueue a job and return a `Future` resolved by the last stage."""
+        job = StagedJob(state)
+        self.head.put(job)
+        return job.future
+
+    def stats(self):
+        return {name: stage.stats() for name, stage in self.stages.items()}
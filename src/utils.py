@@ -57,4 +57,63 @@ def init_weights_on_device(device=torch.device("meta"), include_buffers: bool =
             torch_function_name,
             old_torch_function,
         ) in tensor_constructors_to_patch.items():
-            setattr(torch, torch_function_name, old_torch_function)
\ No newline at end of file
+            setattr(torch, torch_function_name, old_torch_function)
+
+class HostCopy:
+    """
+    The host tensors of a module from before it was moved to the GPU. Weights
+    are not written during inference, so moving the module back can re-point
+    its parameters at these tensors instead of copying into fresh host memory:
+    no device-to-host copy, and weights that live in pages shared between
+    processes stay shared. Tensors written in place since `mark` (checked via
+    their version counter) make `restore` refuse.
+    """
+
+    def __init__(self, module):
+        self.entries = []
+        for owner in module.modules():
+            for name, param in owner._parameters.items():
+                if param is not None:
+                    self.entries.append((owner._parameters, name, param.data))
+            for name, buf in owner._buffers.items():
+                if buf is not None:
+                    self.entries.append((owner._buffers, name, buf))
+        self.versions = None
+
+    def mark(self):
+        self.versions = [tensors[name]._version for tensors, name, _ in self.entries]
+
+    def restore(self):
+        current = [tensors.get(name) for tensors, name, _ in self.entries]
+        if any(t is None or t._version != v for t, v in zip(current, self.versions)):
+            return False
+        for tensors, name, host in self.entries:
+            if isinstance(tensors[name], torch.nn.Parameter):
+                tensors[name].data = host
+            else:
+                tensors[name] = host
+        return True
+
+
+def onload(module, device, dtype=None, keep_host=True):
+    """
+    `module.to(device, dtype)`, remembering the host tensors for `offload`.
+    Pass `keep_host=False` when the module will not be offloaded again, so the
+    host copy can be freed.
+    """
+    host = None
+    if keep_host and "_host_copy" not in module.__dict__ and any(p.device.type == "cpu" for p in module.parameters()):
+        host = HostCopy(module)
+    module.to(device=device, **({"dtype": dtype} if dtype is not None else {}))
+    if host is not None:
+        host.mark()
+        module.__dict__["_host_copy"] = host
+    return module
+
+
+def offload(module, device="cpu", dtype=None):
+    """Undo `onload`, re-using the host tensors when the weights are unchanged."""
+    host = module.__dict__.pop("_host_copy", None)
+    if host is None or not host.restore():
+        module.to(device=device, **({"dtype": dtype} if dtype is not None else {}))
+    return module
@@ -2,7 +2,7 @@ import copy
 
 import torch
 
-from src.utils import init_weights_on_device
+from src.utils import init_weights_on_device, onload, offload
 import optimum.quanto.nn.qlinear as qlinear
 
 def cast_to(weight, dtype, device):
@@ -44,7 +44,7 @@ class AutoWrappedModule(torch.nn.Module):
             self.offload_dtype != self.onload_dtype
             or self.offload_device != self.onload_device
         ):
-            self.module.to(dtype=self.offload_dtype, device=self.offload_device)
+            offload(self.module, self.offload_device, self.offload_dtype)
             self.state = 0
 
     def onload(self):
@@ -52,7 +52,7 @@ class AutoWrappedModule(torch.nn.Module):
             self.offload_dtype != self.onload_dtype
             or self.offload_device != self.onload_device
         ):
-            self.module.to(dtype=self.onload_dtype, device=self.onload_device)
+            onload(self.module, self.onload_device, self.onload_dtype)
             self.state = 1
 
     def forward(self, *args, **kwargs):
@@ -159,7 +159,7 @@ class AutoWrappedLinear(torch.nn.Linear):
             self.offload_dtype != self.onload_dtype
             or self.offload_device != self.onload_device
         ):
-            self.to(dtype=self.offload_dtype, device=self.offload_device)
+            offload(self, self.offload_device, self.offload_dtype)
             self.state = 0
 
     def onload(self):
@@ -167,7 +167,7 @@ class AutoWrappedLinear(torch.nn.Linear):
             self.offload_dtype != self.onload_dtype
             or self.offload_device != self.onload_device
         ):
-            self.to(dtype=self.onload_dtype, device=self.onload_device)
+            onload(self, self.onload_device, self.onload_dtype)
             self.state = 1
 
     def forward(self, x, *args, **kwargs):
@@ -0,0 +1,96 @@
+import os
+import re
+import shutil
+import weakref
+import tempfile
+
+# tmpfs on Linux; intermediates never touch the (possibly network) disk
+_SHM_ROOT = '/dev/shm'
+# containers often cap /dev/shm at 64 MB, too small for a job's video and audio
+_SHM_MIN_FREE = 1 << 30
+
+
+def default_root():
+    """
+    `INFINITETALK_WORKSPACE_ROOT`, else /dev/shm when writable with at least
+    1 GiB free, else the system temp dir.
+    """
+    root = os.getenv('INFINITETALK_WORKSPACE_ROOT')
+    if root:
+        return root
+    if os.path.isdir(_SHM_ROOT) and os.access(_SHM_ROOT, os.W_OK):
+        if shutil.disk_usage(_SHM_ROOT).free >= _SHM_MIN_FREE:
+            return _SHM_ROOT
+    return tempfile.gettempdir()
+
+
+def job_path(root, name):
+    """
+    `<root>/<name>` for a job-supplied `name`, with characters other than
+    letters, digits, `.`, `_` and `-` replaced. Raises ValueError for names
+    that would resolve to `root` itself or outside it, which removing the
+    directory must never touch.
+    """
+    name = re.sub(r'[^\w.-]', '_', str(name))
+    if not name.strip('.'):
+        raise ValueError(f"invalid job name {name!r}")
+    path = os.path.join(root, name)
+    real_root, real_path = os.path.realpath(root), os.path.realpath(path)
+    if real_path == real_root or os.path.commonpath([real_root, real_path]) != real_root:
+        raise ValueError(f"job name {name!r} resolves outside {root}")
+    return path
+
+
+class Workspace:
+    """
+    Private scratch directory for the intermediates of one job (converted
+    inputs, mixed audio, mux temp files, scene cuts), on tmpfs by default.
+
+    With a `name` the directory is `<root>/<name>`, so a retried job finds the
+    same paths; without one it is unique. Everything is removed by `close()`,
+    on leaving a `with` block, or when the object is garbage collected,
+    unless `keep` is set (for inspecting intermediates).
+    """
+
+    def __init__(self, name=None, root=None, keep=False):
+        root = root or default_root()
+        os.makedirs(root, exist_ok=True)
+        if name is None:
+            self.path = tempfile.mkdtemp(prefix='infinitetalk-', dir=root)
+        else:
+            self.path = job_path(root, name)
+            os.makedirs(self.path, exist_ok=True)
+        if keep:
+            self._finalizer = weakref.finalize(self, lambda: None)
+        else:
+            self._finalizer = weakref.finalize(self, shutil.rmtree, self.path, ignore_errors=True)
+
+    def file(self, name):
+        """Path of `name` inside the workspace; parent directories are created."""
+        path = os.path.join(self.path, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def dir(self, name):
+        path = os.path.join(self.path, name)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def close(self):
+        self._finalizer()
+
+    @property
+    def closed(self):
+        return not self._finalizer.alive
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __fspath__(self):
+        return self.path
+
+    def __repr__(self):
+        return f"Workspace({self.path!r})"
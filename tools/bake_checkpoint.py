@@ -0,0 +1,56 @@
+"""
+Bake the InfiniteTalk DiT once instead of on every cold start: merge the Wan
+shards with the InfiniteTalk weights, cast, apply the LoRAs and (with
+--quant) load the quantized model or quantize the merged one, then write the
+result to --fused_dir.
+
+Takes the same weight arguments as generate_infinitetalk.py, e.g.
+
+    python tools/bake_checkpoint.py --ckpt_dir weights/Wan2.1-I2V-14B-480P \\
+        --infinitetalk_dir weights/InfiniteTalk/single/infinitetalk.safetensors \\
+        --lora_dir weights/lora.safetensors --lora_scale 1.0 --fused_dir weights/fused
+
+`InfiniteTalkPipeline(fused_dir=...)` loads the artifact only while its
+manifest matches those arguments and the files on disk.
+"""
+import os
+import sys
+import logging
+
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import generate_infinitetalk as gen
+from wan.configs import WAN_CONFIGS
+from wan.multitalk import dit_inputs, load_dit
+from wan.utils.fused_checkpoint import FusedCheckpoint
+
+
+def main(argv=None):
+    args = gen._parse_args(argv)
+    if args.fused_dir is None:
+        raise SystemExit("--fused_dir is required")
+    gen._init_logging(0)
+    param_dtype = WAN_CONFIGS[args.task].param_dtype
+    files, settings = dit_inputs(args.ckpt_dir, args.quant, args.quant_dir, args.dit_path, args.infinitetalk_dir,
+                                 args.lora_dir, args.lora_scale, param_dtype)
+    if args.quant is not None and args.quant_dir is None:
+        # quantized at load time: load_dit bakes it into fused_dir/quant-<quant> itself
+        load_dit(args.ckpt_dir, param_dtype, quant=args.quant, infinitetalk_dir=args.infinitetalk_dir,
+                 dit_path=args.dit_path, lora_dir=args.lora_dir, lora_scales=args.lora_scale,
+                 lora_device='cuda' if torch.cuda.is_available() else 'cpu', fused_dir=args.fused_dir)
+        return
+    fused = FusedCheckpoint(args.fused_dir)
+    if fused.matches(files, settings):
+        logging.info(f"{args.fused_dir} is up to date")
+        return
+    # no fused_dir here, or a stale artifact would be loaded back
+    model = load_dit(args.ckpt_dir, param_dtype, quant=args.quant, quant_dir=args.quant_dir, dit_path=args.dit_path,
+                     infinitetalk_dir=args.infinitetalk_dir, lora_dir=args.lora_dir, lora_scales=args.lora_scale,
+                     lora_device='cuda' if torch.cuda.is_available() else 'cpu')
+    fused.save(model, files, settings)
+
+
+if __name__ == "__main__":
+    main()
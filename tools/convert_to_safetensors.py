@@ -0,0 +1,41 @@
+"""
+Convert the pickled .pth checkpoints (T5, CLIP, VAE) of a Wan checkpoint
+directory to safetensors, once. The converted file sits next to the original
+with the same stem; `wan.utils.weight_loader.load_checkpoint` prefers it, so
+the components are mmapped instead of unpickled.
+
+    python tools/convert_to_safetensors.py weights/Wan2.1-I2V-14B-480P [more dirs or .pth files]
+"""
+import os
+import sys
+import glob
+import time
+
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wan.utils.weight_loader import save_safetensors, safetensors_path
+
+
+def convert(path):
+    target = safetensors_path(path)
+    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+        print(f"✓ {target} up to date", flush=True)
+        return
+    start = time.perf_counter()
+    state_dict = torch.load(path, map_location='cpu', weights_only=True)
+    save_safetensors(state_dict, target)
+    print(f"✓ {path} -> {target} in {time.perf_counter() - start:.1f}s", flush=True)
+
+
+def main(paths):
+    for path in paths:
+        for pth in sorted(glob.glob(os.path.join(path, '*.pth'))) if os.path.isdir(path) else [path]:
+            convert(pth)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        raise SystemExit(__doc__)
+    main(sys.argv[1:])
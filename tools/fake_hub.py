@@ -0,0 +1,119 @@
+"""
+Local stand-in for the two Hugging Face Hub endpoints bootstrap.py uses, to
+try it without the network:
+
+    python tools/fake_hub.py /tmp/hub --port 8123 --fail-every 3 &
+    HF_ENDPOINT=http://127.0.0.1:8123 RUNPOD_VOLUME=/tmp/vol python bootstrap.py
+
+Repo `org/name` at revision `main` is served from /tmp/hub/org/name, any
+other revision from /tmp/hub/org/name@<revision with / replaced by _>.
+Files above --lfs-threshold are listed as LFS files (sha256), the others by
+git blob id. --fail-every N cuts every Nth download off halfway, to exercise
+resuming.
+"""
+import os
+import sys
+import json
+import hashlib
+import argparse
+import itertools
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeHub(BaseHTTPRequestHandler):
+    root = None
+    lfs_threshold = 1 << 20
+    fail_every = 0
+    _downloads = itertools.count(1)
+    _commits = {}
+    _lock = threading.Lock()
+
+    def _repo_dir(self, repo, revision):
+        suffix = '' if revision == 'main' else '@' + revision.replace('/', '_')
+        return os.path.join(self.root, repo + suffix)
+
+    def _listing(self, repo_dir):
+        siblings = []
+        for dirpath, _, names in os.walk(repo_dir):
+            for name in sorted(names):
+                path = os.path.join(dirpath, name)
+                with open(path, 'rb') as f:
+                    data = f.read()
+                entry = {'rfilename': os.path.relpath(path, repo_dir).replace(os.sep, '/'), 'size': len(data),
+                         'blobId': hashlib.sha1(b'blob %d\0' % len(data) + data).hexdigest()}
+                if len(data) > self.lfs_threshold:
+                    entry['lfs'] = {'size': len(data), 'sha256': hashlib.sha256(data).hexdigest()}
+                siblings.append(entry)
+        return siblings
+
+    def do_GET(self):
+        path = urllib.parse.urlparse(self.path).path
+        parts = path.strip('/').split('/')
+        if parts[:2] == ['api', 'models'] and len(parts) == 6 and parts[4] == 'revision':
+            repo, revision = '/'.join(parts[2:4]), urllib.parse.unquote(parts[5])
+            repo_dir = self._repo_dir(repo, revision)
+            if not os.path.isdir(repo_dir):
+                return self.send_error(404)
+            commit = hashlib.sha1(f'{repo}@{revision}'.encode()).hexdigest()
+            with self._lock:
+                self._commits[commit] = revision
+            body = json.dumps({'sha': commit, 'siblings': self._listing(repo_dir)}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif len(parts) > 4 and parts[2] == 'resolve':
+            repo, commit = '/'.join(parts[:2]), urllib.parse.unquote(parts[3])
+            revision = self._commits.get(commit, commit)
+            file_path = os.path.join(self._repo_dir(repo, revision), urllib.parse.unquote('/'.join(parts[4:])))
+            if not os.path.isfile(file_path):
+                return self.send_error(404)
+            self._send_file(file_path)
+        else:
+            self.send_error(404)
+
+    def _send_file(self, file_path):
+        size = os.path.getsize(file_path)
+        start = 0
+        ranged = self.headers.get('Range', '')
+        if ranged.startswith('bytes='):
+            start = int(ranged[len('bytes='):].split('-')[0])
+            if start >= size:
+                return self.send_error(416)
+        length = size - start
+        self.send_response(206 if start else 200)
+        if start:
+            self.send_header('Content-Range', f'bytes {start}-{size - 1}/{size}')
+        self.send_header('Content-Length', str(length))
+        self.end_headers()
+        cut = self.fail_every and next(self._downloads) % self.fail_every == 0
+        with open(file_path, 'rb') as f:
+            f.seek(start)
+            self.wfile.write(f.read(length // 2 if cut else length))
+        if cut:
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        sys.stderr.write(f"{self.command} {self.path} {args[1] if len(args) > 1 else ''}\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('root')
+    parser.add_argument('--port', type=int, default=8123)
+    parser.add_argument('--lfs-threshold', type=int, default=1 << 20)
+    parser.add_argument('--fail-every', type=int, default=0)
+    args = parser.parse_args(argv)
+    FakeHub.root = os.path.abspath(args.root)
+    FakeHub.lfs_threshold = args.lfs_threshold
+    FakeHub.fail_every = args.fail_every
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), FakeHub)
+    print(f"serving {FakeHub.root} on http://127.0.0.1:{args.port}", flush=True)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
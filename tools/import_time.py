@@ -0,0 +1,89 @@
+"""
+Import-time benchmark for the worker's start-up path, based on `python -X importtime`.
+
+    python tools/import_time.py                 # check the budgets below
+    python tools/import_time.py --top 30        # and list the 30 slowest imports of each target
+    python tools/import_time.py --wan-budget 5 --handler-budget 1
+
+Each target is imported in a fresh interpreter `--repeat` times and the
+fastest run is compared with its budget (cumulative import time of the
+top-level module). Modules that a single-GPU InfiniteTalk job never uses must
+not be imported at all. Exits non-zero on any violation.
+"""
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+# only needed for multi-GPU, TTS or scene-segmentation runs
+NOT_AT_STARTUP = ('xfuser', 'xformers', 'kokoro', 'scenedetect', 'moviepy', 'librosa', 'decord', 'skimage')
+
+TARGETS = {
+    # name: (statement, default budget in seconds, modules that must stay unimported)
+    'wan': ('import wan', 8.0, NOT_AT_STARTUP),
+    'generate_infinitetalk': ('import generate_infinitetalk', 10.0, NOT_AT_STARTUP),
+    'handler': ('import handler', 1.5, NOT_AT_STARTUP + ('torch', 'wan')),
+}
+
+
+def profile(statement):
+    """[(self_us, cumulative_us, depth, module)] in import order."""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement], cwd=ROOT,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"`{statement}` failed:\n{proc.stderr[-4000:]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append((int(self_us), int(cumulative_us), len(indent) // 2, module))
+    return rows
+
+
+def check(name, statement, budget, forbidden, repeat, top):
+    runs = [profile(statement) for _ in range(repeat)]
+    target = statement.split()[-1]
+
+    def total(rows):
+        return next(cum for _, cum, depth, module in rows if depth == 0 and module == target) / 1e6
+
+    rows = min(runs, key=total)
+    seconds = total(rows)
+    imported = {module for *_, module in rows}
+    leaked = sorted(m for m in imported if m.split('.')[0] in forbidden)
+
+    ok = seconds <= budget and not leaked
+    print(f"{'OK  ' if ok else 'FAIL'} {name}: {seconds:.2f}s (budget {budget:.2f}s), {len(imported)} modules")
+    if leaked:
+        print(f"     imports {', '.join(leaked[:10])}{' ...' if len(leaked) > 10 else ''}")
+    if top:
+        for self_us, cum_us, depth, module in sorted(rows, key=lambda r: -r[1])[:top]:
+            print(f"     {cum_us / 1e3:9.1f} ms cumulative {self_us / 1e3:8.1f} ms self  {'  ' * depth}{module}")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    for name, (_, budget, _) in TARGETS.items():
+        parser.add_argument(f"--{name.replace('_', '-')}-budget", type=float, default=budget, dest=f"{name}_budget")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--top', type=int, default=0, help='list the N slowest imports of each target')
+    parser.add_argument('--only', nargs='+', choices=list(TARGETS), help='check only these targets')
+    args = parser.parse_args(argv)
+
+    ok = True
+    for name, (statement, _, forbidden) in TARGETS.items():
+        if args.only and name not in args.only:
+            continue
+        ok &= check(name, statement, getattr(args, f"{name}_budget"), forbidden, args.repeat, args.top)
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,29 @@
-from . import configs, distributed, modules
-from .first_last_frame2video import WanFLF2V
-from .image2video import WanI2V
-from .text2video import WanT2V
-from .vace import WanVace, WanVaceMP
-from .multitalk import InfiniteTalkPipeline
+import importlib
+
+from . import configs
+
+# Pipelines and subpackages are imported on first access, so `import wan` and
+# a single-GPU InfiniteTalk job only load the modules they use.
+_LAZY = {
+    'WanFLF2V': '.first_last_frame2video',
+    'WanI2V': '.image2video',
+    'WanT2V': '.text2video',
+    'WanVace': '.vace',
+    'WanVaceMP': '.vace',
+    'InfiniteTalkPipeline': '.multitalk',
+    'GenerationState': '.multitalk',
+}
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        value = getattr(importlib.import_module(_LAZY[name], __name__), name)
+    else:
+        try:
+            value = importlib.import_module(f'.{name}', __name__)
+        except ModuleNotFoundError as e:
+            if e.name != f'{__name__}.{name}':
+                raise
+            raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+    globals()[name] = value
+    return value
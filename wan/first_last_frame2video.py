@@ -21,6 +21,7 @@ from .modules.clip import CLIPModel
 from .modules.model import WanModel
 from .modules.t5 import T5EncoderModel
 from .modules.vae import WanVAE
+from .utils.component_registry import build_component
 from .utils.fm_solvers import (
     FlowDPMSolverMultistepScheduler,
     get_sampling_sigmas,
@@ -42,6 +43,7 @@ class WanFLF2V:
         use_usp=False,
         t5_cpu=False,
         init_on_cpu=True,
+        registry=None,
     ):
         r"""
         Initializes the image-to-video generation model components.
@@ -65,6 +67,9 @@ class WanFLF2V:
                 Whether to place T5 model on CPU. Only works without t5_fsdp.
             init_on_cpu (`bool`, *optional*, defaults to True):
                 Enable initializing Transformer Model on CPU. Only works without FSDP or USP.
+            registry (`ComponentRegistry`, *optional*, defaults to None):
+                Shares the T5, VAE and CLIP with other pipelines built from the same
+                checkpoints, see `wan.utils.component_registry`.
         """
         self.device = torch.device(f"cuda:{device_id}")
         self.config = config
@@ -76,7 +81,8 @@ class WanFLF2V:
         self.param_dtype = config.param_dtype
 
         shard_fn = partial(shard_model, device_id=device_id)
-        self.text_encoder = T5EncoderModel(
+        self.text_encoder = build_component(
+            registry, T5EncoderModel, self,
             text_len=config.text_len,
             dtype=config.t5_dtype,
             device=torch.device('cpu'),
@@ -87,11 +93,13 @@ class WanFLF2V:
 
         self.vae_stride = config.vae_stride
         self.patch_size = config.patch_size
-        self.vae = WanVAE(
+        self.vae = build_component(
+            registry, WanVAE, self,
             vae_pth=os.path.join(checkpoint_dir, config.vae_checkpoint),
             device=self.device)
 
-        self.clip = CLIPModel(
+        self.clip = build_component(
+            registry, CLIPModel, self,
             dtype=config.clip_dtype,
             device=self.device,
             checkpoint_path=os.path.join(checkpoint_dir,
@@ -1,9 +1,4 @@
-from .attention import flash_attention
-from .model import WanModel
-from .t5 import T5Decoder, T5Encoder, T5EncoderModel, T5Model
-from .tokenizers import HuggingfaceTokenizer
-from .vace_model import VaceWanModel
-from .vae import WanVAE
+import importlib
 
 __all__ = [
     'WanVAE',
@@ -16,3 +11,24 @@ __all__ = [
     'HuggingfaceTokenizer',
     'flash_attention',
 ]
+
+# imported on first access, see wan/__init__.py
+_LAZY = {
+    'flash_attention': '.attention',
+    'WanModel': '.model',
+    'T5Decoder': '.t5',
+    'T5Encoder': '.t5',
+    'T5EncoderModel': '.t5',
+    'T5Model': '.t5',
+    'HuggingfaceTokenizer': '.tokenizers',
+    'VaceWanModel': '.vace_model',
+    'WanVAE': '.vae',
+}
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY[name], __name__), name)
+    globals()[name] = value
+    return value
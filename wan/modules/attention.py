@@ -3,12 +3,6 @@ import torch
 import torch.nn as nn
 from einops import rearrange, repeat
 from ..utils.multitalk_utils import RotaryPositionalEmbedding1D, normalize_and_scale, split_token_counts_and_frame_ids
-from xfuser.core.distributed import (
-    get_sequence_parallel_rank,
-    get_sequence_parallel_world_size,
-    get_sp_group,
-)
-import xformers.ops
 
 try:
     import flash_attn_interface
@@ -154,7 +148,7 @@ def attention(
     dtype=torch.bfloat16,
     fa_version=None,
 ):
-    if FLASH_ATTN_2_AVAILABLE or FLASH_ATTN_3_AVAILABLE:
+    if (FLASH_ATTN_2_AVAILABLE or FLASH_ATTN_3_AVAILABLE) and q.device.type == 'cuda':
         return flash_attention(
             q=q,
             k=k,
@@ -254,16 +248,25 @@ class SingleStreamAttention(nn.Module):
         encoder_k = rearrange(encoder_k, "B H M K -> B M H K")
         encoder_v = rearrange(encoder_v, "B H M K -> B M H K")
 
-        if enable_sp:
-            # context parallel
-            sp_size = get_sequence_parallel_world_size()
-            sp_rank = get_sequence_parallel_rank()
-            visual_seqlen, _ = split_token_counts_and_frame_ids(N_t, N_h * N_w, sp_size, sp_rank)
-            assert kv_seq is not None, f"kv_seq should not be None."
-            attn_bias = xformers.ops.fmha.attn_bias.BlockDiagonalMask.from_seqlens(visual_seqlen, kv_seq)
+        if x.device.type != 'cuda' and not enable_sp:
+            # xformers has no CPU kernels; lets reduced-size models run on the CPU
+            x = torch.nn.functional.scaled_dot_product_attention(
+                q.transpose(1, 2), encoder_k.transpose(1, 2), encoder_v.transpose(1, 2)).transpose(1, 2)
         else:
-            attn_bias = None
-        x = xformers.ops.memory_efficient_attention(q, encoder_k, encoder_v, attn_bias=attn_bias, op=None,)
+            # imported on first use: xformers is slow to import and xfuser only matters for multi-GPU runs
+            import xformers.ops
+
+            if enable_sp:
+                # context parallel
+                from xfuser.core.distributed import get_sequence_parallel_rank, get_sequence_parallel_world_size
+                sp_size = get_sequence_parallel_world_size()
+                sp_rank = get_sequence_parallel_rank()
+                visual_seqlen, _ = split_token_counts_and_frame_ids(N_t, N_h * N_w, sp_size, sp_rank)
+                assert kv_seq is not None, f"kv_seq should not be None."
+                attn_bias = xformers.ops.fmha.attn_bias.BlockDiagonalMask.from_seqlens(visual_seqlen, kv_seq)
+            else:
+                attn_bias = None
+            x = xformers.ops.memory_efficient_attention(q, encoder_k, encoder_v, attn_bias=attn_bias, op=None,)
         x = rearrange(x, "B M H K -> B H M K") 
 
         # linear transform
@@ -377,6 +380,7 @@ class SingleStreamMutiAttention(SingleStreamAttention):
         q = rearrange(q, "B H M K -> B M H K")
         encoder_k = rearrange(encoder_k, "B H M K -> B M H K")
         encoder_v = rearrange(encoder_v, "B H M K -> B M H K")
+        import xformers.ops
         x = xformers.ops.memory_efficient_attention(q, encoder_k, encoder_v, attn_bias=None, op=None,)
         x = rearrange(x, "B M H K -> B H M K")
 
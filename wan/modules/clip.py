@@ -11,6 +11,7 @@ import torchvision.transforms as T
 from .attention import flash_attention
 from .tokenizers import HuggingfaceTokenizer
 from .xlm_roberta import XLMRoberta
+from ..utils.weight_loader import load_checkpoint
 
 __all__ = [
     'XLMRobertaCLIP',
@@ -512,11 +513,10 @@ class CLIPModel:
             return_transforms=True,
             return_tokenizer=False,
             dtype=dtype,
-            device=device)
-        self.model = self.model.eval().requires_grad_(False)
+            device='meta')
         logging.info(f'loading {checkpoint_path}')
-        self.model.load_state_dict(
-            torch.load(checkpoint_path, map_location='cpu'))
+        self.model.load_state_dict(load_checkpoint(checkpoint_path), assign=True)
+        self.model = self.model.to(dtype=dtype, device=device).eval().requires_grad_(False)
 
         # init tokenizer
         self.tokenizer = HuggingfaceTokenizer(
@@ -11,7 +11,7 @@ from einops import rearrange
 from diffusers import ModelMixin
 from diffusers.configuration_utils import ConfigMixin, register_to_config
 
-from .attention import flash_attention, SingleStreamMutiAttention
+from .attention import attention, SingleStreamMutiAttention
 from ..utils.multitalk_utils import get_attn_map_with_target
 import logging
 try:
@@ -154,7 +154,7 @@ class WanSelfAttention(nn.Module):
         if USE_SAGEATTN:
             x = sageattn(q.to(torch.bfloat16), k.to(torch.bfloat16), v, tensor_layout='NHD')
         else:
-            x = flash_attention(
+            x = attention(
                 q=q,
                 k=k,
                 v=v,
@@ -165,6 +165,9 @@ class WanSelfAttention(nn.Module):
         # output
         x = x.flatten(2)
         x = self.o(x)
+        if ref_target_masks is None:
+            # only the multi-speaker audio attention reads the map
+            return x, None
         with torch.no_grad():
             x_ref_attn_map = get_attn_map_with_target(q.type_as(x), k.type_as(x), grid_sizes[0], 
                                                     ref_target_masks=ref_target_masks)
@@ -201,9 +204,9 @@ class WanI2VCrossAttention(WanSelfAttention):
             img_x = sageattn(q, k_img, v_img, tensor_layout='NHD')
             x = sageattn(q, k, v, tensor_layout='NHD')
         else:   
-            img_x = flash_attention(q, k_img, v_img, k_lens=None)
+            img_x = attention(q, k_img, v_img, k_lens=None)
             # compute attention
-            x = flash_attention(q, k, v, k_lens=context_lens)
+            x = attention(q, k, v, k_lens=context_lens)
 
         # output
         x = x.flatten(2)
@@ -595,6 +598,34 @@ class WanModel(ModelMixin, ConfigMixin):
     def disable_teacache(self):
         self.enable_teacache = False
 
+    def teacache_state(self):
+        """
+        TeaCache state to carry across a clip boundary. With three forwards per
+        step a clip ends on a full cycle (`cnt` back at 0) and every branch is
+        recomputed during the first `ret_steps` calls of the next clip, so the
+        counters suffice. Otherwise, e.g. with two forwards per step when the
+        text guide scale is 1, the next clip reads the cached modulated inputs
+        and residuals, so they are included, on the host.
+        """
+        if not getattr(self, 'enable_teacache', False):
+            return None
+        names = ['cnt', 'accumulated_rel_l1_distance_cond',
+                 'accumulated_rel_l1_distance_drop_text',
+                 'accumulated_rel_l1_distance_uncond']
+        if getattr(self, 'cnt', 0) != 0:
+            names += [f'{prefix}_{branch}' for prefix in ('previous_e0', 'previous_residual')
+                      for branch in ('cond', 'drop_text', 'uncond')]
+        state = {name: getattr(self, name) for name in names if getattr(self, name, None) is not None}
+        return {name: value.cpu() if isinstance(value, torch.Tensor) else value for name, value in state.items()}
+
+    def load_teacache_state(self, state, device=None):
+        if state is None:
+            return
+        for name, value in state.items():
+            if isinstance(value, torch.Tensor) and device is not None:
+                value = value.to(device)
+            setattr(self, name, value)
+
     def forward(
             self,
             x,
@@ -608,6 +639,11 @@ class WanModel(ModelMixin, ConfigMixin):
         ):
         assert clip_fea is not None and y is not None
 
+        # More than one latent means a batch of independent single-speaker
+        # jobs of the same size: `context`, `clip_fea`, `y` and `audio` then
+        # hold one entry per job along dim 0 instead of one per speaker.
+        batched = len(x) > 1
+
         _, T, H, W = x[0].shape
         N_t = T // self.patch_size[0]
         N_h = H // self.patch_size[1]
@@ -615,7 +651,7 @@ class WanModel(ModelMixin, ConfigMixin):
 
         if y is not None:
             x = [torch.cat([u, v], dim=0) for u, v in zip(x, y)]
-        x[0] = x[0].to(context[0].dtype)
+        x = [u.to(context[0].dtype) for u in x]
 
         # embeddings
         x = [self.patch_embedding(u.unsqueeze(0)) for u in x]
@@ -664,11 +700,18 @@ class WanModel(ModelMixin, ConfigMixin):
         latter_middle_frame_audio_emb = rearrange(latter_middle_frame_audio_emb, "b n_t n w s c -> b n_t (n w) s c") 
         latter_frame_audio_emb_s = torch.concat([latter_first_frame_audio_emb, latter_middle_frame_audio_emb, latter_last_frame_audio_emb], dim=2) 
         audio_embedding = self.audio_proj(first_frame_audio_emb_s, latter_frame_audio_emb_s) 
-        human_num = len(audio_embedding)
-        audio_embedding = torch.concat(audio_embedding.split(1), dim=2).to(x.dtype)
+        if batched:
+            # one speaker per job: the audio attention runs per (job, latent frame)
+            human_num = 1
+            audio_embedding = audio_embedding.flatten(0, 1).to(x.dtype)
+            ref_target_masks = None
+        else:
+            human_num = len(audio_embedding)
+            audio_embedding = torch.concat(audio_embedding.split(1), dim=2).to(x.dtype)
 
 
         # convert ref_target_masks to token_ref_target_masks
+        token_ref_target_masks = None
         if ref_target_masks is not None:
             ref_target_masks = ref_target_masks.unsqueeze(0).to(torch.float32) 
             token_ref_target_masks = nn.functional.interpolate(ref_target_masks, size=(N_h, N_w), mode='nearest') 
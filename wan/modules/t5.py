@@ -2,17 +2,16 @@
 # Copyright 2024-2025 The Alibaba Wan Team Authors. All rights reserved.
 import logging
 import math
-import json
 import os
 
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
-from safetensors.torch import load_file
-from optimum.quanto import quantize, freeze, qint8,requantize
-
 from .tokenizers import HuggingfaceTokenizer
+from ..utils.weight_loader import load_checkpoint
+from ..utils.quantize import T5_KEEP, quantize_model, load_quantized
+from ..utils.fused_checkpoint import FusedCheckpoint
 
 __all__ = [
     'T5Model',
@@ -485,8 +484,14 @@ class T5EncoderModel:
         tokenizer_path=None,
         shard_fn=None,
         quant=None,
-        quant_dir=None
+        quant_dir=None,
+        quant_cache_dir=None
     ):
+        """
+        With `quant` the encoder is loaded from the pre-quantized files in
+        `quant_dir`, or, without one, quantized at load time following
+        `T5_KEEP` and cached in `quant_cache_dir` if given.
+        """
         assert quant is None or quant in ("int8", "fp8")
         self.text_len = text_len
         self.dtype = dtype
@@ -496,25 +501,31 @@ class T5EncoderModel:
 
         # init model
         logging.info(f'loading {checkpoint_path}')
-        if quant is not None:
-            with torch.device('meta'):
-                model = umt5_xxl(
-                    encoder_only=True,
-                    return_tokenizer=False,
-                    dtype=dtype,
-                    device=torch.device('meta'))
-            logging.info(f'Loading quantized T5 from {os.path.join(quant_dir, f"t5_{quant}.safetensors")}')
-            model_state_dict = load_file(os.path.join(quant_dir, f"t5_{quant}.safetensors"))
-            with open(os.path.join(quant_dir, f"t5_map_{quant}.json"), "r") as f:
-                quantization_map = json.load(f)
-            requantize(model, model_state_dict, quantization_map, device='cpu')
-        else:
+        with torch.device('meta'):
             model = umt5_xxl(
                 encoder_only=True,
                 return_tokenizer=False,
                 dtype=dtype,
-                device=device).eval().requires_grad_(False)
-            model.load_state_dict(torch.load(checkpoint_path, map_location='cpu'))
+                device=torch.device('meta'))
+        cache = None
+        if quant is not None and quant_dir is None and quant_cache_dir is not None:
+            cache = FusedCheckpoint(quant_cache_dir, weights_name=f't5_{quant}.safetensors')
+            cache_inputs = [checkpoint_path]
+            cache_settings = {'dtype': str(dtype), 'quant': quant, 'quant_keep': list(T5_KEEP)}
+        if quant is not None and quant_dir is not None:
+            logging.info(f'Loading quantized T5 from {os.path.join(quant_dir, f"t5_{quant}.safetensors")}')
+            load_quantized(model, os.path.join(quant_dir, f"t5_{quant}.safetensors"),
+                           os.path.join(quant_dir, f"t5_map_{quant}.json"))
+        elif cache is not None and cache.matches(cache_inputs, cache_settings):
+            logging.info(f'Loading quantized T5 from {cache.weights_path}')
+            load_quantized(model, cache.weights_path, cache.quant_map_path)
+        else:
+            model.load_state_dict(load_checkpoint(checkpoint_path), assign=True)
+            model = model.to(dtype=dtype)
+            if quant is not None:
+                quantize_model(model, quant, T5_KEEP)
+                if cache is not None:
+                    cache.save(model, cache_inputs, cache_settings)
         self.model = model
         self.model.eval().requires_grad_(False)
         if shard_fn is not None:
@@ -7,6 +7,8 @@ import torch.nn as nn
 import torch.nn.functional as F
 from einops import rearrange
 
+from ..utils.weight_loader import load_checkpoint
+
 __all__ = [
     'WanVAE',
 ]
@@ -610,8 +612,7 @@ def _video_vae(pretrained_path=None, z_dim=None, device='cpu', **kwargs):
 
     # load checkpoint
     logging.info(f'loading {pretrained_path}')
-    model.load_state_dict(
-        torch.load(pretrained_path, map_location=device), assign=True)
+    model.load_state_dict(load_checkpoint(pretrained_path), assign=True)
 
     return model
 
@@ -1,6 +1,6 @@
 # Copyright 2024-2025 The Alibaba Wan Team Authors. All rights reserved.
 import gc
-from inspect import ArgSpec
+import hashlib
 import logging
 import json
 import math
@@ -8,7 +8,10 @@ import importlib
 import os
 import random
 import sys
+import time
+import threading
 import types
+import uuid
 from contextlib import contextmanager
 from functools import partial
 from PIL import Image
@@ -21,8 +24,6 @@ import torchvision.transforms as transforms
 import torch.nn.functional as F
 import torch.nn as nn
 from tqdm import tqdm
-from diffusers.models.modeling_utils import no_init_weights, ContextManagers
-import accelerate
 
 from .distributed.fsdp import shard_model
 from .modules.clip import CLIPModel
@@ -30,12 +31,22 @@ from .modules.multitalk_model import WanModel, WanLayerNorm, WanRMSNorm
 from .modules.t5 import T5EncoderModel, T5LayerNorm, T5RelativeEmbedding
 from .modules.vae import WanVAE, CausalConv3d, RMS_norm, Upsample
 from .utils.multitalk_utils import MomentumBuffer, adaptive_projected_guidance, match_and_blend_colors
+from .utils.stage_timer import stage_timer, stage_clock, record_stage
+from .utils.weight_loader import load_safetensors_into, peak_rss_bytes
+from .utils.fused_checkpoint import FusedCheckpoint
+from .utils.quantize import DIT_KEEP, quantize_model, load_quantized
+from .utils.compile_cache import enable_cache, save_cache, compile_blocks, bucket_sizes, dummy_inputs
+from .utils.shared_weights import SharedWeightStore, store_key, memory_usage
+from .utils.component_registry import build_component
+from .utils.prompt_cache import PromptCache
+from .utils.tensor_cache import TensorCache
+from .utils.audio_cache import load_audio_embedding
+from src.workspace import Workspace
+from src.utils import onload, offload
 from src.vram_management import AutoWrappedQLinear, AutoWrappedLinear, AutoWrappedModule, enable_vram_management
 from wan.utils.utils import convert_video_to_h264, extract_specific_frames, get_video_codec
 from wan.wan_lora import WanLoraWrapper
 
-from safetensors.torch import load_file
-from optimum.quanto import quantize, freeze, qint8,requantize
 import optimum.quanto.nn.qlinear as qlinear
 
 def torch_gc():
@@ -104,6 +115,198 @@ def timestep_transform(
     return new_t
 
 
+def bucket_size(src_h, src_w, size_buckget):
+    """(target_h, target_w) of the aspect-ratio bucket closest to a `src_h` x `src_w` image."""
+    bucket_config_module = importlib.import_module("wan.utils.multitalk_utils")
+    if size_buckget == 'infinitetalk-480':
+        bucket_config = getattr(bucket_config_module, 'ASPECT_RATIO_627')
+    elif size_buckget == 'infinitetalk-720':
+        bucket_config = getattr(bucket_config_module, 'ASPECT_RATIO_960')
+
+    ratio = src_h / src_w
+    closest_bucket = sorted(list(bucket_config.keys()), key=lambda x: abs(float(x)-ratio))[0]
+    return tuple(bucket_config[closest_bucket][0])
+
+
+def get_rng_state(generator=None):
+    return {
+        'torch': torch.get_rng_state(),
+        'cuda': torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None,
+        'numpy': np.random.get_state(),
+        'random': random.getstate(),
+        'generator': generator.get_state() if generator is not None else None,
+    }
+
+
+def set_rng_state(state, generator=None):
+    torch.set_rng_state(state['torch'])
+    if state['cuda'] is not None:
+        torch.cuda.set_rng_state_all(state['cuda'])
+    np.random.set_state(state['numpy'])
+    random.setstate(state['random'])
+    if generator is not None and state.get('generator') is not None:
+        generator.set_state(state['generator'])
+
+
+class GenerationState:
+    """
+    Everything `generate_infinitetalk` needs to continue a job from a clip
+    boundary. Tensors are kept on CPU so a suspended job holds no GPU memory.
+    """
+
+    def __init__(self, clip_index, gen_video_list, cond_frame, audio_start_idx,
+                 audio_end_idx, cur_motion_frames_num, arrive_last_frame,
+                 miss_lengths, full_audio_embs, rng_state, teacache_state,
+                 last_clip_latent=None, clip_latents=None):
+        # `gen_video_list` may be None when restoring from a checkpoint, in
+        # which case the frames are re-decoded from `clip_latents`, and
+        # `full_audio_embs` may be None if it is unchanged from the input.
+        self.clip_index = clip_index
+        self.gen_video_list = gen_video_list
+        self.cond_frame = cond_frame
+        self.audio_start_idx = audio_start_idx
+        self.audio_end_idx = audio_end_idx
+        self.cur_motion_frames_num = cur_motion_frames_num
+        self.arrive_last_frame = arrive_last_frame
+        self.miss_lengths = miss_lengths
+        self.full_audio_embs = full_audio_embs
+        self.rng_state = rng_state
+        self.teacache_state = teacache_state
+        self.last_clip_latent = last_clip_latent
+        self.clip_latents = clip_latents
+
+    def state_dict(self):
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_state_dict(cls, state):
+        return cls(**state)
+
+
+def _is_cache_entry(audio_embedding):
+    return isinstance(audio_embedding, str) and audio_embedding.endswith('.safetensors')
+
+
+class _BatchJob:
+    """Per-job state of `InfiniteTalkPipeline.generate_infinitetalk_batch`."""
+
+    def __init__(self, index, seed, device):
+        self.index = index
+        self.generator = torch.Generator(device=device).manual_seed(seed)
+        self.gen_video_list = []
+        self.is_first_clip = True
+        self.arrive_last_frame = False
+        self.cur_motion_frames_num = 1
+        self.audio_start_idx = 0
+        self.miss_length = 0
+        self.cond_frame = None
+        self.references = {}
+
+
+def dit_inputs(checkpoint_dir, quant=None, quant_dir=None, dit_path=None, infinitetalk_dir=None,
+               lora_dir=None, lora_scales=None, param_dtype=torch.bfloat16):
+    """The files `load_dit` reads and the settings it applies, i.e. the key of a baked checkpoint."""
+    if quant is not None and quant_dir is not None:
+        # LoRAs are not applied to pre-quantized models
+        files = [quant_dir, quant_dir.replace('safetensors', 'json')]
+        lora_dir = None
+    elif dit_path is None:
+        files = [f"{checkpoint_dir}/diffusion_pytorch_model-0000{i}-of-00007.safetensors"
+                 for i in range(1, 8)] + [f"{infinitetalk_dir}"]
+    else:
+        files = [dit_path]
+    files = [os.path.join(checkpoint_dir, "config.json")] + files + list(lora_dir or [])
+    settings = {
+        'param_dtype': str(param_dtype),
+        'quant': quant,
+        'lora_scales': list(lora_scales)[:len(lora_dir)] if lora_dir else [],
+    }
+    if quant is not None and quant_dir is None:
+        settings['quant_keep'] = list(DIT_KEEP)
+    return files, settings
+
+
+def meta_dit(checkpoint_dir):
+    """WanModel without weights (on the meta device), ready for `assign`-style loading."""
+    with open(os.path.join(checkpoint_dir, "config.json")) as f:
+        wan_config = json.load(f)
+    with torch.device('meta'):
+        model = WanModel(weight_init=False,**wan_config)
+    model.init_freqs()
+    return model
+
+
+def load_dit(checkpoint_dir, param_dtype, quant=None, quant_dir=None, dit_path=None, infinitetalk_dir=None,
+             lora_dir=None, lora_scales=None, lora_device='cpu', fused_dir=None):
+    """
+    Build the InfiniteTalk WanModel on the CPU: base weights + InfiniteTalk
+    weights (or a quantized / single-file checkpoint), cast to `param_dtype`,
+    LoRAs merged. With `quant` but no `quant_dir` the result is then
+    quantized following `DIT_KEEP`.
+
+    With `fused_dir`, a matching baked checkpoint replaces all of that with a
+    single mmapped load. Models quantized here are baked into
+    `fused_dir/quant-<quant>` on the first load, so later cold starts skip
+    both the bf16 load and the quantization.
+    """
+    logging.info(f"Creating WanModel from {checkpoint_dir}")
+    with open(os.path.join(checkpoint_dir, "config.json")) as f:
+        wan_config = json.load(f)
+    quantize_on_load = quant is not None and quant_dir is None
+
+    fused = None
+    if fused_dir is not None:
+        if quantize_on_load:
+            # next to a bf16 bake rather than replacing it
+            fused_dir = os.path.join(fused_dir, f"quant-{quant}")
+        fused = FusedCheckpoint(fused_dir)
+        files, settings = dit_inputs(checkpoint_dir, quant, quant_dir, dit_path, infinitetalk_dir,
+                                     lora_dir, lora_scales, param_dtype)
+        if fused.matches(files, settings):
+            logging.info(f"Loading baked DiT from {fused.weights_path}")
+            model = meta_dit(checkpoint_dir)
+            if quant is not None:
+                load_quantized(model, fused.weights_path, fused.quant_map_path)
+            else:
+                load_safetensors_into(model, [fused.weights_path])
+            return model.eval().requires_grad_(False)
+        logging.info(f"No baked DiT in {fused_dir} matches the current weights, loading them separately")
+
+    if quant is not None and not quantize_on_load:
+        logging.info(f"Loading Quantized MultiTalk from {quant_dir}")
+        model = meta_dit(checkpoint_dir)
+        load_quantized(model, quant_dir, quant_dir.replace('safetensors', 'json'))
+    elif dit_path is None:
+        model = meta_dit(checkpoint_dir)
+        weight_files = [f"{checkpoint_dir}/diffusion_pytorch_model-0000{i}-of-00007.safetensors"
+                        for i in range(1, 8)] + [f"{infinitetalk_dir}"]
+        load_safetensors_into(model, weight_files, dtype=param_dtype)
+    else:
+        import accelerate
+        from diffusers.models.modeling_utils import no_init_weights, ContextManagers
+
+        init_contexts = [no_init_weights()]
+        init_contexts.append(accelerate.init_empty_weights())
+        with ContextManagers(init_contexts):
+            model = WanModel(weight_init=False,**wan_config)
+        checkpoint_weights = torch.load(dit_path, map_location='cpu')
+        model.load_state_dict(checkpoint_weights['state_dict'])
+        logging.info(f"loading infinitetalk weights {checkpoint_dir}")
+
+    model.eval().requires_grad_(False)
+
+    to_param_dtype_fp32only(model, param_dtype)
+    if lora_dir is not None and (quant is None or quantize_on_load):
+        lora_wrapper = WanLoraWrapper(model)
+        for lora_path, lora_scale in zip(lora_dir, lora_scales):
+            lora_name = lora_wrapper.load_lora(lora_path)
+            lora_wrapper.apply_lora(lora_name, lora_scale, param_dtype=param_dtype, device=lora_device)
+    if quantize_on_load:
+        quantize_model(model, quant, DIT_KEEP)
+        if fused is not None:
+            fused.save(model, files, settings)
+    return model
+
 
 class InfiniteTalkPipeline:
 
@@ -126,6 +329,12 @@ class InfiniteTalkPipeline:
         quant = None,
         dit_path = None,
         infinitetalk_dir=None,
+        fused_dir=None,
+        shared_weights=None,
+        registry=None,
+        prompt_cache_dir=None,
+        reference_cache_dir=None,
+        reference_cache_max_bytes=None,
     ):
         r"""
         Initializes the image-to-video generation model components.
@@ -150,7 +359,27 @@ class InfiniteTalkPipeline:
             init_on_cpu (`bool`, *optional*, defaults to True):
                 Enable initializing Transformer Model on CPU. Only works without FSDP or USP.
             quant (`str`, *optional*, defaults to None):
-                Quantization type, must be 'int8' or 'fp8'.
+                Quantization type, must be 'int8' or 'fp8'. Without `quant_dir`
+                the T5 and the DiT (after merging `lora_dir`) are quantized at
+                load time and cached under `fused_dir`.
+            fused_dir (`str`, *optional*, defaults to None):
+                Checkpoint baked by tools/bake_checkpoint.py, used instead of
+                the separate weights when its manifest matches them.
+            shared_weights (`str`, *optional*, defaults to None):
+                Directory (on tmpfs) of a `SharedWeightStore`; the host copies of
+                the T5 and DiT weights are mapped from it so that all workers on
+                a node share them.
+            registry (`ComponentRegistry`, *optional*, defaults to None):
+                Shares the T5, VAE and CLIP with other pipelines built from the same
+                checkpoints, see `wan.utils.component_registry`.
+            prompt_cache_dir (`str`, *optional*, defaults to None):
+                Keep the T5 outputs of every prompt in this directory as well as in
+                memory; T5 is not built or moved for prompts found there.
+            reference_cache_dir (`str`, *optional*, defaults to None):
+                Likewise for the CLIP and VAE encodings of condition images.
+            reference_cache_max_bytes (`int`, *optional*, defaults to None):
+                Evict the least recently used entries of `reference_cache_dir` past
+                this many bytes; unbounded if None.
         """
         if quant is not None and quant not in ("int8", "fp8"):
             raise ValueError("quant must be 'int8', 'fp8', or None(default fp32 model)")
@@ -159,91 +388,72 @@ class InfiniteTalkPipeline:
         self.rank = rank
         self.use_usp = use_usp
         self.t5_cpu = t5_cpu
+        self.quant = quant
+        self.lora_wrapper = None
 
         self.num_train_timesteps = config.num_train_timesteps
         self.param_dtype = config.param_dtype
 
         shard_fn = partial(shard_model, device_id=device_id)
-
-        self.text_encoder = T5EncoderModel(
-            text_len=config.text_len,
-            dtype=config.t5_dtype,
-            device=torch.device('cpu'),
-            checkpoint_path=os.path.join(checkpoint_dir, config.t5_checkpoint),
-            tokenizer_path=os.path.join(checkpoint_dir, config.t5_tokenizer),
-            shard_fn=shard_fn if t5_fsdp else None,
-            quant=quant,
-            quant_dir=os.path.dirname(quant_dir) if quant_dir is not None else None,
-        )
+        store = SharedWeightStore(shared_weights) if shared_weights is not None else None
+
+        def build_text_encoder():
+            text_encoder = build_component(
+                registry, T5EncoderModel, self,
+                text_len=config.text_len,
+                dtype=config.t5_dtype,
+                device=torch.device('cpu'),
+                checkpoint_path=os.path.join(checkpoint_dir, config.t5_checkpoint),
+                tokenizer_path=os.path.join(checkpoint_dir, config.t5_tokenizer),
+                shard_fn=shard_fn if t5_fsdp else None,
+                quant=quant,
+                quant_dir=os.path.dirname(quant_dir) if quant_dir is not None else None,
+                quant_cache_dir=os.path.join(fused_dir, f"quant-{quant}", "t5")
+                if quant is not None and fused_dir is not None else None,
+            )
+            if store is not None and quant is None and not t5_fsdp:
+                t5_path = os.path.join(checkpoint_dir, config.t5_checkpoint)
+                store.share(store_key('t5', t5_path, dtype=config.t5_dtype), text_encoder.model)
+            return text_encoder
+
+        def build_clip():
+            return build_component(
+                registry, CLIPModel, self,
+                dtype=config.clip_dtype,
+                device=self.device,
+                checkpoint_path=os.path.join(checkpoint_dir,
+                                             config.clip_checkpoint),
+                tokenizer_path=os.path.join(checkpoint_dir, config.clip_tokenizer))
+
+        # T5 and CLIP are only built when a job first needs them, see `_materialise`
+        self._lazy_factories = {'text_encoder': build_text_encoder, 'clip': build_clip}
+        self._lazy_lock = threading.Lock()
 
         self.vae_stride = config.vae_stride
         self.patch_size = config.patch_size
-        self.vae = WanVAE(
+        self.vae = build_component(
+            registry, WanVAE, self,
             vae_pth=os.path.join(checkpoint_dir, config.vae_checkpoint),
             device=self.device)
 
-        self.clip = CLIPModel(
-            dtype=config.clip_dtype,
-            device=self.device,
-            checkpoint_path=os.path.join(checkpoint_dir,
-                                         config.clip_checkpoint),
-            tokenizer_path=os.path.join(checkpoint_dir, config.clip_tokenizer))
-
-        logging.info(f"Creating WanModel from {checkpoint_dir}")
-
-        if quant is not None:
-            logging.info(f"Loading Quantized MultiTalk from {quant_dir}")
-            with torch.device('meta'):
-                wan_config = json.load(open(os.path.join(checkpoint_dir, "config.json")))
-                self.model = WanModel(weight_init=False,**wan_config)
-                torch_gc()
-            model_state_dict = load_file(quant_dir)
-            map_json_path = os.path.join(quant_dir.replace('safetensors', 'json'))
-            self.model.init_freqs()
-            with open(map_json_path, "r") as f:
-                quantization_map = json.load(f)
-            requantize(self.model, model_state_dict, quantization_map, device='cpu')
-        else:
-            if dit_path is None:
-                init_contexts = [no_init_weights()]
-                init_contexts.append(accelerate.init_empty_weights())
-                wan_config = json.load(open(os.path.join(checkpoint_dir, "config.json")))
-                self.model = WanModel(weight_init=False,**wan_config).to(dtype=self.param_dtype)
-                weight_files = [f"{checkpoint_dir}/diffusion_pytorch_model-00001-of-00007.safetensors", 
-                                f"{checkpoint_dir}/diffusion_pytorch_model-00002-of-00007.safetensors", 
-                                f"{checkpoint_dir}/diffusion_pytorch_model-00003-of-00007.safetensors", 
-                                f"{checkpoint_dir}/diffusion_pytorch_model-00004-of-00007.safetensors",
-                                f"{checkpoint_dir}/diffusion_pytorch_model-00005-of-00007.safetensors", 
-                                f"{checkpoint_dir}/diffusion_pytorch_model-00006-of-00007.safetensors", 
-                                f"{checkpoint_dir}/diffusion_pytorch_model-00007-of-00007.safetensors",
-                                f"{infinitetalk_dir}"]
-                merged_state_dict = {}
-                for weight_file in weight_files:
-                    sd = load_file(weight_file)
-                    merged_state_dict.update(sd)
-                self.model.load_state_dict(merged_state_dict)
-                
+        dit_kwargs = dict(quant=quant, quant_dir=quant_dir, dit_path=dit_path, infinitetalk_dir=infinitetalk_dir,
+                          lora_dir=lora_dir, lora_scales=lora_scales)
+        if store is not None and quant is None and not (dit_fsdp or use_usp):
+            files, settings = dit_inputs(checkpoint_dir, param_dtype=self.param_dtype, **dit_kwargs)
+            key = store_key('dit', *files, **settings)
+            if store.has(key):
+                logging.info(f"Mapping shared DiT {store.path(key)}")
+                self.model = store.share(key, meta_dit(checkpoint_dir)).eval().requires_grad_(False)
             else:
-                init_contexts = [no_init_weights()]
-                init_contexts.append(accelerate.init_empty_weights())
-                with ContextManagers(init_contexts):
-                    wan_config = json.load(open(os.path.join(checkpoint_dir, "config.json")))
-                    self.model = WanModel(weight_init=False,**wan_config)
-                checkpoint_weights = torch.load(dit_path, map_location='cpu')
-                self.model.load_state_dict(checkpoint_weights['state_dict'])
-                logging.info(f"loading infinitetalk weights {checkpoint_dir}")
-            
-        self.model.eval().requires_grad_(False)
-        
-        to_param_dtype_fp32only(self.model, self.param_dtype)
-        if lora_dir is not None and quant is None :
-            lora_wrapper = WanLoraWrapper(self.model)
-            for lora_path, lora_scale in zip(lora_dir, lora_scales):
-                lora_name = lora_wrapper.load_lora(lora_path)
-                lora_wrapper.apply_lora(lora_name, lora_scale, param_dtype=self.param_dtype, device=self.device)
-
-
-    
+                self.model = store.share(key, load_dit(checkpoint_dir, self.param_dtype, lora_device=self.device,
+                                                       fused_dir=fused_dir, **dit_kwargs))
+        else:
+            self.model = load_dit(checkpoint_dir, self.param_dtype, lora_device=self.device, fused_dir=fused_dir,
+                                  **dit_kwargs)
+        if store is not None:
+            usage = memory_usage()
+            logging.info(f"Host memory with shared weights: RSS {usage['rss'] / 2**30:.2f} GiB, "
+                         f"PSS {usage['pss'] / 2**30:.2f} GiB, private {usage['private'] / 2**30:.2f} GiB")
 
         if t5_fsdp or dit_fsdp or use_usp:
             init_on_cpu = False
@@ -276,6 +486,13 @@ class InfiniteTalkPipeline:
                 self.model.to(self.device)
         
         self.sample_neg_prompt = config.sample_neg_prompt
+        self.prompt_cache = PromptCache(prompt_cache_dir, encoder=dict(
+            checkpoint=os.path.join(checkpoint_dir, config.t5_checkpoint),
+            tokenizer=os.path.join(checkpoint_dir, config.t5_tokenizer),
+            text_len=config.text_len, dtype=config.t5_dtype, quant=quant))
+        self.reference_cache = TensorCache(reference_cache_dir, max_entries=16, max_bytes=reference_cache_max_bytes, encoder=dict(
+            clip=os.path.join(checkpoint_dir, config.clip_checkpoint), clip_dtype=config.clip_dtype,
+            vae=os.path.join(checkpoint_dir, config.vae_checkpoint), param_dtype=self.param_dtype))
         self.num_timesteps = num_timesteps
         self.use_timestep_transform = use_timestep_transform
 
@@ -283,6 +500,118 @@ class InfiniteTalkPipeline:
         self.model_names = ["model"]
         self.vram_management = False
 
+    def _load_cond_image(self, cond_file_path, size_buckget, workspace):
+        """
+        Read the first frame of the condition image/video and fit it to the bucket.
+        AV1 videos are transcoded into `workspace` first, since decord cannot read them.
+
+        Returns:
+            (readable cond file path, [1, C, 1, H, W] image in [-1, 1], (src_h, src_w), (target_h, target_w))
+        """
+        codec = get_video_codec(cond_file_path)
+        if codec == 'av1':
+            output_video_path = workspace.file(f'{uuid.uuid4().hex}_input_h264.mp4')
+            print(f"Converting {cond_file_path} from AV1 to H.264...")
+            convert_video_to_h264(cond_file_path, output_video_path)
+            print(f"Conversion complete! Saved as {output_video_path}")
+            cond_file_path = output_video_path
+        else:
+            print("No conversion needed.")
+        cond_image = extract_specific_frames(cond_file_path, 0)
+
+        src_h, src_w = cond_image.height, cond_image.width
+        target_h, target_w = bucket_size(src_h, src_w, size_buckget)
+        cond_image = resize_and_centercrop(cond_image, (target_h, target_w))
+        cond_image = cond_image / 255
+        cond_image = (cond_image - 0.5) * 2 # normalization
+        cond_image = cond_image.to(self.device)  # 1 C 1 H W
+        return cond_file_path, cond_image, (src_h, src_w), (target_h, target_w)
+
+    def _encode_prompts(self, input_prompt, n_prompt, offload_model):
+        if n_prompt == "":
+            n_prompt = self.sample_neg_prompt
+        with stage_timer('text_encode'):
+            context, context_null = self.prompt_cache.encode(
+                [input_prompt, n_prompt], lambda texts: self._run_text_encoder(texts, offload_model))
+        return context.to(self.device), context_null.to(self.device)
+
+    def _run_text_encoder(self, texts, offload_model):
+        if not self.t5_cpu:
+            onload(self.text_encoder.model, self.device, keep_host=offload_model)
+            contexts = self.text_encoder(texts, self.device)
+            if offload_model:
+                offload(self.text_encoder.model)
+        else:
+            contexts = [self.text_encoder([text], torch.device('cpu'))[0] for text in texts]
+        return contexts
+
+    def precompute_prompts(self, prompts=None, offload_model=True):
+        """
+        Encode `prompts` (by default the default negative prompt) into the
+        prompt cache and pin them there. T5 is only built if one is missing.
+        """
+        prompts = [self.sample_neg_prompt] if prompts is None else prompts
+        self.prompt_cache.encode(prompts, lambda texts: self._run_text_encoder(texts, offload_model), pin=True)
+
+    def _encode_reference(self, cond_image, frame_num, offload_model, job_references=None):
+        """
+        {clip_context, y, motion_latent} of `cond_image` on the device: its CLIP
+        features, the VAE latents of it padded with zeros to `frame_num` frames,
+        and its own VAE latents, the first clip's motion frames.
+
+        Cached by pixel content and bucket in `reference_cache`, so a repeat
+        avatar skips CLIP (which is not even built) and the VAE encoder.
+        `job_references` keeps the last one on the device for the next clip.
+        """
+        key = self.reference_cache.key(hashlib.sha256(cond_image.cpu().numpy().tobytes()).hexdigest(),
+                                       tuple(cond_image.shape), frame_num)
+        if job_references is not None and key in job_references:
+            return job_references[key]
+        cached = self.reference_cache.get(key)
+        if cached is None:
+            with torch.no_grad():
+                with stage_timer('clip_encode'):
+                    onload(self.clip.model, self.device, keep_host=offload_model)
+                    clip_context = self.clip.visual(cond_image[:, :, -1:, :, :]).to(self.param_dtype)
+                    if offload_model:
+                        offload(self.clip.model)
+                torch_gc()
+
+                # zero padding and vae encode
+                with stage_timer('vae_encode'):
+                    _, c, t, h, w = cond_image.shape
+                    video_frames = torch.zeros(1, c, frame_num - t, h, w, device=self.device)
+                    y = self.vae.encode(torch.concat([cond_image, video_frames], dim=2))
+                    y = torch.stack(y).to(self.param_dtype) # B C T H W
+                    motion_latent = self.vae.encode(cond_image)[0]
+            cached = self.reference_cache.put(
+                key, {'clip_context': clip_context, 'y': y, 'motion_latent': motion_latent})
+        reference = {name: t.to(self.device) for name, t in cached.items()}
+        if job_references is not None:
+            job_references.clear()
+            job_references[key] = reference
+        return reference
+
+    def _prepare_cond_frame(self, cond_file_path, frame_idx, target_h, target_w):
+        cond_image = extract_specific_frames(cond_file_path, frame_idx)
+        cond_image = resize_and_centercrop(cond_image, (target_h, target_w))
+        cond_image = cond_image / 255
+        cond_image = (cond_image - 0.5) * 2 # normalization
+        return cond_image.to(self.device)  # 1 C 1 H W
+
+    def _decode_clip_latents(self, clip_latents, motion_frame, color_reference, color_correction_strength):
+        """Rebuild the per-clip frame list of `generate_infinitetalk` from the clips' final latents."""
+        gen_video_list = []
+        for clip_idx, latent in enumerate(clip_latents):
+            with torch.no_grad():
+                videos = self.vae.decode([latent.to(self.device)])
+            videos = torch.stack(videos).cpu() # B C T H W
+            if color_correction_strength > 0.0 and color_reference is not None:
+                videos = match_and_blend_colors(videos, color_reference, color_correction_strength)
+            gen_video_list.append(videos if clip_idx == 0 else videos[:, :, motion_frame:])
+        torch_gc()
+        return gen_video_list
+
     def add_noise(
         self,
         original_samples: torch.FloatTensor,
@@ -331,6 +660,81 @@ class InfiniteTalkPipeline:
 
     def enable_cpu_offload(self):
         self.cpu_offload = True
+
+    @property
+    def text_encoder(self):
+        return self._materialise('text_encoder')
+
+    @property
+    def clip(self):
+        return self._materialise('clip')
+
+    def _materialise(self, name):
+        if name not in self.__dict__:
+            with self._lazy_lock:
+                if name not in self.__dict__:
+                    start = time.perf_counter()
+                    self.__dict__[name] = self._lazy_factories[name]()
+                    usage = memory_usage()
+                    logging.info(f"Loaded {name} in {time.perf_counter() - start:.1f}s, "
+                                 f"RSS {usage['rss'] / 2**30:.2f} GiB, peak RSS {peak_rss_bytes() / 2**30:.2f} GiB")
+        return self.__dict__[name]
+
+    def set_loras(self, loras):
+        """
+        Switch the LoRAs merged into the live DiT to `loras`, a list of
+        (path, scale), on top of the ones given at construction. An empty list
+        restores the base weights. Returns the seconds spent.
+        """
+        if self.quant is not None:
+            if loras:
+                raise ValueError("LoRAs cannot be switched on quantized models, pass them as lora_dir "
+                                 "to quantize them in at load time")
+            return 0.0
+        if self.lora_wrapper is None:
+            if not loras:
+                return 0.0
+            self.lora_wrapper = WanLoraWrapper(self.model)
+        return self.lora_wrapper.set_loras(loras, param_dtype=self.param_dtype, device=self.device)
+
+    def compile_dit(self, cache_dir, dynamic=False):
+        """
+        Compile the DiT block by block (`compile_blocks`), with the compiled
+        artifacts kept in `cache_dir` so that later processes mostly load
+        them instead of compiling again.
+        """
+        enable_cache(cache_dir)
+        compile_blocks(self.model, dynamic=dynamic)
+        self.compile_cache_dir = cache_dir
+
+    def warm_up_dit(self, sizes=('infinitetalk-480',), frame_num=81, offload_model=True):
+        """
+        Run one dummy DiT forward per resolution bucket of `sizes` so that no
+        job waits for a compilation, then save the compiled artifacts.
+        Returns {(h, w): seconds}.
+        """
+        self.model.disable_teacache()
+        if not self.vram_management:
+            onload(self.model, self.device, keep_host=offload_model)
+        else:
+            self.load_models_to_device(["model"])
+        timings = {}
+        with torch.no_grad():
+            for size in sizes:
+                for h, w in bucket_sizes(size):
+                    x, kwargs = dummy_inputs(self.model, h, w, frame_num, self.device, self.param_dtype)
+                    start = time.perf_counter()
+                    self.model(x, **kwargs)
+                    torch.cuda.synchronize(self.device)
+                    timings[(h, w)] = time.perf_counter() - start
+                    logging.info(f"Warmed up the DiT for {h}x{w} in {timings[(h, w)]:.1f}s")
+                    del x, kwargs
+                    torch_gc()
+        if offload_model and not self.vram_management:
+            offload(self.model)
+        if getattr(self, 'compile_cache_dir', None) is not None:
+            save_cache(self.compile_cache_dir)
+        return timings
     
     def load_models_to_device(self, loadmodel_names=[]):
         # only load models to device if cpu_offload is enabled
@@ -353,7 +757,7 @@ class InfiniteTalkPipeline:
                             if hasattr(module, "offload"):
                                 module.offload()
                     else:
-                        model.cpu()
+                        offload(model)
         # load the needed models to device
         for model_name in loadmodel_names:
             model = getattr(self, model_name)
@@ -368,7 +772,7 @@ class InfiniteTalkPipeline:
                         if hasattr(module, "onload"):
                             module.onload()
                 else:
-                    model.to(self.device)
+                    onload(model, self.device)
         # fresh the cuda cache
         torch.cuda.empty_cache()
 
@@ -389,7 +793,10 @@ class InfiniteTalkPipeline:
                  face_scale=0.05,
                  progress=True,
                  color_correction_strength=0.0,
-                 extra_args=None):
+                 extra_args=None,
+                 resume_state=None,
+                 clip_callback=None,
+                 workspace=None):
         r"""
         Generates video frames from input image and text prompt using diffusion process.
 
@@ -407,6 +814,16 @@ class InfiniteTalkPipeline:
                 Random seed for noise generation. If -1, use random seed
             offload_model (`bool`, *optional*, defaults to True):
                 If True, offloads models to CPU during generation to save VRAM
+            resume_state (`GenerationState`, *optional*, defaults to None):
+                Continue a job from the clip boundary it was captured at. The
+                other arguments must match the original call.
+            clip_callback (`callable`, *optional*, defaults to None):
+                Called as `clip_callback(clip_index, get_state)` after every clip
+                that is followed by another one; `get_state()` captures a
+                `GenerationState`. If it returns True the job is suspended and
+                the captured `GenerationState` is returned instead of a video.
+            workspace (`Workspace`, *optional*, defaults to None):
+                Where intermediate files go; a private one on tmpfs if not given.
         """
 
         # init teacache
@@ -420,35 +837,11 @@ class InfiniteTalkPipeline:
             self.model.disable_teacache()
 
         input_prompt = input_data['prompt']
-        cond_file_path = input_data['cond_video']
-        codec = get_video_codec(cond_file_path)
-        if codec == 'av1':
-            output_video_path = 'tmp/' + '_input_h264.mp4'
-            print(f"Converting {cond_file_path} from AV1 to H.264...")
-            convert_video_to_h264(cond_file_path, output_video_path)
-            print(f"Conversion complete! Saved as {output_video_path}")
-            cond_file_path = output_video_path
-        else:
-            print("No conversion needed.")
-        cond_image = extract_specific_frames(cond_file_path, 0)
-        # cond_image = Image.fromarray(cond_image)
-        
-        
-        # decide a proper size
-        bucket_config_module = importlib.import_module("wan.utils.multitalk_utils")
-        if size_buckget == 'infinitetalk-480':
-            bucket_config = getattr(bucket_config_module, 'ASPECT_RATIO_627')
-        elif size_buckget == 'infinitetalk-720':
-            bucket_config = getattr(bucket_config_module, 'ASPECT_RATIO_960')
-
-        src_h, src_w = cond_image.height, cond_image.width
-        ratio = src_h / src_w
-        closest_bucket = sorted(list(bucket_config.keys()), key=lambda x: abs(float(x)-ratio))[0]
-        target_h, target_w = bucket_config[closest_bucket][0]
-        cond_image = resize_and_centercrop(cond_image, (target_h, target_w))
-        cond_image = cond_image / 255
-        cond_image = (cond_image - 0.5) * 2 # normalization
-        cond_image = cond_image.to(self.device)  # 1 C 1 H W
+        if workspace is None:
+            # removed once this call returns and drops the last reference
+            workspace = Workspace()
+        cond_file_path, cond_image, (src_h, src_w), (target_h, target_w) = self._load_cond_image(
+            input_data['cond_video'], size_buckget, workspace)
 
         # Store the original image for color reference if strength > 0
         original_color_reference = None
@@ -470,10 +863,16 @@ class InfiniteTalkPipeline:
         audio_embedding_paths = [audio_embedding_path_1, audio_embedding_path_2]
         for human_idx in range(HUMAN_NUMBER):   
             audio_embedding_path = audio_embedding_paths[human_idx]
-            if not os.path.exists(audio_embedding_path):
+            if isinstance(audio_embedding_path, torch.Tensor):
+                # embedding computed in memory by the caller
+                full_audio_emb = audio_embedding_path
+            elif not os.path.exists(audio_embedding_path):
                 continue
-            full_audio_emb = torch.load(audio_embedding_path)
-            if torch.isnan(full_audio_emb).any():
+            else:
+                # cache entries are mmapped and only the windows of each clip are read
+                full_audio_emb = load_audio_embedding(audio_embedding_path)
+            # cache entries were checked for NaNs when they were written
+            if not _is_cache_entry(audio_embedding_path) and torch.isnan(full_audio_emb).any():
                 continue
             if full_audio_emb.shape[0] <= frame_num:
                 continue
@@ -482,18 +881,7 @@ class InfiniteTalkPipeline:
         assert len(full_audio_embs) == HUMAN_NUMBER, f"Aduio file not exists or length not satisfies frame nums."
 
         # preprocess text embedding
-        if n_prompt == "":
-            n_prompt = self.sample_neg_prompt
-        if not self.t5_cpu:
-            self.text_encoder.model.to(self.device)
-            context, context_null = self.text_encoder([input_prompt, n_prompt], self.device)
-            if offload_model:
-                self.text_encoder.model.cpu()
-        else:
-            context = self.text_encoder([input_prompt], torch.device('cpu'))
-            context_null = self.text_encoder([n_prompt], torch.device('cpu'))
-            context = [t.to(self.device) for t in context]
-            context_null = [t.to(self.device) for t in context_null]
+        context, context_null = self._encode_prompts(input_prompt, n_prompt, offload_model)
 
         torch_gc()
         # prepare params for video generation
@@ -514,6 +902,35 @@ class InfiniteTalkPipeline:
         np.random.seed(seed)
         random.seed(seed)
         torch.backends.cudnn.deterministic = True
+        # all noise comes from this generator, so a job gets the same noise
+        # from `generate_infinitetalk_batch` as when it runs alone
+        generator = torch.Generator(device=self.device).manual_seed(seed)
+
+        clip_index = 0
+        if resume_state is not None:
+            clip_index = resume_state.clip_index
+            if resume_state.gen_video_list is not None:
+                gen_video_list = list(resume_state.gen_video_list)
+            else:
+                gen_video_list = self._decode_clip_latents(
+                    resume_state.clip_latents, motion_frame, original_color_reference, color_correction_strength)
+            if resume_state.full_audio_embs is not None:
+                full_audio_embs = list(resume_state.full_audio_embs)
+            audio_start_idx = resume_state.audio_start_idx
+            audio_end_idx = resume_state.audio_end_idx
+            cur_motion_frames_num = resume_state.cur_motion_frames_num
+            arrive_last_frame = resume_state.arrive_last_frame
+            if resume_state.miss_lengths is not None:
+                miss_lengths = resume_state.miss_lengths
+            is_first_clip = False
+            cond_frame = resume_state.cond_frame.to(self.device)
+            cond_image = self._prepare_cond_frame(cond_file_path, audio_start_idx, target_h, target_w)
+            if hasattr(self.model, 'load_teacache_state'):
+                self.model.load_teacache_state(resume_state.teacache_state, self.device)
+            set_rng_state(resume_state.rng_state, generator)
+
+        # the condition image is usually the same for every clip
+        job_references = {}
 
         # start video generation iteratively
         while True:
@@ -546,7 +963,8 @@ class InfiniteTalkPipeline:
                 lat_h,
                 lat_w,
                 dtype=torch.float32,
-                device=self.device) 
+                device=self.device,
+                generator=generator) 
 
             # get mask
             msk = torch.ones(1, frame_num, lat_h, lat_w, device=self.device)
@@ -559,26 +977,18 @@ class InfiniteTalkPipeline:
             msk = msk.transpose(1, 2).to(self.param_dtype) # B 4 T H W
 
             with torch.no_grad():
-                # get clip embedding
-                self.clip.model.to(self.device)
-                clip_context = self.clip.visual(cond_image[:, :, -1:, :, :]).to(self.param_dtype) 
-                if offload_model:
-                    self.clip.model.cpu()
-                torch_gc()
-
-                # zero padding and vae encode
-                video_frames = torch.zeros(1, cond_image.shape[1], frame_num-cond_image.shape[2], target_h, target_w).to(self.device)
-                padding_frames_pixels_values = torch.concat([cond_image, video_frames], dim=2)
-                y = self.vae.encode(padding_frames_pixels_values) 
-                y = torch.stack(y).to(self.param_dtype) # B C T H W
+                # clip embedding and vae latents of the zero padded condition image
+                reference = self._encode_reference(cond_image, frame_num, offload_model, job_references)
+                clip_context = reference['clip_context']
                 cur_motion_frames_latent_num = int(1 + (cur_motion_frames_num-1) // 4)
 
                 if is_first_clip:
-                    latent_motion_frames = self.vae.encode(cond_image)[0]
+                    latent_motion_frames = reference['motion_latent']
                 else:
-                    latent_motion_frames = self.vae.encode(cond_frame)[0]
+                    with stage_timer('vae_encode'):
+                        latent_motion_frames = self.vae.encode(cond_frame)[0]
 
-                y = torch.concat([msk, y], dim=1) # B 4+C T H W
+                y = torch.concat([msk, reference['y']], dim=1) # B 4+C T H W
                 torch_gc()
             
 
@@ -686,14 +1096,16 @@ class InfiniteTalkPipeline:
 
                 torch_gc()
                 if not self.vram_management:
-                    self.model.to(self.device)
+                    onload(self.model, self.device, keep_host=offload_model)
                 else:
                     self.load_models_to_device(["model"])
                 
                 # injecting motion frames
                 if not is_first_clip:
                     latent_motion_frames = latent_motion_frames.to(latent.dtype).to(self.device)
-                    motion_add_noise = torch.randn_like(latent_motion_frames).contiguous()
+                    motion_add_noise = torch.randn(
+                        latent_motion_frames.shape, dtype=latent_motion_frames.dtype,
+                        device=self.device, generator=generator).contiguous()
                     add_latent = self.add_noise(latent_motion_frames, motion_add_noise, timesteps[0])
                     _, T_m, _, _ = add_latent.shape
                     latent[:, :T_m] = add_latent
@@ -706,6 +1118,7 @@ class InfiniteTalkPipeline:
 
 
                 progress_wrap = partial(tqdm, total=len(timesteps)-1) if progress else (lambda x: x)
+                dit_start = stage_clock()
                 for i in progress_wrap(range(len(timesteps)-1)):
                     timestep = timesteps[i]
                     latent[:, :cur_motion_frames_latent_num] = latent_motion_frames
@@ -765,7 +1178,9 @@ class InfiniteTalkPipeline:
                     # injecting motion frames
                     if not is_first_clip:
                         latent_motion_frames = latent_motion_frames.to(latent.dtype).to(self.device)
-                        motion_add_noise = torch.randn_like(latent_motion_frames).contiguous()
+                        motion_add_noise = torch.randn(
+                            latent_motion_frames.shape, dtype=latent_motion_frames.dtype,
+                            device=self.device, generator=generator).contiguous()
                         add_latent = self.add_noise(latent_motion_frames, motion_add_noise, timesteps[i+1])
                         _, T_m, _, _ = add_latent.shape
                         latent[:, :T_m] = add_latent
@@ -773,13 +1188,16 @@ class InfiniteTalkPipeline:
                     latent[:, :cur_motion_frames_latent_num] = latent_motion_frames
                     x0 = [latent.to(self.device)] 
                     del latent_model_input, timestep
+                record_stage('dit_clip', stage_clock() - dit_start)
                 
                 if offload_model: 
                     if not self.vram_management:
-                        self.model.cpu()
+                        offload(self.model)
                 torch_gc()
 
-                videos = self.vae.decode(x0)
+                with stage_timer('vae_decode'):
+                    videos = self.vae.decode(x0)
+                last_clip_latent = x0[0]
             
             # cache generated samples
             videos = torch.stack(videos).cpu() # B C T H W
@@ -804,12 +1222,7 @@ class InfiniteTalkPipeline:
             audio_start_idx += (frame_num - cur_motion_frames_num)
             audio_end_idx = audio_start_idx + clip_length
 
-            cond_image = extract_specific_frames(cond_file_path, audio_start_idx)
-            # cond_image = Image.fromarray(cond_image)
-            cond_image = resize_and_centercrop(cond_image, (target_h, target_w))
-            cond_image = cond_image / 255
-            cond_image = (cond_image - 0.5) * 2 # normalization
-            cond_image = cond_image.to(self.device)  # 1 C 1 H W
+            cond_image = self._prepare_cond_frame(cond_file_path, audio_start_idx, target_h, target_w)
 
             # Repeat audio emb
             if audio_end_idx >= min(max_frames_num, len(full_audio_embs[0])):
@@ -829,6 +1242,33 @@ class InfiniteTalkPipeline:
 
             
             if max_frames_num <= frame_num: break
+
+            clip_index += 1
+            if clip_callback is not None:
+                def get_state():
+                    return GenerationState(
+                        clip_index=clip_index,
+                        gen_video_list=list(gen_video_list),
+                        cond_frame=cond_frame.cpu(),
+                        audio_start_idx=audio_start_idx,
+                        audio_end_idx=audio_end_idx,
+                        cur_motion_frames_num=cur_motion_frames_num,
+                        arrive_last_frame=arrive_last_frame,
+                        miss_lengths=miss_lengths if arrive_last_frame else None,
+                        full_audio_embs=list(full_audio_embs),
+                        rng_state=get_rng_state(generator),
+                        teacache_state=self.model.teacache_state() if hasattr(self.model, 'teacache_state') else None,
+                        last_clip_latent=last_clip_latent.cpu(),
+                    )
+                suspend = [bool(clip_callback(clip_index, get_state))]
+                if dist.is_initialized():
+                    # every rank has to leave the loop together
+                    dist.broadcast_object_list(suspend, src=0)
+                if suspend[0]:
+                    state = get_state()
+                    del noise, latent
+                    torch_gc()
+                    return state
             
             torch_gc()
             if offload_model:    
@@ -850,6 +1290,289 @@ class InfiniteTalkPipeline:
         torch_gc()
 
         return gen_video_samples[0] if self.rank == 0 else None
-    
 
-   
+    def generate_infinitetalk_batch(self,
+                 input_data_list,
+                 size_buckget='infinitetalk-480',
+                 motion_frame=25,
+                 frame_num=81,
+                 shift=5.0,
+                 sampling_steps=40,
+                 text_guide_scale=5.0,
+                 audio_guide_scale=4.0,
+                 n_prompt="",
+                 seeds=None,
+                 offload_model=True,
+                 max_frames_num=1000,
+                 progress=True,
+                 color_correction_strength=0.0,
+                 extra_args=None,
+                 done_callback=None,
+                 workspace=None):
+        r"""
+        Batched `generate_infinitetalk` for single-speaker jobs whose condition
+        images fall into the same bucket: every DiT forward steps all unfinished
+        jobs at once, which costs little more than one job since the 14B model
+        is memory-bandwidth bound at batch 1.
+
+        Each job keeps its own prompt, audio, CLIP features, motion frames and
+        seed. Noise comes from a per-job generator seeded like the one of
+        `generate_infinitetalk` and drawn in the same order, so a job's output
+        depends neither on what it was batched with nor on whether it was
+        batched at all. A job leaves the batch after its last clip.
+
+        Args:
+            input_data_list (`list[dict]`):
+                Inputs as for `generate_infinitetalk`, one speaker each.
+            seeds (`list[int]`, *optional*, defaults to None):
+                One per job; -1 picks a random seed. Defaults to 42 for all.
+            done_callback (`callable`, *optional*, defaults to None):
+                Called as `done_callback(job_index, video)` as soon as a job finishes.
+            workspace (`Workspace`, *optional*, defaults to None):
+                Where intermediate files go; a private one on tmpfs if not given.
+
+        Returns:
+            List of `[C, T, H, W]` videos in input order.
+        """
+        assert not dist.is_initialized() or dist.get_world_size() == 1, "batched generation runs on a single GPU"
+        if seeds is None:
+            seeds = [42] * len(input_data_list)
+        if workspace is None:
+            workspace = Workspace()
+
+        # init teacache; its skip decision depends only on the timestep, which
+        # every job of the batch shares
+        if extra_args.use_teacache:
+            self.model.teacache_init(
+                sample_steps=sampling_steps,
+                teacache_thresh=extra_args.teacache_thresh,
+                model_scale=extra_args.size,
+            )
+        else:
+            self.model.disable_teacache()
+
+        jobs = []
+        for index, (input_data, seed) in enumerate(zip(input_data_list, seeds)):
+            assert len(input_data['cond_audio']) == 1, "batched generation supports one speaker per job"
+            seed = seed if seed >= 0 else random.randint(0, 99999999)
+            job = _BatchJob(index, seed, self.device)
+            job.cond_file_path, job.cond_image, _, target_size = self._load_cond_image(
+                input_data['cond_video'], size_buckget, workspace)
+            if jobs:
+                assert target_size == (target_h, target_w), "all jobs of a batch must share a bucket"
+            target_h, target_w = target_size
+            job.color_reference = job.cond_image.clone() if color_correction_strength > 0.0 else None
+
+            full_audio_emb = input_data['cond_audio']['person1']
+            checked = _is_cache_entry(full_audio_emb)
+            if not isinstance(full_audio_emb, torch.Tensor):
+                full_audio_emb = load_audio_embedding(full_audio_emb)
+            assert (checked or not torch.isnan(full_audio_emb).any()) and full_audio_emb.shape[0] > frame_num, \
+                f"Audio of job {index} is invalid or not longer than {frame_num} frames."
+            job.full_audio_emb = full_audio_emb
+            job.audio_len = full_audio_emb.shape[0]
+
+            job.context, job.context_null = self._encode_prompts(input_data['prompt'], n_prompt, offload_model)
+            jobs.append(job)
+        torch_gc()
+
+        # everything below is shared by the batch
+        indices = (torch.arange(2 * 2 + 1) - 2) * 1
+        lat_h, lat_w = target_h // self.vae_stride[1], target_w // self.vae_stride[2]
+        max_seq_len = ((frame_num - 1) // self.vae_stride[0] + 1) * lat_h * lat_w // (
+            self.patch_size[1] * self.patch_size[2])
+        max_seq_len = int(math.ceil(max_seq_len / self.sp_size)) * self.sp_size
+
+        msk = torch.ones(1, frame_num, lat_h, lat_w, device=self.device)
+        msk[:, 1:] = 0
+        msk = torch.concat([
+            torch.repeat_interleave(msk[:, 0:1], repeats=4, dim=1), msk[:, 1:]
+        ],
+                        dim=1)
+        msk = msk.view(1, msk.shape[1] // 4, 4, lat_h, lat_w)
+        msk = msk.transpose(1, 2).to(self.param_dtype) # B 4 T H W
+
+        timesteps = list(np.linspace(self.num_timesteps, 1, sampling_steps, dtype=np.float32))
+        timesteps.append(0.)
+        timesteps = [torch.tensor([t], device=self.device) for t in timesteps]
+        if self.use_timestep_transform:
+            timesteps = [timestep_transform(t, shift=shift, num_timesteps=self.num_timesteps) for t in timesteps]
+
+        results = [None] * len(jobs)
+        active = list(jobs)
+        while active:
+            noise, audio_embs, clip_contexts, ys = [], [], [], []
+            with torch.no_grad():
+                for job in active:
+                    # split audio with window size
+                    center_indices = torch.arange(
+                        job.audio_start_idx,
+                        job.audio_start_idx + frame_num,
+                        1,
+                    ).unsqueeze(1) + indices.unsqueeze(0)
+                    center_indices = torch.clamp(center_indices, min=0, max=job.full_audio_emb.shape[0]-1)
+                    audio_embs.append(job.full_audio_emb[center_indices][None,...].to(self.device))
+
+                    noise.append(torch.randn(
+                        16, (frame_num - 1) // 4 + 1, lat_h, lat_w,
+                        dtype=torch.float32, device=self.device, generator=job.generator))
+
+                    reference = self._encode_reference(job.cond_image, frame_num, offload_model, job.references)
+                    clip_contexts.append(reference['clip_context'])
+                    ys.append(torch.concat([msk, reference['y']], dim=1)) # 1 4+C T H W
+                    job.motion_latent_num = int(1 + (job.cur_motion_frames_num-1) // 4)
+                    if job.is_first_clip:
+                        job.latent_motion_frames = reference['motion_latent']
+                    else:
+                        with stage_timer('vae_encode'):
+                            job.latent_motion_frames = self.vae.encode(job.cond_frame)[0]
+            audio_embs = torch.concat(audio_embs, dim=0).to(self.param_dtype) # B T W S C
+            clip_context = torch.concat(clip_contexts, dim=0)
+            y = torch.concat(ys, dim=0)
+            latent = torch.stack(noise)
+            del noise, clip_contexts, ys
+            torch_gc()
+
+            with torch.no_grad():
+                arg_c = {
+                    'context': [job.context for job in active],
+                    'clip_fea': clip_context,
+                    'seq_len': max_seq_len,
+                    'y': y,
+                    'audio': audio_embs,
+                }
+                arg_null_text = dict(arg_c, context=[job.context_null for job in active])
+                arg_null_audio = dict(arg_c, audio=torch.zeros_like(audio_embs))
+                arg_null = dict(arg_null_text, audio=torch.zeros_like(audio_embs))
+
+                if not self.vram_management:
+                    onload(self.model, self.device, keep_host=offload_model)
+                else:
+                    self.load_models_to_device(["model"])
+
+                if extra_args.use_apg:
+                    # the guidance norms are taken per job, so the buffers batch as well
+                    text_momentumbuffer  = MomentumBuffer(extra_args.apg_momentum)
+                    audio_momentumbuffer = MomentumBuffer(extra_args.apg_momentum)
+
+                # as in `generate_infinitetalk`: noised motion latents after every
+                # update, then the clean ones; the noised ones are overwritten but
+                # still drawn, to keep each job's generator in step with that path
+                def inject_motion_frames(t):
+                    for b, job in enumerate(active):
+                        latent_motion_frames = job.latent_motion_frames.to(latent.dtype)
+                        if not job.is_first_clip:
+                            motion_add_noise = torch.randn(
+                                latent_motion_frames.shape, dtype=latent_motion_frames.dtype,
+                                device=self.device, generator=job.generator).contiguous()
+                            add_latent = self.add_noise(latent_motion_frames, motion_add_noise, t)
+                            latent[b, :, :add_latent.shape[1]] = add_latent
+                        latent[b, :, :job.motion_latent_num] = latent_motion_frames
+
+                inject_motion_frames(timesteps[0])
+
+                progress_wrap = partial(tqdm, total=len(timesteps)-1) if progress else (lambda x: x)
+                dit_start = stage_clock()
+                for i in progress_wrap(range(len(timesteps)-1)):
+                    timestep = timesteps[i]
+                    latent_model_input = list(latent)
+
+                    noise_pred_cond = self.model(latent_model_input, t=timestep, **arg_c)
+                    torch_gc()
+                    if math.isclose(text_guide_scale, 1.0):
+                        noise_pred_drop_audio = self.model(latent_model_input, t=timestep, **arg_null_audio)
+                        torch_gc()
+                    else:
+                        noise_pred_drop_text = self.model(latent_model_input, t=timestep, **arg_null_text)
+                        torch_gc()
+                        noise_pred_uncond = self.model(latent_model_input, t=timestep, **arg_null)
+                        torch_gc()
+
+                    if extra_args.use_apg:
+                        if math.isclose(text_guide_scale, 1.0):
+                            diff_uncond_audio = noise_pred_cond - noise_pred_drop_audio
+                            noise_pred = noise_pred_cond + (audio_guide_scale - 1) * adaptive_projected_guidance(
+                                diff_uncond_audio, noise_pred_cond, momentum_buffer=audio_momentumbuffer,
+                                norm_threshold=extra_args.apg_norm_threshold)
+                        else:
+                            diff_uncond_text = noise_pred_cond - noise_pred_drop_text
+                            diff_uncond_audio = noise_pred_drop_text - noise_pred_uncond
+                            noise_pred = noise_pred_cond + (text_guide_scale - 1) * adaptive_projected_guidance(
+                                diff_uncond_text, noise_pred_cond, momentum_buffer=text_momentumbuffer,
+                                norm_threshold=extra_args.apg_norm_threshold) \
+                                + (audio_guide_scale - 1) * adaptive_projected_guidance(
+                                diff_uncond_audio, noise_pred_cond, momentum_buffer=audio_momentumbuffer,
+                                norm_threshold=extra_args.apg_norm_threshold)
+                    else:
+                        if math.isclose(text_guide_scale, 1.0):
+                            noise_pred = noise_pred_drop_audio + audio_guide_scale * (noise_pred_cond - noise_pred_drop_audio)
+                        else:
+                            noise_pred = noise_pred_uncond + text_guide_scale * (
+                                noise_pred_cond - noise_pred_drop_text) + \
+                                audio_guide_scale * (noise_pred_drop_text - noise_pred_uncond)
+                    noise_pred = -noise_pred
+
+                    # update latent
+                    dt = timesteps[i] - timesteps[i + 1]
+                    dt = dt / self.num_timesteps
+                    latent = latent + noise_pred * dt[:, None, None, None]
+                    inject_motion_frames(timesteps[i + 1])
+                    del latent_model_input, timestep
+                record_stage('dit_clip', stage_clock() - dit_start)
+
+                if offload_model:
+                    if not self.vram_management:
+                        offload(self.model)
+                torch_gc()
+
+                with stage_timer('vae_decode'):
+                    decoded = self.vae.decode(list(latent))
+            del latent, y, audio_embs, clip_context, arg_c, arg_null_text, arg_null_audio, arg_null
+
+            finished = []
+            for b, job in enumerate(active):
+                videos = decoded[b][None].cpu() # 1 C T H W
+                if color_correction_strength > 0.0 and job.color_reference is not None:
+                    videos = match_and_blend_colors(videos, job.color_reference, color_correction_strength)
+
+                if job.is_first_clip:
+                    job.gen_video_list.append(videos)
+                else:
+                    job.gen_video_list.append(videos[:, :, job.cur_motion_frames_num:])
+                if job.arrive_last_frame or max_frames_num <= frame_num:
+                    finished.append(job)
+                    continue
+
+                # update next condition frames
+                job.is_first_clip = False
+                job.cur_motion_frames_num = motion_frame
+                job.cond_frame = videos[:, :, -motion_frame:].to(torch.float32).to(self.device)
+                job.audio_start_idx += (frame_num - motion_frame)
+                audio_end_idx = job.audio_start_idx + frame_num
+                job.cond_image = self._prepare_cond_frame(job.cond_file_path, job.audio_start_idx, target_h, target_w)
+
+                # Repeat audio emb
+                if audio_end_idx >= min(max_frames_num, job.audio_len):
+                    job.arrive_last_frame = True
+                    if audio_end_idx >= job.audio_len:
+                        job.miss_length = audio_end_idx - job.audio_len + 3
+                        add_audio_emb = torch.flip(job.full_audio_emb[-1*job.miss_length:], dims=[0])
+                        job.full_audio_emb = torch.cat([job.full_audio_emb, add_audio_emb], dim=0)
+            del decoded
+
+            for job in finished:
+                video = torch.cat(job.gen_video_list, dim=2)[:, :, :int(max_frames_num)]
+                video = video.to(torch.float32)
+                if max_frames_num > frame_num and job.miss_length > 0:
+                    video = video[:, :, :job.audio_len]
+                results[job.index] = video[0]
+                active.remove(job)
+                del job.gen_video_list, job.full_audio_emb, job.cond_frame
+                if done_callback is not None:
+                    done_callback(job.index, results[job.index])
+
+            torch_gc()
+            if offload_model:
+                torch.cuda.synchronize()
+
+        return results
@@ -18,6 +18,7 @@ from .distributed.fsdp import shard_model
 from .modules.model import WanModel
 from .modules.t5 import T5EncoderModel
 from .modules.vae import WanVAE
+from .utils.component_registry import build_component
 from .utils.fm_solvers import (
     FlowDPMSolverMultistepScheduler,
     get_sampling_sigmas,
@@ -38,6 +39,7 @@ class WanT2V:
         dit_fsdp=False,
         use_usp=False,
         t5_cpu=False,
+        registry=None,
     ):
         r"""
         Initializes the Wan text-to-video generation model components.
@@ -59,6 +61,9 @@ class WanT2V:
                 Enable distribution strategy of USP.
             t5_cpu (`bool`, *optional*, defaults to False):
                 Whether to place T5 model on CPU. Only works without t5_fsdp.
+            registry (`ComponentRegistry`, *optional*, defaults to None):
+                Shares the T5, VAE with other pipelines built from the same
+                checkpoints, see `wan.utils.component_registry`.
         """
         self.device = torch.device(f"cuda:{device_id}")
         self.config = config
@@ -69,7 +74,8 @@ class WanT2V:
         self.param_dtype = config.param_dtype
 
         shard_fn = partial(shard_model, device_id=device_id)
-        self.text_encoder = T5EncoderModel(
+        self.text_encoder = build_component(
+            registry, T5EncoderModel, self,
             text_len=config.text_len,
             dtype=config.t5_dtype,
             device=torch.device('cpu'),
@@ -79,7 +85,8 @@ class WanT2V:
 
         self.vae_stride = config.vae_stride
         self.patch_size = config.patch_size
-        self.vae = WanVAE(
+        self.vae = build_component(
+            registry, WanVAE, self,
             vae_pth=os.path.join(checkpoint_dir, config.vae_checkpoint),
             device=self.device)
 
@@ -1,13 +1,24 @@
-from .fm_solvers import (
-    FlowDPMSolverMultistepScheduler,
-    get_sampling_sigmas,
-    retrieve_timesteps,
-)
-from .fm_solvers_unipc import FlowUniPCMultistepScheduler
-from .vace_processor import VaceVideoProcessor
+import importlib
 
 __all__ = [
     'HuggingfaceTokenizer', 'get_sampling_sigmas', 'retrieve_timesteps',
     'FlowDPMSolverMultistepScheduler', 'FlowUniPCMultistepScheduler',
     'VaceVideoProcessor'
 ]
+
+# imported on first access, see wan/__init__.py
+_LAZY = {
+    'FlowDPMSolverMultistepScheduler': '.fm_solvers',
+    'get_sampling_sigmas': '.fm_solvers',
+    'retrieve_timesteps': '.fm_solvers',
+    'FlowUniPCMultistepScheduler': '.fm_solvers_unipc',
+    'VaceVideoProcessor': '.vace_processor',
+}
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY[name], __name__), name)
+    globals()[name] = value
+    return value
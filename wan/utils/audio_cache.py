@@ -0,0 +1,106 @@
+import os
+import json
+import struct
+import hashlib
+import logging
+import threading
+
+import numpy as np
+import torch
+from safetensors.torch import save_file
+
+from .weight_loader import mmap_safetensors
+from .tensor_cache import DiskBudget
+from src.audio_analysis.streaming import WINDOW_SECONDS, CONTEXT_SECONDS, BLEND_FRAMES
+
+EMBEDDING_NAME = 'audio_emb'
+
+
+def checkpoint_id(model_dir):
+    """Identity of the files in `model_dir`: its path and their names and sizes."""
+    model_dir = os.path.realpath(model_dir)
+    files = sorted((name, os.path.getsize(os.path.join(model_dir, name))) for name in os.listdir(model_dir)
+                   if os.path.isfile(os.path.join(model_dir, name)))
+    return json.dumps([model_dir, files])
+
+
+def load_audio_embedding(path):
+    """
+    The [T, 13, 768] embedding in `path`: a `.pt` file (read whole) or an
+    `AudioEmbeddingCache` entry (mmapped, so indexing only reads the frames
+    it touches).
+    """
+    if path.endswith('.safetensors'):
+        return mmap_safetensors(path)[EMBEDDING_NAME]
+    return torch.load(path)
+
+
+def audio_embedding_frames(path):
+    """Number of frames of the `AudioEmbeddingCache` entry `path`, from its header."""
+    with open(path, 'rb') as f:
+        header_len, = struct.unpack('<Q', f.read(8))
+        return json.loads(f.read(header_len))[EMBEDDING_NAME]['shape'][0]
+
+
+class AudioEmbeddingCache:
+    """
+    wav2vec2 embeddings on disk, keyed by the audio samples and the wav2vec2
+    checkpoint, so audio seen before (e.g. re-dubbed onto another avatar)
+    skips the encoder. Entries are uncompressed safetensors, to be mmapped
+    with `load_audio_embedding`, and are only written without NaNs, so
+    readers need not scan them. At about 1 MB per second of audio, most of it
+    never heard again, the directory is kept under `max_bytes` if given, see
+    `DiskBudget`.
+    """
+
+    def __init__(self, cache_dir, wav2vec_dir, max_bytes=None):
+        self.cache_dir = cache_dir
+        # long tracks are encoded in windows, which changes the result slightly
+        self.encoder = json.dumps([checkpoint_id(wav2vec_dir), WINDOW_SECONDS, CONTEXT_SECONDS, BLEND_FRAMES])
+        os.makedirs(cache_dir, exist_ok=True)
+        self.budget = DiskBudget(cache_dir, max_bytes) if max_bytes is not None else None
+
+    def key(self, speech_array, sr=16000, variant=''):
+        h = hashlib.sha256(f"{self.encoder}\0{sr}\0{variant}\0".encode())
+        h.update(np.ascontiguousarray(speech_array, dtype=np.float32).tobytes())
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.safetensors")
+
+    def embed(self, speech_array, embed_fn, sr=16000):
+        """Path of the embedding of `speech_array`, calling `embed_fn(speech_array)` if it is not cached."""
+        return self.embed_many([speech_array], lambda missing: [embed_fn(missing[0])], sr)[0]
+
+    def embed_many(self, speech_arrays, embed_fn, sr=16000, variant='', joint=False):
+        """
+        Paths of the embeddings of `speech_arrays`, calling `embed_fn(list of
+        the ones not cached)` once for all of them. `variant` separates
+        embeddings computed differently, e.g. by `get_embedding_multi`. With
+        `joint`, each embedding also depends on the other tracks (as when
+        speech spans are matched across speakers): the keys cover the whole
+        group, and if any is missing all are recomputed together.
+        """
+        if joint:
+            group = hashlib.sha256(''.join(self.key(a, sr) for a in speech_arrays).encode()).hexdigest()
+            variant = f"{variant}\0{group}"
+        paths = [self.path(self.key(speech_array, sr, variant)) for speech_array in speech_arrays]
+        missing = [i for i, path in enumerate(paths) if not os.path.exists(path)]
+        if joint and missing:
+            missing = list(range(len(paths)))
+        for i in set(range(len(paths))) - set(missing):
+            logging.info(f"Using cached audio embedding {paths[i]}")
+            if self.budget is not None:
+                self.budget.touch(paths[i])
+        if not missing:
+            return paths
+        for i, audio_emb in zip(missing, embed_fn([speech_arrays[i] for i in missing])):
+            if audio_emb is None or torch.isnan(audio_emb).any():
+                raise ValueError("wav2vec2 returned no or an invalid (NaN) audio embedding")
+            # other workers may write the same entry at the same time
+            tmp = f"{paths[i]}.{os.getpid()}.{threading.get_ident()}.tmp"
+            save_file({EMBEDDING_NAME: audio_emb.contiguous()}, tmp)
+            os.replace(tmp, paths[i])
+            if self.budget is not None:
+                self.budget.add(paths[i])
+        return paths
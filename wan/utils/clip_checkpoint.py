@@ -0,0 +1,78 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+
+import torch
+
+
+def job_fingerprint(**fields):
+    """Stable digest of everything that must match for a checkpoint to be reused."""
+    payload = json.dumps(fields, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ClipCheckpointer:
+    """
+    Per-clip checkpoints of `InfiniteTalkPipeline.generate_infinitetalk`.
+
+    Layout of `ckpt_dir`:
+        clip_00000.pt ...   final latent of each finished clip, written once
+        state.pt            everything else in the `GenerationState`
+
+    Latents are stored instead of decoded frames (a few MB instead of hundreds
+    of MB per clip); they are re-decoded when the job resumes. Files are written
+    to a temp name and renamed, so a preemption mid-write leaves the previous
+    checkpoint intact.
+    """
+
+    def __init__(self, ckpt_dir, fingerprint=None):
+        self.ckpt_dir = ckpt_dir
+        self.fingerprint = fingerprint
+
+    @property
+    def state_path(self):
+        return os.path.join(self.ckpt_dir, 'state.pt')
+
+    def _clip_path(self, clip_idx):
+        return os.path.join(self.ckpt_dir, f'clip_{clip_idx:05d}.pt')
+
+    def _atomic_save(self, obj, path):
+        tmp_path = path + '.tmp'
+        torch.save(obj, tmp_path)
+        os.replace(tmp_path, path)
+
+    def save(self, state):
+        os.makedirs(self.ckpt_dir, exist_ok=True)
+        self._atomic_save(state.last_clip_latent, self._clip_path(state.clip_index - 1))
+
+        meta = state.state_dict()
+        for name in ('gen_video_list', 'last_clip_latent', 'clip_latents'):
+            meta.pop(name)
+        # the embeddings only diverge from the input once the tail is padded
+        if not state.arrive_last_frame:
+            meta['full_audio_embs'] = None
+        meta['fingerprint'] = self.fingerprint
+        self._atomic_save(meta, self.state_path)
+
+    def load(self):
+        """Return the last saved `GenerationState`, or None if there is no usable checkpoint."""
+        from ..multitalk import GenerationState
+
+        if not os.path.exists(self.state_path):
+            return None
+        # our own file: RNG states include numpy/python objects
+        meta = torch.load(self.state_path, map_location='cpu', weights_only=False)
+        if meta.pop('fingerprint') != self.fingerprint:
+            logging.warning(f"Ignoring checkpoint in {self.ckpt_dir}: it belongs to a different job.")
+            return None
+        clip_latents = [
+            torch.load(self._clip_path(clip_idx), map_location='cpu')
+            for clip_idx in range(meta['clip_index'])
+        ]
+        logging.info(f"Resuming from checkpoint in {self.ckpt_dir} after clip {meta['clip_index']}.")
+        return GenerationState(gen_video_list=None, clip_latents=clip_latents, **meta)
+
+    def clear(self):
+        shutil.rmtree(self.ckpt_dir, ignore_errors=True)
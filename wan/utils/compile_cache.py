@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import logging
+
+import torch
+
+from .multitalk_utils import ASPECT_RATIO_627, ASPECT_RATIO_960
+
+BUCKETS = {'infinitetalk-480': ASPECT_RATIO_627, 'infinitetalk-720': ASPECT_RATIO_960}
+ARTIFACTS_NAME = 'compile_artifacts.bin'
+
+
+def bucket_sizes(size):
+    """(h, w) of every aspect-ratio bucket of `size`, e.g. 'infinitetalk-480'."""
+    return [tuple(hw) for hw, _ in BUCKETS[size].values()]
+
+
+def enable_cache(cache_dir):
+    """
+    Keep the torch.compile artifacts (inductor FX graphs, Triton kernels)
+    under `cache_dir`, e.g. on the mounted volume, and load the ones
+    `save_cache` wrote there. Must run before the first compilation.
+
+    Dynamo still traces in every new process; what the cache saves is the
+    inductor / Triton code generation and autotuning.
+    """
+    import torch._inductor.config
+
+    os.makedirs(cache_dir, exist_ok=True)
+    os.environ.setdefault('TORCHINDUCTOR_CACHE_DIR', os.path.join(cache_dir, 'inductor'))
+    os.environ.setdefault('TRITON_CACHE_DIR', os.path.join(cache_dir, 'triton'))
+    torch._inductor.config.fx_graph_cache = True
+    path = os.path.join(cache_dir, ARTIFACTS_NAME)
+    if os.path.exists(path) and hasattr(torch.compiler, 'load_cache_artifacts'):
+        with open(path, 'rb') as f:
+            torch.compiler.load_cache_artifacts(f.read())
+        logging.info(f"Loaded compile artifacts from {path}")
+
+
+def save_cache(cache_dir):
+    """Write the artifacts compiled so far to `cache_dir` as one file (torch >= 2.7)."""
+    if not hasattr(torch.compiler, 'save_cache_artifacts'):
+        return
+    artifacts = torch.compiler.save_cache_artifacts()
+    if artifacts is None:
+        return
+    path = os.path.join(cache_dir, ARTIFACTS_NAME)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(artifacts[0])
+    os.replace(path + '.tmp', path)
+    logging.info(f"Saved compile artifacts to {path}")
+
+
+def compile_blocks(model, dynamic=False, mode=None, max_shapes=None):
+    """
+    Regional compilation: compile `forward` of each of `model.blocks` instead
+    of the whole DiT. With `inline_inbuilt_nn_modules` (default from torch
+    2.5, switched on here for 2.4) the parameters are graph inputs rather than
+    guarded constants, so the blocks share one graph per input shape instead
+    of each compiling its own. With `dynamic=False` every resolution bucket
+    gets its own specialised graph; `max_shapes` (by default the number of
+    buckets in `BUCKETS`) times the number of blocks sizes dynamo's
+    recompile limits, so that no block silently falls back to eager.
+    """
+    import torch._dynamo
+
+    if not hasattr(torch._dynamo.config, 'inline_inbuilt_nn_modules'):
+        raise RuntimeError(f"regional compilation needs torch >= 2.4 (found {torch.__version__}): without "
+                           "inline_inbuilt_nn_modules every block would compile separately")
+    torch._dynamo.config.inline_inbuilt_nn_modules = True
+    if max_shapes is None:
+        max_shapes = sum(len(buckets) for buckets in BUCKETS.values())
+    # in case guards still tell the blocks apart, room for one graph per block and shape
+    limit = len(model.blocks) * max_shapes
+    torch._dynamo.config.cache_size_limit = max(torch._dynamo.config.cache_size_limit, limit)
+    if hasattr(torch._dynamo.config, 'accumulated_cache_size_limit'):
+        torch._dynamo.config.accumulated_cache_size_limit = max(
+            torch._dynamo.config.accumulated_cache_size_limit, limit)
+    for block in model.blocks:
+        block.compile(dynamic=dynamic, mode=mode)
+    return model
+
+
+def dummy_inputs(model, h, w, frame_num, device, dtype, ref_target_masks=True, vae_stride=(4, 8, 8)):
+    """
+    (x, kwargs) for `model(x, **kwargs)` with the shapes of a single-speaker
+    clip of `frame_num` frames at `h` x `w`, as built by `generate_infinitetalk`.
+    """
+    lat_t, lat_h, lat_w = (frame_num - 1) // vae_stride[0] + 1, h // vae_stride[1], w // vae_stride[2]
+    seq_len = lat_t * lat_h * lat_w // (model.patch_size[1] * model.patch_size[2])
+    x = [torch.randn(model.out_dim, lat_t, lat_h, lat_w, device=device)]
+    kwargs = dict(
+        t=torch.tensor([999.], device=device),
+        context=[torch.randn(64, model.text_dim, device=device, dtype=dtype)],
+        seq_len=seq_len,
+        clip_fea=torch.randn(1, 257, 1280, device=device, dtype=dtype),
+        y=torch.randn(1, model.in_dim - model.out_dim, lat_t, lat_h, lat_w, device=device, dtype=dtype),
+        audio=torch.randn(1, frame_num, model.audio_window, 12, 768, device=device, dtype=dtype),
+        # one speaker: the speaker, an unused second one, and the background
+        ref_target_masks=torch.ones(3, lat_h, lat_w, device=device) if ref_target_masks else None,
+    )
+    return x, kwargs
+
+
+def _bench(mode, cache_dir, buckets, frame_num, steps, dtype):
+    """First-call and steady step seconds of a reduced-size DiT per bucket, in this process."""
+    from ..modules.multitalk_model import WanModel
+
+    if mode != 'eager':
+        enable_cache(cache_dir)
+    torch.manual_seed(0)
+    model = WanModel(in_dim=36, dim=256, ffn_dim=1024, freq_dim=64, text_len=64, text_dim=256, num_heads=4,
+                     num_layers=8, output_dim=256, intermediate_dim=128).to(dtype).eval().requires_grad_(False)
+    model.disable_teacache()
+    start = time.perf_counter()
+    if mode != 'eager':
+        compile_blocks(model)
+    results = {'setup': time.perf_counter() - start, 'buckets': {}}
+    with torch.no_grad():
+        for h, w in buckets:
+            x, kwargs = dummy_inputs(model, h, w, frame_num, 'cpu', dtype, ref_target_masks=False)
+            start = time.perf_counter()
+            model(x, **kwargs)
+            first = time.perf_counter() - start
+            timings = []
+            for _ in range(steps):
+                start = time.perf_counter()
+                model(x, **kwargs)
+                timings.append(time.perf_counter() - start)
+            results['buckets'][f'{h}x{w}'] = {'first': first, 'step': sorted(timings)[len(timings) // 2]}
+    if mode != 'eager':
+        save_cache(cache_dir)
+    return results
+
+
+if __name__ == '__main__':
+    # Step time and first-request latency on the CPU with a reduced-size DiT, eager vs
+    # regional compilation with a cold and with a warm cache (each in a fresh process):
+    #   python -m wan.utils.compile_cache [buckets] [steps]
+    import sys
+    import tempfile
+    import subprocess
+
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        mode, cache_dir, buckets = sys.argv[2], sys.argv[3], json.loads(sys.argv[4])
+        print(json.dumps(_bench(mode, cache_dir, buckets, frame_num=5, steps=int(sys.argv[5]),
+                                dtype=torch.bfloat16)))
+        sys.exit()
+
+    num_buckets = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    steps = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    # the 480p buckets scaled down 4x, to multiples of 16 pixels
+    buckets = [(max(16, h // 64 * 16), max(16, w // 64 * 16)) for h, w in bucket_sizes('infinitetalk-480')]
+    buckets = list(dict.fromkeys(buckets))[:num_buckets]
+    with tempfile.TemporaryDirectory() as cache_dir:
+        runs = {}
+        for mode in ('eager', 'cold cache', 'warm cache'):
+            out = subprocess.run([sys.executable, '-m', 'wan.utils.compile_cache', '--child', mode, cache_dir,
+                                  json.dumps(buckets), str(steps)], check=True, capture_output=True, text=True)
+            runs[mode] = json.loads(out.stdout.strip().splitlines()[-1])
+    print(f"{'bucket':>10} " + ' '.join(f"{mode + ' first':>17} {mode + ' step':>16}" for mode in runs))
+    for bucket in runs['eager']['buckets']:
+        print(f"{bucket:>10} " + ' '.join(f"{r['buckets'][bucket]['first']:16.3f}s {r['buckets'][bucket]['step']:15.3f}s"
+                                           for r in runs.values()))
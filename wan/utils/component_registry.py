@@ -0,0 +1,202 @@
+import os
+import inspect
+import hashlib
+import logging
+import threading
+import weakref
+from collections import OrderedDict
+
+from src.utils import onload, offload
+from .shared_weights import SharedWeightStore
+
+
+def _nbytes(module, device_type):
+    tensors = list(module.parameters()) + list(module.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors if t.device.type == device_type)
+
+
+def _spillable(module):
+    """
+    Whether `SharedWeightStore.share` can map `module`: all of it is on the
+    host, and its state dict holds only its parameters and buffers, not e.g.
+    the `weight._data` / `weight._scale` of a quantized weight.
+    """
+    names = {name for name, _ in module.named_parameters(remove_duplicate=False)}
+    names |= {name for name, _ in module.named_buffers(remove_duplicate=False)}
+    tensors = list(module.parameters()) + list(module.buffers())
+    return all(t.device.type == 'cpu' for t in tensors) and set(module.state_dict()) <= names
+
+
+class _Entry:
+
+    def __init__(self, component):
+        self.component = component
+        self.refs = 0
+        self.device = None  # where its weights were before they were moved off the GPU
+        self.spilled = False
+
+
+class ComponentRegistry:
+    """
+    Process-wide pool of the components every Wan pipeline builds the same
+    way: `T5EncoderModel`, `WanVAE` and `CLIPModel`. Pipelines that pass
+    the same class and constructor arguments (checkpoint path, dtype,
+    device, ...) share one instance instead of each holding a copy.
+
+    Each `get` takes a reference that is dropped when its `owner` (the
+    pipeline) is garbage collected. Components without references stay
+    cached, and the least recently used of them are evicted when the
+    budgets are exceeded: weights on the GPU beyond `device_budget` bytes go
+    back to the host, host weights beyond `host_budget` bytes are spilled to
+    `spill_dir` and mapped from there, so the kernel can drop their pages.
+    Components in use are never evicted, and quantized components or ones
+    still partly on the GPU are never spilled.
+
+    Shared components are not safe to run concurrently, e.g. from two jobs on
+    different threads; the pipelines of one worker run one job at a time.
+    """
+
+    def __init__(self, device_budget=None, host_budget=None, spill_dir=None):
+        if host_budget is not None and spill_dir is None:
+            raise ValueError("host_budget needs a spill_dir")
+        self.device_budget = device_budget
+        self.host_budget = host_budget
+        self.spill_store = SharedWeightStore(spill_dir) if spill_dir is not None else None
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def key(cls, **kwargs):
+        # bound with defaults, so callers that leave out a default argument share
+        # with callers that pass it explicitly
+        bound = inspect.signature(cls).bind(**kwargs)
+        bound.apply_defaults()
+        return (f"{cls.__module__}.{cls.__qualname__}",) + tuple(sorted((k, str(v)) for k, v in bound.arguments.items()))
+
+    def get(self, cls, owner=None, **kwargs):
+        """The shared `cls(**kwargs)`, built on first use; referenced until `owner` is collected."""
+        key = self.key(cls, **kwargs)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                logging.info(f"Building shared {cls.__name__}")
+                entry = self._entries[key] = _Entry(cls(**kwargs))
+            elif entry.device is not None:
+                onload(entry.component.model, entry.device)
+                entry.device = None
+            entry.refs += 1
+            entry.spilled = False
+            self._entries.move_to_end(key)
+            if owner is not None:
+                weakref.finalize(owner, self.release, key)
+            self.trim()
+            return entry.component
+
+    def release(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.refs > 0:
+                entry.refs -= 1
+                self.trim()
+
+    def trim(self):
+        """Evict idle components, least recently used first, until the budgets hold."""
+        with self._lock:
+            idle = [(key, entry) for key, entry in self._entries.items() if entry.refs == 0]
+            if self.device_budget is not None:
+                for key, entry in idle:
+                    if self._total('cuda') <= self.device_budget:
+                        break
+                    module = entry.component.model
+                    if _nbytes(module, 'cuda'):
+                        entry.device = next(t.device for t in module.parameters() if t.device.type == 'cuda')
+                        offload(module)
+                        logging.info(f"Moved idle {key[0]} to the host")
+            if self.host_budget is not None:
+                for key, entry in idle:
+                    if self._total('cpu') <= self.host_budget:
+                        break
+                    module = entry.component.model
+                    if not entry.spilled and _nbytes(module, 'cpu') and _spillable(module):
+                        self.spill_store.share(self._spill_key(key), module)
+                        entry.spilled = True
+                        logging.info(f"Spilled idle {key[0]} to {self.spill_store.root}")
+
+    def _total(self, device_type):
+        # spilled weights are mapped from a file, their pages can be dropped
+        return sum(_nbytes(entry.component.model, device_type) for entry in self._entries.values()
+                   if device_type != 'cpu' or not entry.spilled)
+
+    @staticmethod
+    def _spill_key(key):
+        return f"{key[0].rsplit('.', 1)[-1]}-{hashlib.sha256(repr(key).encode()).hexdigest()[:16]}"
+
+    def stats(self):
+        """[(class, references, GPU bytes, host bytes, spilled)] in LRU order."""
+        with self._lock:
+            return [(key[0], entry.refs, _nbytes(entry.component.model, 'cuda'),
+                     _nbytes(entry.component.model, 'cpu'), entry.spilled)
+                    for key, entry in self._entries.items()]
+
+
+def build_component(registry, cls, owner=None, **kwargs):
+    """`cls(**kwargs)`, shared through `registry` if there is one; sharded models are never shared."""
+    if registry is None or kwargs.get('shard_fn') is not None:
+        return cls(**kwargs)
+    return registry.get(cls, owner=owner, **kwargs)
+
+
+class _CheckComponent:
+
+    def __init__(self, layers, seed, bias=True):
+        import torch
+        torch.manual_seed(seed)
+        self.model = torch.nn.Sequential(*[torch.nn.Linear(512, 512, bias=bias) for _ in range(layers)])
+
+
+class _CheckOwner:
+    pass
+
+
+if __name__ == '__main__':
+    # local check on the CPU of references, eviction and spilling: python -m wan.utils.component_registry
+    import gc
+    import tempfile
+
+    layer = 512 * 512 * 4 + 512 * 4  # bytes of one Linear(512, 512)
+    with tempfile.TemporaryDirectory(dir='/dev/shm' if os.path.isdir('/dev/shm') else None) as spill_dir:
+        registry = ComponentRegistry(host_budget=3 * layer, spill_dir=spill_dir)
+        first, second = _CheckOwner(), _CheckOwner()
+        a = registry.get(_CheckComponent, owner=first, layers=2, seed=0)
+        assert registry.get(_CheckComponent, owner=second, layers=2, seed=0, bias=True) is a, \
+            "explicit and defaulted arguments must share"
+        checksum = sum(float(p.sum()) for p in a.model.parameters())
+        b = registry.get(_CheckComponent, owner=_CheckOwner(), layers=2, seed=1)
+        state = lambda: [(refs, spilled) for _, refs, _, _, spilled in registry.stats()]
+        # b's owner is already collected: over budget, so b, the only idle component, was spilled
+        assert state() == [(2, False), (0, True)], state()
+        del first
+        gc.collect()
+        assert state() == [(1, False), (0, True)], state()
+        del second
+        gc.collect()
+        assert state() == [(0, False), (0, True)], state()
+        third = _CheckOwner()
+        registry.get(_CheckComponent, owner=third, layers=2, seed=2)
+        # over budget again: the idle a is spilled, c in use is not
+        assert state() == [(0, True), (0, True), (1, False)], state()
+        assert sum(float(p.sum()) for p in a.model.parameters()) == checksum, "spilled weights changed"
+        assert any(name.endswith('.safetensors') for name in os.listdir(spill_dir))
+        try:
+            from optimum.quanto import quantize, freeze, qint8
+        except ImportError:
+            print("optimum-quanto not installed, quantized components not checked")
+        else:
+            fourth = _CheckOwner()
+            quantized = registry.get(_CheckComponent, owner=fourth, layers=16, seed=3)
+            quantize(quantized.model, weights=qint8)
+            freeze(quantized.model)
+            del fourth
+            gc.collect()
+            assert state()[-1] == (0, False), "a quantized component must not be spilled"
+        print("component registry: sharing, references, eviction and spilling ok")
@@ -0,0 +1,134 @@
+import os
+import json
+import fcntl
+import hashlib
+import logging
+
+from .weight_loader import save_safetensors
+
+MANIFEST_VERSION = 1
+WEIGHTS_NAME = 'dit.safetensors'
+QUANT_MAP_NAME = 'quantization_map.json'
+MANIFEST_NAME = 'manifest.json'
+LOCK_NAME = 'bake.lock'
+
+
+def file_digest(path, chunk_size=16 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class FusedCheckpoint:
+    """
+    A baked DiT: base shards + InfiniteTalk weights, cast to the param dtype,
+    with LoRAs merged and optionally quantized, in one safetensors file that
+    `load_safetensors_into` can mmap directly.
+
+    Layout of `fused_dir`:
+        dit.safetensors          the consolidated state dict
+        quantization_map.json    only for quantized models, as for `quant_dir`
+        manifest.json            settings and sha256 of every input file
+
+    The manifest also records size and mtime of each input so `matches` only
+    rehashes files that changed on disk since the bake.
+
+    The same layout caches other derived weights, e.g. the T5 quantized at
+    load time, under another `weights_name`.
+    """
+
+    def __init__(self, fused_dir, weights_name=WEIGHTS_NAME):
+        self.fused_dir = fused_dir
+        self.weights_name = weights_name
+
+    @property
+    def weights_path(self):
+        return os.path.join(self.fused_dir, self.weights_name)
+
+    @property
+    def quant_map_path(self):
+        return os.path.join(self.fused_dir, QUANT_MAP_NAME)
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.fused_dir, MANIFEST_NAME)
+
+    @staticmethod
+    def _describe(path, digest=None):
+        st = os.stat(path)
+        return {
+            'path': os.path.abspath(path),
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'sha256': digest or file_digest(path),
+        }
+
+    def load_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def matches(self, input_files, settings):
+        """True if the artifact was baked from exactly `input_files` with `settings`."""
+        manifest = self.load_manifest()
+        if manifest is None:
+            return False
+        if manifest.get('version') != MANIFEST_VERSION or manifest.get('settings') != settings:
+            return False
+        recorded = manifest.get('inputs', [])
+        if [entry['path'] for entry in recorded] != [os.path.abspath(p) for p in input_files]:
+            return False
+        for entry in recorded:
+            try:
+                st = os.stat(entry['path'])
+            except OSError:
+                return False
+            if st.st_size != entry['size']:
+                return False
+            if st.st_mtime_ns != entry['mtime_ns'] and file_digest(entry['path']) != entry['sha256']:
+                return False
+        return os.path.exists(self.weights_path) and (
+            settings.get('quant') is None or os.path.exists(self.quant_map_path))
+
+    def save(self, model, input_files, settings):
+        """
+        Write `model`'s weights and the manifest; the manifest goes last, so a
+        partial bake never matches. Workers that cold-start at the same time
+        all try to save; the first one writes and the others find its bake
+        matching once they get the lock.
+        """
+        os.makedirs(self.fused_dir, exist_ok=True)
+        with open(os.path.join(self.fused_dir, LOCK_NAME), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if self.matches(input_files, settings):
+                logging.info(f"{self.weights_path} was baked by another process meanwhile")
+                return self.load_manifest()
+            if os.path.exists(self.manifest_path):
+                os.remove(self.manifest_path)
+            logging.info(f"Hashing {len(input_files)} input files")
+            inputs = [self._describe(path) for path in input_files]
+
+            # readers do not take the lock, and may still map the previous file
+            tmp_suffix = f'.{os.getpid()}.tmp'
+            save_safetensors(model.state_dict(), self.weights_path)
+            if settings.get('quant') is not None:
+                from optimum.quanto import quantization_map
+                with open(self.quant_map_path + tmp_suffix, 'w') as f:
+                    json.dump(quantization_map(model), f)
+                os.replace(self.quant_map_path + tmp_suffix, self.quant_map_path)
+
+            manifest = {
+                'version': MANIFEST_VERSION,
+                'settings': settings,
+                'inputs': inputs,
+                'weights_sha256': file_digest(self.weights_path),
+            }
+            with open(self.manifest_path + tmp_suffix, 'w') as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(self.manifest_path + tmp_suffix, self.manifest_path)
+        logging.info(f"Baked {self.weights_path}")
+        return manifest
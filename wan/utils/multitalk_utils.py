@@ -4,11 +4,6 @@ from einops import rearrange
 import torch
 import torch.nn as nn
 
-from xfuser.core.distributed import (
-    get_sequence_parallel_rank,
-    get_sequence_parallel_world_size,
-    get_sp_group,
-)
 from einops import rearrange, repeat
 from functools import lru_cache
 import imageio
@@ -20,7 +15,6 @@ import soundfile as sf
 import torchvision
 import binascii
 import os.path as osp
-from skimage import color
 
 VID_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv")
 ASPECT_RATIO_627 = {
@@ -127,6 +121,7 @@ def get_attn_map_with_target(visual_q, ref_k, shape, ref_target_masks=None, spli
 
     N_t, N_h, N_w = shape
     if enable_sp:
+        from xfuser.core.distributed import get_sp_group
         ref_k = get_sp_group().all_gather(ref_k, dim=1)
     
     x_seqlens = N_h * N_w
@@ -234,7 +229,12 @@ def cache_video(tensor,
         writer.close()
         return cache_file
 
-def save_video_ffmpeg(gen_video_samples, save_path, vocal_audio_list, fps=25, quality=5, high_quality_save=False):
+def save_video_ffmpeg(gen_video_samples, save_path, vocal_audio_list, fps=25, quality=5, high_quality_save=False, tmp_dir=None):
+    """
+    Encode `[C, T, H, W]` frames in [-1, 1] and mux them with the first audio
+    track into `save_path`.mp4. The temporary video and cropped audio go to
+    `tmp_dir` (e.g. a job workspace on tmpfs) if given, else next to the output.
+    """
     
     def save_video(frames, save_path, fps, quality=9, ffmpeg_params=None):
         writer = imageio.get_writer(
@@ -244,7 +244,8 @@ def save_video_ffmpeg(gen_video_samples, save_path, vocal_audio_list, fps=25, qu
             frame = np.array(frame)
             writer.append_data(frame)
         writer.close()
-    save_path_tmp = save_path + "-temp.mp4"
+    tmp_prefix = os.path.join(tmp_dir, os.path.basename(save_path)) if tmp_dir is not None else save_path
+    save_path_tmp = tmp_prefix + "-temp.mp4"
 
     if high_quality_save:
         cache_video(
@@ -265,9 +266,10 @@ def save_video_ffmpeg(gen_video_samples, save_path, vocal_audio_list, fps=25, qu
     # crop audio according to video length
     _, T, _, _ = gen_video_samples.shape
     duration = T / fps
-    save_path_crop_audio = save_path + "-cropaudio.wav"
+    save_path_crop_audio = tmp_prefix + "-cropaudio.wav"
     final_command = [
         "ffmpeg",
+        "-y",
         "-i",
         vocal_audio_list[0],
         "-t",
@@ -382,6 +384,8 @@ def match_and_blend_colors(source_chunk: torch.Tensor, reference_image: torch.Te
     if not 0.0 <= strength <= 1.0:
         raise ValueError(f"Strength must be between 0.0 and 1.0, got {strength}")
 
+    from skimage import color
+
     device = source_chunk.device
     dtype = source_chunk.dtype
 
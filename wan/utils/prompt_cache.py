@@ -0,0 +1,27 @@
+from .tensor_cache import TensorCache
+
+
+class PromptCache(TensorCache):
+    """
+    T5 outputs (`[seq_len, dim]` per text), keyed by the text and the encoder
+    settings (checkpoint, tokenizer, text length, dtype, quantization). Pin
+    the default negative prompt so it is never evicted.
+    """
+
+    def encode(self, texts, encode_fn, pin=False):
+        """
+        CPU tensors of `texts`, calling `encode_fn(missing texts)` (returning
+        one tensor per text) only for the ones not cached; never if all are.
+        """
+        found = {}
+        for text in dict.fromkeys(texts):
+            cached = self.get(self.key(text))
+            found[text] = cached['context'] if cached is not None else None
+        missing = [text for text, context in found.items() if context is None]
+        if missing:
+            for text, context in zip(missing, encode_fn(missing)):
+                found[text] = self.put(self.key(text), {'context': context})['context']
+        if pin:
+            for text in found:
+                self.pin(self.key(text))
+        return [found[text] for text in texts]
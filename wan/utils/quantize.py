@@ -0,0 +1,115 @@
+import re
+import copy
+import json
+import time
+import logging
+
+import torch
+import torch.nn as nn
+from optimum.quanto import quantize, freeze, requantize, qint8, qfloat8
+
+from .weight_loader import mmap_safetensors
+
+QUANT_WEIGHTS = {'int8': qint8, 'fp8': qfloat8}
+
+# Module name patterns (fnmatch) kept in the param dtype. Only nn.Linear is
+# quantized in any case; these are the linears that are small or sensitive:
+# the audio path, the output head, the embeddings.
+DIT_KEEP = (
+    'patch_embedding', 'text_embedding*', 'time_embedding*', 'time_projection*', 'img_emb*',
+    'audio_proj*', '*audio_cross_attn*', 'head*', '*norm*',
+)
+T5_KEEP = ('token_embedding', '*pos_embedding*', '*norm*')
+
+
+def _nbytes(model):
+    return sum(t.numel() * t.element_size() for t in model.state_dict().values())
+
+
+def quantize_model(model, quant, keep=()):
+    """
+    Quantize the linear weights of `model` in place to `quant` ('int8' or
+    'fp8'), except for modules matching a `keep` pattern. Activations stay in
+    the param dtype.
+    """
+    start = time.perf_counter()
+    before = _nbytes(model)
+    quantize(model, weights=QUANT_WEIGHTS[quant], exclude=list(keep) or None)
+    freeze(model)
+    logging.info(f"Quantized {type(model).__name__} to {quant} in {time.perf_counter() - start:.1f}s: "
+                 f"{before / 2**30:.2f} -> {_nbytes(model) / 2**30:.2f} GiB")
+    return model
+
+
+def load_quantized(model, weights_path, quant_map_path):
+    """Load a quantized checkpoint (weights + quanto quantization map) into `model`, built on the meta device."""
+    with open(quant_map_path) as f:
+        quantization_map = json.load(f)
+    # mmapped, so the host only holds the copy requantize makes
+    requantize(model, mmap_safetensors(weights_path), quantization_map, device='cpu')
+    return model
+
+
+def compare_linears(reference, quantized, tokens=256, repeat=5):
+    """
+    {group: (layers, max relative error, reference seconds, quantized seconds)}
+    for the linears of `reference` that `quantized` (a quantized copy)
+    replaced, run on random inputs. Groups strip the block index.
+    """
+    quantized_modules = dict(quantized.named_modules())
+    report = {}
+    for name, layer in reference.named_modules():
+        qlayer = quantized_modules.get(name)
+        if not isinstance(layer, nn.Linear) or type(qlayer) is type(layer):
+            continue
+        x = torch.randn(tokens, layer.in_features, dtype=layer.weight.dtype)
+        timings = []
+        for module in (layer, qlayer):
+            module(x)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                y = module(x)
+            timings.append((time.perf_counter() - start) / repeat)
+            if module is layer:
+                ref = y.float()
+        error = float((y.float() - ref).norm() / ref.norm())
+        group = re.sub(r'\.\d+\.', '.*.', name)
+        layers, worst, ref_s, q_s = report.get(group, (0, 0.0, 0.0, 0.0))
+        report[group] = (layers + 1, max(worst, error), ref_s + timings[0], q_s + timings[1])
+    return report
+
+
+def _print_report(title, reference, quantized, outputs=None):
+    print(f"\n{title}: {_nbytes(reference) / 2**20:.1f} -> {_nbytes(quantized) / 2**20:.1f} MiB")
+    if outputs is not None:
+        ref, out = (o.float() for o in outputs)
+        print(f"  end-to-end relative error {float((out - ref).norm() / ref.norm()):.4f}, "
+              f"cosine {float(nn.functional.cosine_similarity(out.flatten(), ref.flatten(), dim=0)):.5f}")
+    print(f"  {'linears':40} {'n':>3} {'max rel err':>11} {'ref ms':>8} {'quant ms':>8}")
+    for group, (layers, error, ref_s, q_s) in sorted(compare_linears(reference, quantized).items()):
+        print(f"  {group:40} {layers:3d} {error:11.4f} {ref_s * 1e3:8.2f} {q_s * 1e3:8.2f}")
+
+
+if __name__ == '__main__':
+    # accuracy / speed report on CPU with reduced-size models:
+    #   python -m wan.utils.quantize [int8|fp8] [dtype]
+    import sys
+    from ..modules.t5 import T5Encoder
+    from ..modules.multitalk_model import WanModel
+
+    quant = sys.argv[1] if len(sys.argv) > 1 else 'int8'
+    dtype = getattr(torch, sys.argv[2] if len(sys.argv) > 2 else 'bfloat16')
+    torch.manual_seed(0)
+
+    t5 = T5Encoder(vocab=1024, dim=512, dim_attn=512, dim_ffn=1280, num_heads=8, num_layers=4,
+                   num_buckets=32, shared_pos=False, dropout=0.0).to(dtype).eval().requires_grad_(False)
+    t5_q = quantize_model(copy.deepcopy(t5), quant, T5_KEEP)
+    ids = torch.randint(0, 1024, (2, 64))
+    mask = torch.ones_like(ids)
+    _print_report(f"T5 encoder ({quant}, policy {T5_KEEP})", t5, t5_q, (t5(ids, mask), t5_q(ids, mask)))
+
+    # the DiT's attention needs flash-attn on a GPU, so only its linears are compared
+    dit = WanModel(dim=512, ffn_dim=1280, freq_dim=64, text_dim=512, num_heads=8, num_layers=4,
+                   output_dim=256, intermediate_dim=128).to(dtype).eval().requires_grad_(False)
+    dit_q = quantize_model(copy.deepcopy(dit), quant, DIT_KEEP)
+    _print_report(f"DiT ({quant}, policy {DIT_KEEP})", dit, dit_q)
@@ -0,0 +1,105 @@
+import os
+import math
+import logging
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+
+class HLSSegmentWriter:
+    """
+    Progressive output of `InfiniteTalkPipeline.generate_infinitetalk`: every
+    finished clip becomes one MPEG-TS segment of an HLS event playlist, muxed
+    with the matching slice of the audio track, so playback can start after
+    the first clip instead of after the whole video.
+
+    Frames are copied to the host in `add_frames` and encoded by a background
+    thread, so the DiT does not wait for ffmpeg. `on_segment(index, path,
+    start, duration)` is called from that thread after each segment and the
+    playlist are on disk.
+    """
+
+    def __init__(self, out_dir, audio_path, fps=25, crf=18, playlist_name='index.m3u8', on_segment=None):
+        self.out_dir = out_dir
+        self.audio_path = audio_path
+        self.fps = fps
+        self.crf = crf
+        self.playlist_path = os.path.join(out_dir, playlist_name)
+        self.on_segment = on_segment
+        # frames handed to `add_frames` so far, i.e. the start of the next segment
+        self.frames_written = 0
+        # value of `frames_written` when the current generation item started
+        self.item_start = 0
+        self.segments = []
+        self._pending = []
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='hls-segment')
+        os.makedirs(out_dir, exist_ok=True)
+
+    def mark_item_start(self):
+        """Start the next item of a multi-item job, e.g. the next scene."""
+        self.item_start = self.frames_written
+
+    def add_frames(self, frames):
+        """Queue frames `[C, T, H, W]` in [-1, 1] as the next segment."""
+        num_frames = frames.shape[1]
+        if num_frames == 0:
+            return
+        video = ((frames.float() + 1) / 2).clamp(0, 1).mul(255).to(torch.uint8)
+        video = video.permute(1, 2, 3, 0).contiguous().cpu().numpy()
+        index = len(self._pending)
+        start = self.frames_written / self.fps
+        self.frames_written += num_frames
+        self._pending.append(self._executor.submit(self._write_segment, index, video, start))
+
+    def _write_segment(self, index, video, start):
+        num_frames, height, width, _ = video.shape
+        duration = num_frames / self.fps
+        name = f'segment_{index:05d}.ts'
+        path = os.path.join(self.out_dir, name)
+        cmd = [
+            'ffmpeg', '-y', '-v', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{width}x{height}', '-r', str(self.fps), '-i', 'pipe:0',
+            '-ss', f'{start:.3f}', '-t', f'{duration:.3f}', '-i', self.audio_path,
+            '-map', '0:v', '-map', '1:a',
+            '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-crf', str(self.crf),
+            '-c:a', 'aac',
+            # keep timestamps continuous across independently encoded segments
+            '-output_ts_offset', f'{start:.3f}',
+            '-f', 'mpegts', path + '.tmp',
+        ]
+        subprocess.run(cmd, input=video.tobytes(), check=True)
+        os.replace(path + '.tmp', path)
+        self.segments.append((name, duration))
+        self._write_playlist(ended=False)
+        logging.info(f"Wrote segment {name} ({start:.2f}s - {start + duration:.2f}s)")
+        if self.on_segment is not None:
+            self.on_segment(index, path, start, duration)
+
+    def _write_playlist(self, ended):
+        target = max((math.ceil(duration) for _, duration in self.segments), default=1)
+        lines = [
+            '#EXTM3U',
+            '#EXT-X-VERSION:3',
+            f'#EXT-X-TARGETDURATION:{target}',
+            '#EXT-X-MEDIA-SEQUENCE:0',
+            '#EXT-X-PLAYLIST-TYPE:EVENT',
+        ]
+        for name, duration in self.segments:
+            lines += [f'#EXTINF:{duration:.3f},', name]
+        if ended:
+            lines.append('#EXT-X-ENDLIST')
+        tmp_path = self.playlist_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, self.playlist_path)
+
+    def finish(self):
+        """Wait for queued segments, close the playlist and return its path."""
+        try:
+            for future in self._pending:
+                future.result()
+        finally:
+            self._executor.shutdown(wait=True)
+        self._write_playlist(ended=True)
+        return self.playlist_path
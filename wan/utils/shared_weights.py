@@ -0,0 +1,141 @@
+import os
+import json
+import fcntl
+import hashlib
+import logging
+
+import torch
+
+from .weight_loader import mmap_safetensors, assign_tensor, save_safetensors
+
+DEFAULT_ROOT = '/dev/shm/infinitetalk-weights'
+
+
+def store_key(name, *sources, **settings):
+    """
+    Entry name for weights built from `sources` (files, identified by path,
+    size and mtime) with `settings`, e.g. the dtype.
+    """
+    described = []
+    for path in sources:
+        st = os.stat(path)
+        described.append([os.path.abspath(path), st.st_size, st.st_mtime_ns])
+    payload = json.dumps([described, settings], sort_keys=True, default=str)
+    return f"{name}-{hashlib.sha256(payload.encode()).hexdigest()[:16]}"
+
+
+def memory_usage():
+    """
+    Rss / Pss / shared and private bytes of this process. Pss splits shared
+    pages between the processes mapping them, so the Pss of all workers sums
+    to what the node actually spends on them.
+    """
+    usage = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) == 3 and fields[2] == 'kB':
+                usage[fields[0].rstrip(':')] = int(fields[1]) * 1024
+    return {
+        'rss': usage.get('Rss', 0),
+        'pss': usage.get('Pss', 0),
+        'shared': usage.get('Shared_Clean', 0) + usage.get('Shared_Dirty', 0),
+        'private': usage.get('Private_Clean', 0) + usage.get('Private_Dirty', 0),
+    }
+
+
+class SharedWeightStore:
+    """
+    Node-local host weights shared by all worker processes, e.g. one per GPU.
+
+    Every entry is a safetensors file on tmpfs, written once by whichever
+    worker takes its lock first; all workers then mmap it, so its pages exist
+    once per node however many processes map them. The mappings are private
+    copy-on-write: a worker that writes a weight on the host (a LoRA merge)
+    only copies the pages it touches.
+
+    Weights moved to the GPU and back with `src.utils.onload` / `offload`
+    (including the vram_management wrappers) return to the shared pages
+    instead of fresh private copies.
+    """
+
+    def __init__(self, root=DEFAULT_ROOT):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.root, f'{key}.safetensors')
+
+    def has(self, key):
+        return os.path.exists(self.path(key))
+
+    def tensors(self, key, build):
+        """{name: tensor} of entry `key`, calling `build()` for a state dict if it does not exist yet."""
+        path = self.path(key)
+        if not os.path.exists(path):
+            with open(os.path.join(self.root, f'{key}.lock'), 'w') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                if not os.path.exists(path):
+                    logging.info(f"Writing shared weights {path}")
+                    save_safetensors(build(), path)
+        return mmap_safetensors(path)
+
+    def share(self, key, module):
+        """
+        Replace the parameters and buffers of `module` (real or on the meta
+        device) with views of entry `key`, creating it from `module` first if
+        needed. The private copies are freed once nothing else holds them.
+        """
+        for name, tensor in self.tensors(key, module.state_dict).items():
+            assign_tensor(module, name, tensor)
+        return module
+
+
+def _check_worker(root, size_mb, shared, barrier, results):
+    torch.manual_seed(0)
+    with torch.device('meta'):
+        model = torch.nn.Sequential(*[torch.nn.Linear(1024, 1024) for _ in range(size_mb // 4)])
+    if shared:
+        store = SharedWeightStore(root)
+        key = 'check'
+        if not store.has(key):
+            model.to_empty(device='cpu')
+            for p in model.parameters():
+                p.data.normal_()
+        store.share(key, model)
+    else:
+        model.to_empty(device='cpu')
+        for p in model.parameters():
+            p.data.normal_()
+    # touch every page, as a forward pass would
+    checksum = sum(float(p.sum()) for p in model.parameters())
+    barrier.wait()
+    results.put((memory_usage(), checksum))
+    barrier.wait()
+
+
+if __name__ == '__main__':
+    # local check with CPU processes: python -m wan.utils.shared_weights [workers] [MiB]
+    import sys
+    import tempfile
+    import multiprocessing as mp
+
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    size_mb = int(sys.argv[2]) if len(sys.argv) > 2 else 256
+    ctx = mp.get_context('spawn')
+    with tempfile.TemporaryDirectory(dir='/dev/shm' if os.path.isdir('/dev/shm') else None) as root:
+        for shared in (False, True):
+            barrier, results = ctx.Barrier(workers), ctx.Queue()
+            procs = [ctx.Process(target=_check_worker, args=(root, size_mb, shared, barrier, results)) for _ in range(workers)]
+            for p in procs:
+                p.start()
+            usage = [results.get() for _ in procs]
+            for p in procs:
+                p.join()
+            checksums = {round(checksum, 1) for _, checksum in usage}
+            rss = sum(u['rss'] for u, _ in usage) / 2**20
+            pss = sum(u['pss'] for u, _ in usage) / 2**20
+            print(f"{'shared ' if shared else 'private'}: {workers} workers x {size_mb} MiB of weights, "
+                  f"sum RSS {rss:.0f} MiB, sum PSS {pss:.0f} MiB")
+            if shared:
+                assert len(checksums) == 1, checksums
@@ -0,0 +1,39 @@
+import time
+from contextlib import contextmanager
+
+import torch
+
+# callables `fn(stage, seconds)`, e.g. a metrics exporter
+_listeners = []
+
+
+def add_stage_listener(fn):
+    _listeners.append(fn)
+
+
+def stage_clock():
+    """
+    `time.perf_counter()` after all queued GPU work has finished, so timings
+    are attributed to the stage that launched the kernels. Only synchronises
+    while someone is listening.
+    """
+    if _listeners and torch.cuda.is_available() and torch.cuda.is_initialized():
+        torch.cuda.synchronize()
+    return time.perf_counter()
+
+
+def record_stage(stage, seconds):
+    for fn in _listeners:
+        fn(stage, seconds)
+
+
+@contextmanager
+def stage_timer(stage):
+    if not _listeners:
+        yield
+        return
+    start = stage_clock()
+    try:
+        yield
+    finally:
+        record_stage(stage, stage_clock() - start)
@@ -0,0 +1,152 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from safetensors.torch import load_file, save_file
+
+
+class DiskBudget:
+    """
+    Keeps the `suffix` files in `root` under `max_bytes` in total, removing
+    the least recently used first by mtime (which readers refresh with
+    `touch`), as `LocalDiskBackend` does; the newest file is always kept.
+    Several processes may share `root`: each adds its own writes to a running
+    total and rescans the directory once that exceeds the budget.
+    """
+
+    def __init__(self, root, max_bytes, suffix='.safetensors'):
+        self.root = root
+        self.max_bytes = int(max_bytes)
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        with self._lock:
+            self._evict()
+
+    def _scan(self):
+        found = []
+        for entry in os.scandir(self.root):
+            if not entry.name.endswith(self.suffix):
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:  # evicted by another process meanwhile
+                continue
+            found.append((st.st_mtime, entry.path, st.st_size))
+        return sorted(found)
+
+    @staticmethod
+    def touch(path):
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+    def add(self, path):
+        """Account for the new file `path`, evicting old ones if over budget."""
+        with self._lock:
+            self.total_bytes += os.path.getsize(path)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        found = self._scan()
+        self.total_bytes = sum(size for _, _, size in found)
+        for _, path, size in found[:-1]:
+            if self.total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.total_bytes -= size
+
+
+class TensorCache:
+    """
+    Encoder outputs, as {name: CPU tensor} per entry, kept in memory (least
+    recently used evicted past `max_entries`) and in `cache_dir` if given, so
+    that every process sharing the directory computes an entry once. With
+    `max_bytes` the directory is bounded too, see `DiskBudget`.
+
+    Keys hash the given parts together with `encoder`, a dict of whatever
+    changes the output (checkpoints, dtypes, ...), so the cache can be
+    queried without building the encoder. Pinned entries are never evicted
+    from memory.
+    """
+
+    def __init__(self, cache_dir=None, encoder=None, max_entries=64, max_bytes=None):
+        self.cache_dir = cache_dir
+        self.encoder = json.dumps(encoder or {}, sort_keys=True, default=str)
+        self.max_entries = max_entries
+        self.hits = self.misses = 0
+        self._memory = OrderedDict()
+        self._pinned = set()
+        self._lock = threading.Lock()
+        self.budget = None
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            if max_bytes is not None:
+                self.budget = DiskBudget(cache_dir, max_bytes)
+
+    def key(self, *parts):
+        h = hashlib.sha256(self.encoder.encode())
+        for part in parts:
+            h.update(b'\0' + (part if isinstance(part, bytes) else str(part).encode()))
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.safetensors")
+
+    def get(self, key):
+        """The cached {name: tensor} of `key`, or None."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                if self.budget is not None:
+                    self.budget.touch(self._path(key))
+                return self._memory[key]
+        if self.cache_dir is not None and os.path.exists(self._path(key)):
+            try:
+                tensors = load_file(self._path(key))
+            except Exception as e:  # a file cut short by a crash, compute it again
+                logging.warning(f"Ignoring unreadable cache entry {self._path(key)}: {e}")
+            else:
+                self._remember(key, tensors)
+                with self._lock:
+                    self.hits += 1
+                if self.budget is not None:
+                    self.budget.touch(self._path(key))
+                return tensors
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, tensors, pin=False):
+        tensors = {name: t.detach().cpu().contiguous() for name, t in tensors.items()}
+        if self.cache_dir is not None and not os.path.exists(self._path(key)):
+            # other workers may write the same entry at the same time
+            tmp = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+            save_file(tensors, tmp)
+            os.replace(tmp, self._path(key))
+            if self.budget is not None:
+                self.budget.add(self._path(key))
+        self._remember(key, tensors, pin)
+        return tensors
+
+    def pin(self, key):
+        with self._lock:
+            self._pinned.add(key)
+
+    def _remember(self, key, tensors, pin=False):
+        with self._lock:
+            if pin:
+                self._pinned.add(key)
+            self._memory[key] = tensors
+            self._memory.move_to_end(key)
+            evictable = [k for k in self._memory if k not in self._pinned]
+            for k in evictable[:max(0, len(evictable) - self.max_entries)]:
+                del self._memory[k]
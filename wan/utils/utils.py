@@ -9,10 +9,8 @@ import imageio
 import torch
 import torchvision
 from PIL import Image
-import librosa
 import soundfile as sf
 import subprocess
-from decord import VideoReader, cpu
 import gc
 
 __all__ = ['cache_video', 'cache_image', 'str2bool']
@@ -139,6 +137,7 @@ def is_video(path):
 
 def extract_specific_frames(video_path, frame_id):
     if is_video(video_path):
+        from decord import VideoReader, cpu
         vr = VideoReader(video_path, ctx=cpu(0))
         if frame_id < vr._num_frame:
             frame = vr[frame_id].asnumpy()  # RGB
@@ -164,6 +163,7 @@ def get_video_codec(video_path):
 
 
 def split_wav_librosa(wav_path, segments, save_dir):
+    import librosa
     y, sr = librosa.load(wav_path, sr=None)
     filename = wav_path.split('/')[-1].split('.')[0]
     save_list = []
@@ -0,0 +1,172 @@
+import os
+import json
+import mmap
+import time
+import struct
+import logging
+import resource
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+import torch.nn as nn
+from safetensors.torch import save_file
+
+_SAFETENSORS_DTYPES = {
+    'F64': torch.float64,
+    'F32': torch.float32,
+    'F16': torch.float16,
+    'BF16': torch.bfloat16,
+    'I64': torch.int64,
+    'I32': torch.int32,
+    'I16': torch.int16,
+    'I8': torch.int8,
+    'U8': torch.uint8,
+    'BOOL': torch.bool,
+    'F8_E4M3': torch.float8_e4m3fn,
+    'F8_E5M2': torch.float8_e5m2,
+}
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process so far."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _current_rss_bytes():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def mmap_safetensors(path):
+    """
+    {name: tensor} viewing a mmapped safetensors file without reading it.
+
+    The mapping is private copy-on-write, so the tensors are backed by the
+    shared page cache until someone writes to them, and pages are only faulted
+    in when a tensor is touched.
+    """
+    with open(path, 'rb') as f:
+        header_len, = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(header_len))
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    base = 8 + header_len
+    tensors = {}
+    for name, info in header.items():
+        if name == '__metadata__':
+            continue
+        dtype = _SAFETENSORS_DTYPES[info['dtype']]
+        begin, end = info['data_offsets']
+        if begin == end:
+            tensors[name] = torch.empty(info['shape'], dtype=dtype)
+            continue
+        # the tensor keeps `buf` alive
+        flat = torch.frombuffer(buf, dtype=torch.uint8, count=end - begin, offset=base + begin)
+        tensors[name] = flat.view(dtype).view(info['shape'])
+    return tensors
+
+
+def save_safetensors(state_dict, path):
+    """
+    Write `state_dict` atomically, through a temp file private to this
+    process. Tied tensors, which safetensors refuses, are stored once per name.
+    """
+    tensors, seen = {}, set()
+    for name, tensor in state_dict.items():
+        tensor = tensor.detach().cpu().contiguous()
+        if tensor.data_ptr() in seen and tensor.numel():
+            tensor = tensor.clone()
+        seen.add(tensor.data_ptr())
+        tensors[name] = tensor
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    save_file(tensors, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def safetensors_path(path):
+    """Where tools/convert_to_safetensors.py puts the conversion of `path`."""
+    return os.path.splitext(path)[0] + '.safetensors'
+
+
+def load_checkpoint(path):
+    """
+    State dict of a checkpoint. A .pth file is read from its converted
+    .safetensors sibling (mmapped, no unpickling) when there is one.
+    """
+    converted = safetensors_path(path)
+    if os.path.exists(converted):
+        return mmap_safetensors(converted)
+    logging.warning(f"{path} is not converted to safetensors, unpickling it; see tools/convert_to_safetensors.py")
+    return torch.load(path, map_location='cpu')
+
+
+def assign_tensor(model, name, tensor):
+    """Make `tensor` the parameter or buffer `name` of `model`, without copying."""
+    module_name, _, attr = name.rpartition('.')
+    module = model.get_submodule(module_name)
+    if attr in module._parameters:
+        module._parameters[attr] = nn.Parameter(tensor, requires_grad=False)
+    elif attr in module._buffers:
+        module._buffers[attr] = tensor
+    else:
+        return False
+    return True
+
+
+def load_safetensors_into(model, weight_files, dtype=None, device='cpu', num_workers=8, strict=True):
+    """
+    Load `weight_files` into `model`, typically built under `torch.device('meta')`,
+    by replacing each parameter with the mmapped tensor (`assign` semantics)
+    instead of copying into preallocated storage. Nothing is merged into an
+    intermediate state dict, so host RAM peaks at roughly one model copy, or
+    less when the checkpoint dtype already matches and the weights stay
+    mmapped. Floating point tensors are cast to `dtype` if given. Files are
+    loaded in parallel, later files win on duplicate keys as with
+    `dict.update`.
+
+    Returns {'tensors', 'bytes', 'seconds', 'peak_rss', 'rss'}.
+    """
+    start = time.perf_counter()
+    lock = threading.Lock()
+    owner = {}
+    unexpected = []
+    expected = {name for name, _ in model.named_parameters()} | {name for name, _ in model.named_buffers()}
+
+    def load(index, path):
+        nbytes = 0
+        for name, tensor in mmap_safetensors(path).items():
+            if name not in expected:
+                unexpected.append(name)
+                continue
+            if dtype is not None and tensor.is_floating_point():
+                tensor = tensor.to(dtype)
+            tensor = tensor.to(device)
+            with lock:
+                if owner.get(name, -1) > index:
+                    continue
+                owner[name] = index
+                assign_tensor(model, name, tensor)
+            nbytes += tensor.numel() * tensor.element_size()
+        return nbytes
+
+    with ThreadPoolExecutor(max_workers=max(1, min(num_workers, len(weight_files))),
+                            thread_name_prefix='weight-load') as executor:
+        total_bytes = sum(executor.map(load, range(len(weight_files)), weight_files))
+
+    missing = sorted(expected - owner.keys())
+    if strict and (missing or unexpected):
+        raise RuntimeError(
+            f"Error loading {type(model).__name__}: missing keys {missing[:10]}"
+            f"{'...' if len(missing) > 10 else ''}, unexpected keys {sorted(unexpected)[:10]}"
+            f"{'...' if len(unexpected) > 10 else ''}")
+    stats = {
+        'tensors': len(owner),
+        'bytes': total_bytes,
+        'seconds': time.perf_counter() - start,
+        'peak_rss': peak_rss_bytes(),
+        'rss': _current_rss_bytes(),
+    }
+    logging.info(
+        f"Loaded {stats['tensors']} tensors ({stats['bytes'] / 2**30:.2f} GiB) from {len(weight_files)} files "
+        f"in {stats['seconds']:.1f}s, RSS {stats['rss'] / 2**30:.2f} GiB, peak RSS {stats['peak_rss'] / 2**30:.2f} GiB")
+    return stats
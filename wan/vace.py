@@ -27,6 +27,7 @@ from .text2video import (
     T5EncoderModel,
     WanT2V,
     WanVAE,
+    build_component,
     get_sampling_sigmas,
     retrieve_timesteps,
     shard_model,
@@ -46,6 +47,7 @@ class WanVace(WanT2V):
         dit_fsdp=False,
         use_usp=False,
         t5_cpu=False,
+        registry=None,
     ):
         r"""
         Initializes the Wan text-to-video generation model components.
@@ -67,6 +69,9 @@ class WanVace(WanT2V):
                 Enable distribution strategy of USP.
             t5_cpu (`bool`, *optional*, defaults to False):
                 Whether to place T5 model on CPU. Only works without t5_fsdp.
+            registry (`ComponentRegistry`, *optional*, defaults to None):
+                Shares the T5 and VAE with other pipelines built from the same
+                checkpoints, see `wan.utils.component_registry`.
         """
         self.device = torch.device(f"cuda:{device_id}")
         self.config = config
@@ -77,7 +82,8 @@ class WanVace(WanT2V):
         self.param_dtype = config.param_dtype
 
         shard_fn = partial(shard_model, device_id=device_id)
-        self.text_encoder = T5EncoderModel(
+        self.text_encoder = build_component(
+            registry, T5EncoderModel, self,
             text_len=config.text_len,
             dtype=config.t5_dtype,
             device=torch.device('cpu'),
@@ -87,7 +93,8 @@ class WanVace(WanT2V):
 
         self.vae_stride = config.vae_stride
         self.patch_size = config.patch_size
-        self.vae = WanVAE(
+        self.vae = build_component(
+            registry, WanVAE, self,
             vae_pth=os.path.join(checkpoint_dir, config.vae_checkpoint),
             device=self.device)
 
@@ -3,6 +3,8 @@ import torch
 from safetensors import safe_open
 from loguru import logger
 import gc
+import time
+from collections import OrderedDict
 from functools import lru_cache
 from tqdm import tqdm
 
@@ -12,10 +14,29 @@ def GET_DTYPE():
     return RUNNING_FLAG
 
 class WanLoraWrapper:
-    def __init__(self, wan_model):
+    """
+    `apply_lora` merges a LoRA into the weights for good. `set_loras` instead
+    switches the active LoRA set of a live model, keeping the base value of
+    every weight it touches, so un-applying is an exact restore rather than
+    subtracting the delta again (which is lossy in bf16). Host weights are
+    never written: the merged weight is a new tensor and the base one is kept
+    by reference, so mmapped or shared base pages stay shared and restoring is
+    a rebind. Weights on the GPU are merged in place after a copy of their base
+    value to the host. Base values are dropped once the base set is restored.
+    The low-rank factors of the last `max_cached` LoRAs stay on the device.
+    """
+
+    def __init__(self, wan_model, max_cached=4):
         self.model = wan_model
         self.lora_metadata = {}
         # self.override_dict = {}  # On CPU
+        self.max_cached = max_cached
+        # lora path -> {param name: (lora_A, lora_B) or diff}
+        self._factors = OrderedDict()
+        # param name -> base weight on the host, while a LoRA set is merged
+        self._base_weights = {}
+        # [(lora path, alpha)] currently merged by `set_loras`
+        self.active_loras = []
 
     def load_lora(self, lora_path, lora_name=None):
         if lora_name is None:
@@ -59,8 +80,7 @@ class WanLoraWrapper:
                 current = getattr(current, part)
         return current
 
-    @torch.no_grad()
-    def _apply_lora_weights(self, lora_weights, alpha, device):
+    def _lora_pairs(self, lora_weights):
         lora_pairs = {}
         prefix = "diffusion_model."
 
@@ -76,6 +96,11 @@ class WanLoraWrapper:
             elif key.endswith("diff") and key.startswith(prefix):
                 base_name = key[len(prefix) :].replace("diff", "weight")
                 lora_pairs[base_name] = (key)
+        return lora_pairs
+
+    @torch.no_grad()
+    def _apply_lora_weights(self, lora_weights, alpha, device):
+        lora_pairs = self._lora_pairs(lora_weights)
 
         applied_count = 0
         for name in tqdm(lora_pairs.keys(), desc="Loading LoRA weights"):
@@ -106,6 +131,81 @@ class WanLoraWrapper:
             )
 
 
+    def _get_factors(self, lora_path, param_dtype, device):
+        if lora_path in self._factors:
+            self._factors.move_to_end(lora_path)
+            return self._factors[lora_path]
+        lora_weights = self._load_lora_file(lora_path, param_dtype)
+        factors = {}
+        for name, keys in self._lora_pairs(lora_weights).items():
+            if isinstance(keys, tuple):
+                factors[name] = tuple(lora_weights[key].to(device) for key in keys)
+            else:
+                factors[name] = lora_weights[keys].to(device)
+        if not factors:
+            raise ValueError(f"No LoRA weights found in {lora_path}")
+        self._factors[lora_path] = factors
+        while len(self._factors) > self.max_cached:
+            self._factors.popitem(last=False)
+        return factors
+
+    @torch.no_grad()
+    def restore_base_weights(self):
+        """Undo everything merged by `set_loras`, bit-exact."""
+        for name, base in self._base_weights.items():
+            param = self.get_parameter_by_name(self.model, name)
+            if param.device == base.device:
+                param.data = base
+            else:
+                param.copy_(base)
+        self._base_weights = {}
+        self.active_loras = []
+
+    def _merge(self, name, factor, alpha):
+        param = self.get_parameter_by_name(self.model, name)
+        on_host = param.device.type == 'cpu'
+        if name not in self._base_weights:
+            self._base_weights[name] = param.data if on_host else param.detach().to('cpu', copy=True)
+        if isinstance(factor, tuple):
+            lora_A, lora_B = factor
+            # same arithmetic as `_apply_lora_weights`
+            dtype = torch.float32 if lora_A.device.type == 'cpu' else param.dtype
+            delta = torch.matmul(lora_B.to(dtype), lora_A.to(dtype)) * alpha
+        else:
+            delta = factor * alpha
+        delta = delta.to(param.device, param.dtype)
+        if on_host:
+            param.data = param.data + delta
+        else:
+            param.add_(delta)
+
+    @torch.no_grad()
+    def set_loras(self, loras, param_dtype=torch.bfloat16, device='cpu'):
+        """
+        Make `loras`, a list of (path, alpha), the merged LoRA set. Returns the
+        seconds spent, 0 if the set is already active.
+        """
+        loras = [(path, float(alpha)) for path, alpha in loras]
+        if loras == self.active_loras:
+            return 0.0
+        start = time.perf_counter()
+        factors = [(self._get_factors(path, param_dtype, device), alpha) for path, alpha in loras]
+        # rebound host weights no longer match the tensors `onload` kept for `offload`
+        self.model.__dict__.pop('_host_copy', None)
+        self.restore_base_weights()
+        try:
+            for lora_factors, alpha in factors:
+                for name, factor in lora_factors.items():
+                    self._merge(name, factor, alpha)
+        except Exception:
+            # never leave a half-applied set behind
+            self.restore_base_weights()
+            raise
+        self.active_loras = loras
+        seconds = time.perf_counter() - start
+        logger.info(f"Switched LoRAs to {[os.path.basename(path) for path, _ in loras]} in {seconds:.2f}s")
+        return seconds
+
     def list_loaded_loras(self):
         return list(self.lora_metadata.keys())
 